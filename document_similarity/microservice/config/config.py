@@ -13,6 +13,25 @@ class Config(object):
     CORS = {
         'origins': os.getenv('CORS_ORIGINS').split(',') if os.getenv('CORS_ORIGINS') else None
     }
+    # the pool of the database connections of each worker process (0 disables the pool)
+    DATABASE_POOL = {
+        'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 30)),
+        'statement_timeout': int(os.getenv('DATABASE_STATEMENT_TIMEOUT', 0)),
+        'health_check_interval': float(os.getenv('DATABASE_POOL_HEALTH_CHECK_INTERVAL', 30))
+    }
+    # the number of most similar documents stored per document (0 stores all similarities)
+    SIMILARITY_TOP_K = int(os.getenv('SIMILARITY_TOP_K', 0))
+    # the format of the document embeddings: 'array', 'float32' or 'float16'
+    EMBEDDING_ENCODING = os.getenv('EMBEDDING_ENCODING', 'array')
+    # the background workers processing the queued similarity updates
+    SIMILARITY_QUEUE = {
+        'workers': int(os.getenv('SIMILARITY_QUEUE_WORKERS', 1)),
+        'batch_size': int(os.getenv('SIMILARITY_QUEUE_BATCH_SIZE', 32)),
+        'poll_interval': float(os.getenv('SIMILARITY_QUEUE_POLL_INTERVAL', 1)),
+        'job_timeout': int(os.getenv('SIMILARITY_QUEUE_JOB_TIMEOUT', 600))
+    }
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -28,6 +47,8 @@ class ProductionConfig(Config):
 
     # Url to text embedding service
     TEXT_EMBEDDING_URL=os.getenv('PROD_TEXT_EMBEDDING_URL')
+    # Url to the batch route of the text embedding service (optional)
+    TEXT_EMBEDDING_BATCH_URL=os.getenv('PROD_TEXT_EMBEDDING_BATCH_URL')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -44,6 +65,8 @@ class DevelopmentConfig(Config):
 
     # Url to text embedding service
     TEXT_EMBEDDING_URL=os.getenv('DEV_TEXT_EMBEDDING_URL')
+    # Url to the batch route of the text embedding service (optional)
+    TEXT_EMBEDDING_BATCH_URL=os.getenv('DEV_TEXT_EMBEDDING_BATCH_URL')
 
 class TestingConfig(Config):
     """Testing configuration"""
@@ -60,3 +83,5 @@ class TestingConfig(Config):
 
     # Url to text embedding service
     TEXT_EMBEDDING_URL=os.getenv('TEST_TEXT_EMBEDDING_URL')
+    # Url to the batch route of the text embedding service (optional)
+    TEXT_EMBEDDING_BATCH_URL=os.getenv('TEST_TEXT_EMBEDDING_BATCH_URL')
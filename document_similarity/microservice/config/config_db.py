@@ -2,29 +2,85 @@
 # Contains methods for establishing and
 # closing connection with the database
 
+import os
+import threading
+
 from flask import current_app, g
 
 # ! modify for different database
 # import postgresql library
 from ..library.postgresql import PostgresQL
+from ..library.connection_pool import ConnectionPool
+
+# the connection pool of the worker process
+pool = None
+pool_lock = threading.Lock()
+
+
+def create_db():
+    """Establishes a new connection to the database
+    Returns:
+        obj: The database object.
+    """
+
+    # ! modify for different database
+    # initialize db object
+    db = PostgresQL(embedding_encoding=current_app.config['EMBEDDING_ENCODING'])
+    # get database and password for establishing the conncetion
+    database = current_app.config['DATABASE_NAME']
+    user = current_app.config['DATABASE_USER']
+    password = current_app.config['DATABASE_PASSWORD']
+    # connect to the database
+    db.connect(database, user=user, password=password)
+    return db
+
+
+def get_pool():
+    """Gets or creates the connection pool of the worker process
+    Returns:
+        obj: The connection pool or None if the pool is disabled.
+    """
+
+    global pool
+    settings = current_app.config['DATABASE_POOL']
+    if settings['max_size'] <= 0:
+        return None
+
+    with pool_lock:
+        # the connections are not shared with the forked worker processes
+        if pool is None or pool.pid() != os.getpid():
+            pool = ConnectionPool(
+                database=current_app.config['DATABASE_NAME'],
+                user=current_app.config['DATABASE_USER'],
+                password=current_app.config['DATABASE_PASSWORD'],
+                **settings
+            )
+    return pool
 
 
 def get_db():
     """Gets or establishes the connection to the database
+
+    The connection is borrowed from the connection pool and returned to it at the
+    end of the request. The long-lived connections (listeners, background workers)
+    are established with create_db.
+
     Returns:
         obj: The database object.
     """
 
     if 'db' not in g:
-        # ! modify for different database
-        # initialize db object
-        g.db = PostgresQL()
-        # get database and password for establishing the conncetion
-        database = current_app.config['DATABASE_NAME']
-        user = current_app.config['DATABASE_USER']
-        password = current_app.config['DATABASE_PASSWORD']
-        # connect to the database
-        g.db.connect(database, user=user, password=password)
+        try:
+            connection_pool = get_pool()
+        except Exception as e:
+            current_app.logger.warning("Could not create the connection pool. " + str(e))
+            connection_pool = None
+
+        if connection_pool is None:
+            g.db = create_db()
+        else:
+            g.db = PostgresQL(embedding_encoding=current_app.config['EMBEDDING_ENCODING'])
+            g.db.connect_pool(connection_pool)
 
     # return the database connection
     return g.db
@@ -0,0 +1,178 @@
+# Connection Pool
+# A thread safe pool of postgres connections shared by all
+# requests of the worker process. The connections are checked
+# before they are handed out and the pool records how long
+# the requests wait for a free connection.
+#
+# The document similarity and the entrypoint service are deployed
+# separately and each ship a copy of this module; a change must be
+# made in both copies.
+
+import os
+import time
+import threading
+
+import psycopg2
+from psycopg2 import pool
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of the database connections of the worker process
+
+    Args:
+        database (str): The database name.
+        user (str): The postgresql user.
+        password (str): The password of the user.
+        host (str): The host address. (Default "127.0.0.1")
+        port (str): The port number. (Default "5432")
+        min_size (int): The number of connections opened in advance. (Default = 1)
+        max_size (int): The maximum number of open connections. (Default = 10)
+        timeout (float): The number of seconds a request waits for a free connection. (Default = 30)
+        statement_timeout (int): The number of milliseconds after which a statement is
+            cancelled, 0 disables the timeout. (Default = 0)
+        health_check_interval (float): The number of seconds a connection can be idle
+            before it is checked with a query. (Default = 30)
+
+    """
+
+    def __init__(self, database, user, password, host="127.0.0.1", port="5432",
+                 min_size=1, max_size=10, timeout=30, statement_timeout=0, health_check_interval=30):
+        options = "-c statement_timeout={}".format(int(statement_timeout)) if statement_timeout else None
+        self.__pool = pool.ThreadedConnectionPool(
+            min(min_size, max_size), max_size,
+            user=user,
+            password=password,
+            host=host,
+            port=port,
+            database=database,
+            options=options
+        )
+        self.__max_size = max_size
+        self.__timeout = timeout
+        self.__health_check_interval = health_check_interval
+        # the requests wait for a free connection instead of failing
+        self.__available = threading.BoundedSemaphore(max_size)
+        self.__lock = threading.Lock()
+        # the time when the connections were returned to the pool
+        self.__returned = {}
+        # the pool statistics
+        self.__in_use = 0
+        self.__checkouts = 0
+        self.__timeouts = 0
+        self.__failed_checks = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+        self.__pid = os.getpid()
+
+
+    def pid(self):
+        """Returns the ID of the process which created the pool"""
+        return self.__pid
+
+
+    def __healthy(self, connection):
+        """Checks if the connection which was idle for a while still works"""
+
+        if connection.closed:
+            return False
+        returned = self.__returned.get(id(connection))
+        if returned is None or time.time() - returned < self.__health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+    def getconn(self):
+        """Retrieves a connection from the pool
+
+        Waits for a free connection when all connections are in use.
+
+        Returns:
+            psycopg2.extensions.connection: The database connection.
+
+        """
+
+        start = time.time()
+        if not self.__available.acquire(timeout=self.__timeout):
+            with self.__lock:
+                self.__timeouts += 1
+            raise Exception("ConnectionPool: no free connection within {} seconds.".format(self.__timeout))
+        waited = time.time() - start
+
+        try:
+            while True:
+                with self.__lock:
+                    connection = self.__pool.getconn()
+                if self.__healthy(connection):
+                    break
+                # replace the broken connection with a new one
+                with self.__lock:
+                    self.__failed_checks += 1
+                    self.__returned.pop(id(connection), None)
+                    self.__pool.putconn(connection, close=True)
+        except Exception:
+            self.__available.release()
+            raise
+
+        with self.__lock:
+            self.__returned.pop(id(connection), None)
+            self.__in_use += 1
+            self.__checkouts += 1
+            self.__wait_total += waited
+            self.__wait_max = max(self.__wait_max, waited)
+        return connection
+
+
+    def putconn(self, connection):
+        """Returns the connection to the pool
+
+        The open transaction of the connection is rolled back.
+
+        Args:
+            connection (psycopg2.extensions.connection): The database connection.
+
+        """
+
+        with self.__lock:
+            # the connections with the changed session are not reused
+            close = connection.closed or connection.autocommit
+            self.__pool.putconn(connection, close=bool(close))
+            if not close:
+                self.__returned[id(connection)] = time.time()
+            self.__in_use -= 1
+        self.__available.release()
+
+
+    def closeall(self):
+        """Closes all connections of the pool"""
+        with self.__lock:
+            self.__pool.closeall()
+            self.__returned = {}
+
+
+    def stats(self):
+        """Retrieves the pool statistics of the process
+
+        Returns:
+            dict: The number of connections in use, the number of checkouts and
+                the time spent waiting for a free connection.
+
+        """
+
+        with self.__lock:
+            return {
+                "in_use": self.__in_use,
+                "max_size": self.__max_size,
+                "checkouts": self.__checkouts,
+                "timeouts": self.__timeouts,
+                "failed_health_checks": self.__failed_checks,
+                "wait_avg_ms": 1000 * self.__wait_total / self.__checkouts if self.__checkouts > 0 else 0.0,
+                "wait_max_ms": 1000 * self.__wait_max,
+                "pid": self.__pid
+            }
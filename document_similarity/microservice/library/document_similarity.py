@@ -6,39 +6,156 @@ class DocumentSimilarity:
     """
     Given a document embedding, provides tools for analysis of document similarity.
 
+    The embeddings are stored in a preallocated float32 buffer whose capacity is doubled when it is full, so adding
+    documents does not copy the whole matrix. Deleted documents are marked with tombstones and their rows are
+    removed when the share of the deleted rows exceeds the compaction ratio.
+
     Args:
         embedding (numpy.ndarray): matrix of document embeddings
         indices (list(int)): stores document ids in the original database for the documents with embeddings in
             'embedding'.
+        capacity (int): the initial number of rows of the embedding buffer. (Default = None - the number of
+            documents)
+        compaction_ratio (float): the share of deleted rows at which the buffer is compacted. (Default = 0.25)
 
     Methods:
-        get_embedding(): Retrieves the embedding from attribute '__embedding'.
-        get_indices(): Retrieves the embedding from attribute '__indices'.
+        get_embedding(): Retrieves the embeddings of the documents.
+        get_indices(): Retrieves the document ids in the order of the embeddings.
         euclid_similarity(emb1, emb2): Calculate the Euclid similarity between two embeddings.
         cosine_similarity(emb1, emb2): Calculate the cosine similarity between two embeddings.
-        k_nearest_neighbors(index, k=10, similarity=self.euclid_similarity): Get the k documents with embeddings nearest
-            to the document embedding we chose.
+        k_nearest_neighbors(emb, k=10, similarity=self.euclid_similarity, metric=None): Get the k documents with
+            embeddings nearest to the document embedding (or embeddings) we chose.
+        search(emb, k=10, metric='dot'): Get the k documents most similar to the embedding with their scores.
+        compute_similarities(ind, emb): Compute the similarities between a document and all documents.
+        compute_top_k_similarities(ind, emb, k, thresholds=None): Compute the similarities between a document and
+            the documents which need to be stored when only the k most similar documents are kept.
+        compute_batch_similarities(inds, embs, k=0, thresholds=None): Compute the similarities of several new
+            documents at once.
+        new_document(ind, emb): Add a document and compute its similarities with all documents.
+        add_documents(inds, embs): Add documents without computing their similarities.
+        delete_documents(inds): Delete documents.
+        compact(): Remove the rows of the deleted documents from the buffer.
     """
 
-    def __init__(self, embedding, indices):
+    def __init__(self, embedding, indices, capacity=None, compaction_ratio=0.25):
         """
         Args:
             embedding (numpy.ndarray): matrix of document embeddings
             indices (list(int)): list of document ids in the original database for the documents with embeddings in
                 'embedding'.
+            capacity (int): the initial number of rows of the embedding buffer. (Default = None - the number of
+                documents)
+            compaction_ratio (float): the share of deleted rows at which the buffer is compacted. (Default = 0.25)
+        """
+
+        self.__capacity = capacity or 0
+        self.__compaction_ratio = compaction_ratio
+        # the embedding buffer, its row-normalized copy and the squared row norms used by the vectorized nearest
+        # neighbor search; only the first '__size' rows are used
+        self.__matrix = None
+        self.__normalized = None
+        self.__squared_norms = None
+        self.__size = 0
+        # the document id of every used row, the row of every document and the rows not deleted
+        self.__ids = []
+        self.__rows = {}
+        self.__alive = np.zeros(0, dtype=bool)
+        self.__deleted = 0
+        # the cached embeddings and ids of the documents which are not deleted
+        self.__embedding = None
+        self.__indices = None
+        self.__positions = None
+
+        if len(embedding) > 0:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            if embedding.ndim != 2:
+                embedding = embedding.reshape(len(embedding), -1)
+            self.__append(list(indices), embedding)
+
+    def __allocate(self, capacity, dimension):
+        """
+        Allocates the buffers with the given capacity and copies the used rows into them.
+
+        Args:
+            capacity (int): the number of rows of the buffers
+            dimension (int): the dimension of the embeddings
+        """
+
+        matrix = np.zeros((capacity, dimension), dtype=np.float32)
+        normalized = np.zeros((capacity, dimension), dtype=np.float32)
+        squared_norms = np.zeros(capacity, dtype=np.float32)
+        alive = np.zeros(capacity, dtype=bool)
+        if self.__matrix is not None:
+            matrix[:self.__size] = self.__matrix[:self.__size]
+            normalized[:self.__size] = self.__normalized[:self.__size]
+            squared_norms[:self.__size] = self.__squared_norms[:self.__size]
+            alive[:self.__size] = self.__alive[:self.__size]
+        self.__matrix = matrix
+        self.__normalized = normalized
+        self.__squared_norms = squared_norms
+        self.__alive = alive
+
+    def __append(self, inds, embs):
         """
+        Writes the embeddings into the buffer. The embeddings of the documents already in the buffer are replaced,
+        the others are appended and the buffer capacity is doubled if needed.
 
-        self.__embedding = embedding
-        self.__indices = indices
+        Args:
+            inds (list(int)): ids of the documents
+            embs (numpy.ndarray): float32 matrix of the document embeddings
+        """
+
+        if len(inds) != len(embs):
+            raise Exception("DocumentSimilarity: got {} document ids for {} embeddings.".format(len(inds), len(embs)))
+        if self.__matrix is None:
+            self.__allocate(max(self.__capacity, len(inds)), embs.shape[1])
+        elif embs.shape[1] != self.__matrix.shape[1]:
+            raise Exception("DocumentSimilarity: the embedding dimension must be {}, got {}.".format(
+                self.__matrix.shape[1], embs.shape[1]))
+
+        rows = []
+        for ind in inds:
+            if ind in self.__rows:
+                rows.append(self.__rows[ind])
+            else:
+                if self.__size == self.__matrix.shape[0]:
+                    # amortized O(1) appends
+                    self.__allocate(max(2 * self.__size, 16), self.__matrix.shape[1])
+                self.__rows[ind] = self.__size
+                self.__ids.append(ind)
+                rows.append(self.__size)
+                self.__size += 1
+
+        rows = np.asarray(rows, dtype=np.int64)
+        norms = np.linalg.norm(embs, axis=1)
+        self.__matrix[rows] = embs
+        self.__normalized[rows] = embs / np.where(norms == 0, 1, norms)[:, np.newaxis]
+        self.__squared_norms[rows] = norms ** 2
+        self.__alive[rows] = True
+        self.__invalidate()
+
+    def __invalidate(self):
+        """Clears the cached embeddings and ids after the documents change."""
+
+        self.__embedding = None
+        self.__indices = None
+        self.__positions = None
 
     def get_embedding(self):
         """
         Retrieves the embedding.
 
         Returns:
-            obj: The embedding stored in the instance
+            obj: The embeddings of the documents which are not deleted
         """
 
+        if self.__embedding is None:
+            if self.__matrix is None:
+                self.__embedding = np.zeros((0, 0), dtype=np.float32)
+            elif self.__deleted == 0:
+                self.__embedding = self.__matrix[:self.__size]
+            else:
+                self.__embedding = self.__matrix[:self.__size][self.__alive[:self.__size]]
         return self.__embedding
 
     def get_indices(self):
@@ -46,9 +163,14 @@ class DocumentSimilarity:
         Retrieves the indices.
 
         Returns:
-            obj: The indices stored in the instance
+            obj: The ids of the documents which are not deleted in the order of the embeddings
         """
 
+        if self.__indices is None:
+            if self.__deleted == 0:
+                self.__indices = list(self.__ids)
+            else:
+                self.__indices = [ind for ind, alive in zip(self.__ids, self.__alive[:self.__size]) if alive]
         return self.__indices
 
     def euclid_similarity(self, emb1, emb2):
@@ -82,41 +204,151 @@ class DocumentSimilarity:
         norm2 = np.linalg.norm(emb2)
         return dot / (norm1 * norm2)
 
-    def k_nearest_neighbors(self, emb, k=10, similarity=None):
+    def __live_positions(self, rows):
+        """
+        Converts the buffer rows into the positions of the documents in the embeddings returned by 'get_embedding'.
+
+        Args:
+            rows (numpy.ndarray): the rows of documents which are not deleted
+
+        Returns:
+            numpy.ndarray: the positions of the documents
+        """
+
+        if self.__deleted == 0:
+            return rows
+        if self.__positions is None:
+            self.__positions = np.cumsum(self.__alive[:self.__size]) - 1
+        return self.__positions[rows]
+
+    def __top_k(self, scores, k, largest):
+        """
+        Gets the positions of the k best scores of each row sorted from the best to the worst.
+
+        Args:
+            scores (numpy.ndarray): matrix of scores with one row per query
+            k (int): number of positions we want to get
+            largest (bool): if True the largest scores are the best, otherwise the smallest
+
+        Returns:
+            numpy.ndarray: matrix with k positions per query
+        """
+
+        if largest:
+            scores = -scores
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            # select the k best scores without sorting all of them
+            top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        order = np.argsort(np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(top, order, axis=1)
+
+    def k_nearest_neighbors(self, emb, k=10, similarity=None, metric=None, batch_size=1024):
         """
         Get the k documents with embeddings nearest to the document embedding we chose.
 
         Args:
-            emb (numpy.ndarray): embedding of the chosen document, whose neighbors we are trying to find
+            emb (numpy.ndarray): embedding of the chosen document, whose neighbors we are trying to find, or a
+                matrix of embeddings with one embedding per row to find the neighbors of many documents at once
             k (int): number of neighbors we want to find. (Default = 10)
             similarity (function): metric function that we want to use for computing the distance between documents
                 (Default = self.euclid_similarity)
+            metric (str): the metric used instead of the 'similarity' function. Options: 'euclidean' and 'cosine'.
+                (Default = None)
+            batch_size (int): number of query embeddings scored at once. (Default = 1024)
 
         Returns:
             list: a list of k indices of the k documents whose embeddings are closest to the chosen embedding in the
-            specified metric
+            specified metric (a list of such lists if a matrix of embeddings is given)
         """
 
-        # Set 'similarity' to self.euclid_similarity if nothing is set.
-        if similarity is None:
-            similarity = self.euclid_similarity
+        # map the similarity functions to the vectorized metrics
+        if metric is None:
+            if similarity is None or similarity == self.euclid_similarity:
+                metric = 'euclidean'
+            elif similarity == self.cosine_similarity:
+                metric = 'cosine'
+            else:
+                # use the custom similarity function
+                sims = [similarity(emb, d) for d in self.get_embedding()]
+                return np.argsort(sims)[:k].tolist()
+
+        if metric not in ('euclidean', 'cosine'):
+            raise Exception("DocumentSimilarity.k_nearest_neighbors: metric '{}' not supported (must be 'euclidean' or 'cosine').".format(metric))
+
+        queries = np.asarray(emb, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+
+        if self.__size - self.__deleted == 0:
+            return [] if single else [[] for _ in range(len(queries))]
+
+        # the deleted documents are never among the neighbors
+        k = min(k, self.__size - self.__deleted)
+        deleted = ~self.__alive[:self.__size] if self.__deleted > 0 else None
+
+        neighbors = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            if metric == 'cosine':
+                # the largest cosine similarities of the normalized embeddings
+                norms = np.linalg.norm(batch, axis=1)
+                batch = batch / np.where(norms == 0, 1, norms)[:, np.newaxis]
+                scores = batch.dot(self.__normalized[:self.__size].T)
+                if deleted is not None:
+                    scores[:, deleted] = -np.inf
+                top = self.__top_k(scores, k, largest=True)
+            else:
+                # the smallest squared euclidean distances (the squared query norms do not change the order)
+                scores = self.__squared_norms[np.newaxis, :self.__size] - 2 * batch.dot(self.__matrix[:self.__size].T)
+                if deleted is not None:
+                    scores[:, deleted] = np.inf
+                top = self.__top_k(scores, k, largest=False)
+            neighbors.extend(self.__live_positions(top).tolist())
 
-        # calculate the similarities and revert it
-        sims = [similarity(emb, d) for d in self.__embedding]
+        # return indices of the neighbors
+        return neighbors[0] if single else neighbors
 
-        # sort and get the corresponding indices
-        indices = []
-        for c, i in enumerate(np.argsort(sims)):
-            if c == k:
-                break
-            indices.append(i)
+    def search(self, emb, k=10, metric='dot'):
+        """
+        Get the k documents most similar to the given embedding together with their similarity scores.
 
-        # return indices of the neighbors
-        return indices
+        Args:
+            emb (numpy.ndarray): the query embedding, e.g. of a text which is not in the database
+            k (int): number of documents we want to find. (Default = 10)
+            metric (str): the similarity metric. Options: 'dot' (the similarity stored in the database) and
+                'cosine'. (Default = 'dot')
+
+        Returns:
+            list(tuple(int, float)): the document ids and the similarity scores sorted by descending similarity
+        """
+
+        if metric not in ('dot', 'cosine'):
+            raise Exception("DocumentSimilarity.search: metric '{}' not supported (must be 'dot' or 'cosine').".format(metric))
+
+        if self.__size - self.__deleted == 0 or k <= 0:
+            return []
+
+        query = np.asarray(emb, dtype=np.float32)
+        if query.shape != (self.__matrix.shape[1], ):
+            raise Exception("DocumentSimilarity.search: the embedding dimension must be {}.".format(self.__matrix.shape[1]))
+
+        if metric == 'cosine':
+            norm = np.linalg.norm(query)
+            scores = self.__normalized[:self.__size].dot(query / (norm if norm > 0 else 1))
+        else:
+            scores = self.__matrix[:self.__size].dot(query)
+        if self.__deleted > 0:
+            scores[~self.__alive[:self.__size]] = -np.inf
+
+        top = self.__top_k(scores[np.newaxis, :], min(k, self.__size - self.__deleted), largest=True)[0]
+        return [(self.__ids[row], float(scores[row])) for row in top.tolist()]
 
     def compute_similarities(self, ind, emb):
         """Computes similarities between a given document and all the documents with their embeddings in parameter
-        '__embedding'.
+        the embedding.
 
         Args:
             ind (int): the index of the given document in the original database.
@@ -127,18 +359,121 @@ class DocumentSimilarity:
                 similarity between them.
         """
 
-        if len(self.__embedding) > 0:
-            similarities = np.matmul(self.__embedding, emb)
-            res = [[self.__indices[i], ind, similarities[i]] for i in range(len(self.__indices))] + \
-                  [[ind, self.__indices[i], similarities[i]] for i in range(len(self.__indices))]
+        embedding = self.get_embedding()
+        indices = self.get_indices()
+        if len(embedding) > 0:
+            # convert the similarities into python floats which can be stored in the database
+            similarities = np.matmul(embedding, np.asarray(emb, dtype=np.float32)).tolist()
+            res = [[indices[i], ind, similarities[i]] for i in range(len(indices))] + \
+                  [[ind, indices[i], similarities[i]] for i in range(len(indices))]
         else:
             res = []
         return res
 
+    def compute_top_k_similarities(self, ind, emb, k, thresholds=None):
+        """Computes the similarities between a given document and the documents with their embeddings in parameter
+        the embedding which need to be stored when only the k most similar documents are kept for every document.
+
+        Args:
+            ind (int): the index of the given document in the original database.
+            emb (numpy.ndarray): embedding of the source document.
+            k (int): number of most similar documents kept for every document.
+            thresholds (numpy.ndarray): the smallest stored similarity of every document in the embedding or -inf
+                if the document has less than k similar documents. (Default = None - all documents are candidates)
+
+        Returns:
+            list: rows with three columns: id of document number one, id of document number two and similarity
+                between them. The rows contain the k most similar documents of the given document and the documents
+                whose stored similarities are displaced by the given document.
+        """
+
+        embedding = self.get_embedding()
+        indices = self.get_indices()
+        if len(embedding) == 0:
+            return []
+
+        similarities = np.matmul(embedding, np.asarray(emb, dtype=np.float32))
+        # the k most similar documents of the given document
+        top = self.__top_k(similarities[np.newaxis, :], k, largest=True)[0]
+        # the documents for which the given document is among the k most similar documents
+        if thresholds is None:
+            displaced = np.arange(len(similarities))
+        else:
+            # the documents without a threshold (e.g. added concurrently) are all candidates
+            limits = np.full(len(similarities), -np.inf, dtype=np.float32)
+            size = min(len(thresholds), len(similarities))
+            limits[:size] = thresholds[:size]
+            displaced = np.nonzero(similarities > limits)[0]
+
+        # convert the similarities into python floats which can be stored in the database
+        values = similarities.tolist()
+        return [[ind, indices[i], values[i]] for i in top.tolist()] + \
+               [[indices[i], ind, values[i]] for i in displaced.tolist()]
+
+    def compute_batch_similarities(self, inds, embs, k=0, thresholds=None):
+        """Computes the similarities of several new documents at once: their similarities with the documents in the
+        embedding and among themselves. The result is the same as adding the documents one after another.
+
+        Args:
+            inds (list(int)): the indices of the new documents in the original database.
+            embs (list(numpy.ndarray)): embeddings of the new documents.
+            k (int): if positive, only the similarities needed to keep the k most similar documents of every
+                document are computed. (Default = 0)
+            thresholds (numpy.ndarray): the smallest stored similarity of every document in the embedding or -inf
+                if the document has less than k similar documents. (Default = None - all documents are candidates)
+
+        Returns:
+            list: rows with three columns: id of document number one, id of document number two and similarity
+                between them.
+        """
+
+        if len(inds) == 0:
+            return []
+        queries = np.asarray(embs, dtype=np.float32).reshape(len(inds), -1)
+        embedding = self.get_embedding()
+        indices = self.get_indices()
+
+        # the similarities with the documents in the embedding and among the new documents
+        existing = np.matmul(embedding, queries.T) if len(embedding) > 0 else np.zeros((0, len(inds)), dtype=np.float32)
+        among = np.matmul(queries, queries.T)
+
+        if k <= 0:
+            # convert the similarities into python floats which can be stored in the database
+            existing_values = existing.tolist()
+            among_values = among.tolist()
+            res = []
+            for b, ind in enumerate(inds):
+                res += [[indices[i], ind, existing_values[i][b]] for i in range(len(indices))]
+                res += [[ind, indices[i], existing_values[i][b]] for i in range(len(indices))]
+                res += [[inds[c], ind, among_values[c][b]] for c in range(b)]
+                res += [[ind, inds[c], among_values[c][b]] for c in range(b)]
+            return res
+
+        # the k most similar documents of every new document among all other documents
+        np.fill_diagonal(among, -np.inf)
+        scores = np.concatenate([existing.T, among], axis=1)
+        candidates = list(indices) + list(inds)
+        size = min(k, len(candidates) - 1)
+        res = []
+        if size > 0:
+            top = self.__top_k(scores, size, largest=True)
+            for b, ind in enumerate(inds):
+                res += [[ind, candidates[j], float(scores[b, j])] for j in top[b].tolist()]
+
+        # the documents in the embedding for which a new document is among the k most similar documents
+        limits = np.full(len(existing), -np.inf, dtype=np.float32)
+        if thresholds is not None:
+            # the documents without a threshold (e.g. added concurrently) are all candidates
+            size = min(len(thresholds), len(existing))
+            limits[:size] = thresholds[:size]
+        for i, b in zip(*np.nonzero(existing > limits[:, np.newaxis])):
+            res.append([indices[i], inds[b], float(existing[i, b])])
+        return res
+
     def new_document(self, ind, emb):
         """
-        Adds the embedding of a new document to the '__embedding', its index to the '__indices' and returns its
-        similarities with all the embeddings that are already in the '__embeddings'.
+        Adds the embedding of a new document to the embedding and returns its similarities with all the embeddings
+        that are already in the embedding.
 
         Args:
             ind (int): index of the document we are adding
@@ -150,9 +485,59 @@ class DocumentSimilarity:
         """
 
         similarities = self.compute_similarities(ind, emb)
-        if len(self.__embedding) == 0:
-            self.__embedding = [emb]
-        else:
-            self.__embedding = np.vstack([self.__embedding, emb])
-        self.__indices = self.__indices.append(ind)
+        self.add_documents([ind], [emb])
         return similarities
+
+    def add_documents(self, inds, embs):
+        """
+        Adds the embeddings of new documents to the embedding without computing their similarities. The embeddings
+        of the documents which are already in the embedding are replaced.
+
+        Args:
+            inds (list(int)): indices of the documents we are adding
+            embs (list(numpy.ndarray)): the embeddings of the new documents
+        """
+
+        if len(inds) == 0:
+            return
+        embs = np.asarray(embs, dtype=np.float32)
+        if embs.ndim != 2:
+            embs = embs.reshape(len(inds), -1)
+        self.__append(list(inds), embs)
+
+    def delete_documents(self, inds):
+        """
+        Deletes the documents from the embedding. The rows of the deleted documents are marked as deleted and
+        removed when the share of the deleted rows exceeds the compaction ratio.
+
+        Args:
+            inds (list(int)): indices of the documents we are deleting
+        """
+
+        for ind in inds:
+            row = self.__rows.pop(ind, None)
+            if row is not None:
+                self.__alive[row] = False
+                self.__deleted += 1
+        self.__invalidate()
+
+        if self.__deleted > 0 and self.__deleted >= self.__compaction_ratio * self.__size:
+            self.compact()
+
+    def compact(self):
+        """Removes the rows of the deleted documents from the buffer."""
+
+        if self.__deleted == 0:
+            return
+        alive = self.__alive[:self.__size]
+        size = int(alive.sum())
+        self.__matrix[:size] = self.__matrix[:self.__size][alive]
+        self.__normalized[:size] = self.__normalized[:self.__size][alive]
+        self.__squared_norms[:size] = self.__squared_norms[:self.__size][alive]
+        self.__ids = [ind for ind, keep in zip(self.__ids, alive) if keep]
+        self.__rows = {ind: row for row, ind in enumerate(self.__ids)}
+        self.__alive[:size] = True
+        self.__alive[size:] = False
+        self.__size = size
+        self.__deleted = 0
+        self.__invalidate()
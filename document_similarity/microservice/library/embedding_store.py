@@ -0,0 +1,303 @@
+import threading
+
+import numpy as np
+
+from .document_similarity import DocumentSimilarity
+from .postgresql import EMBEDDINGS_CHANNEL, SIMILARITIES_REPLACED
+
+
+class EmbeddingStore:
+    """
+    Resident document embeddings of the worker. The embeddings are loaded once and kept current incrementally: the
+    workers inserting new embeddings notify the other workers through the postgres LISTEN/NOTIFY mechanism and each
+    worker retrieves only the embeddings of the notified documents.
+
+    When only the top_k most similar documents are stored per document, the store also keeps the smallest stored
+    similarity of every document. A new document can only displace a stored similarity larger than it, so the
+    similarities of the other documents are inserted only when they exceed the threshold. The thresholds of the
+    documents updated by other workers may be lower than the stored ones, which only results in more pruned rows.
+    When the 'similarities' table is replaced by a rebuild, all thresholds are retrieved again.
+
+    The store is the only entry point to the resident embeddings: the embeddings are changed by the request threads
+    and the job queue threads, so every read and write of the embeddings is done under the lock of the store. The
+    lock is held only for the work in memory. The changes (loading, refreshing and inserting) are serialized by a
+    separate writer lock, which is also held during their database round-trips, so the searches never wait for
+    the database.
+
+    Args:
+        create_listener (function): function returning a new database connection used for listening to the
+            notifications.
+        top_k (int): the number of most similar documents stored per document, 0 if all similarities are stored.
+            (Default = 0)
+
+    Methods:
+        has_document(document_id): Checks if the embedding of the document is resident.
+        get_indices(): Retrieves the IDs of the resident documents.
+        search(embedding, k, metric): Finds the resident documents most similar to the given embedding.
+        compute_similarities(document_ids, embeddings): Computes the similarities of new documents.
+        load(pg): Loads all embeddings from the database.
+        has_updates(): Checks if there are embeddings inserted by other workers which are not added yet.
+        refresh(pg): Adds the embeddings inserted by other workers since the last refresh.
+        insert(pg, document_ids, embeddings): Inserts new documents and adds their embeddings.
+        update_thresholds(pg, document_ids): Retrieves the smallest stored similarities of the given documents.
+    """
+
+    def __init__(self, create_listener, top_k=0):
+        """
+        Args:
+            create_listener (function): function returning a new database connection used for listening to the
+                notifications.
+            top_k (int): the number of most similar documents stored per document, 0 if all similarities are stored.
+                (Default = 0)
+        """
+
+        self.__create_listener = create_listener
+        self.__top_k = top_k
+        self.__listener = None
+        self.__similarity = None
+        # the notified documents which are not added yet and if the notifications could not be received
+        self.__pending = set()
+        self.__lost = False
+        # if the 'similarities' table was replaced since the thresholds were retrieved
+        self.__replaced = False
+        # the rows of the documents in the embedding and their smallest stored similarities
+        self.__rows = {}
+        self.__thresholds = np.empty(0, dtype=np.float32)
+        self.__lock = threading.RLock()
+        # serializes the changes of the resident embeddings
+        self.__write_lock = threading.RLock()
+
+    def __model(self):
+        """Retrieves the model containing the resident embeddings; the caller holds the lock."""
+
+        if self.__similarity is None:
+            raise Exception("The document embeddings are not loaded.")
+        return self.__similarity
+
+    def has_document(self, document_id):
+        """
+        Checks if the embedding of the document is resident.
+
+        Args:
+            document_id (int): The ID of the document.
+
+        Returns:
+            bool: True if the embedding of the document is resident.
+        """
+
+        with self.__lock:
+            return document_id in self.__rows
+
+    def get_indices(self):
+        """
+        Retrieves the IDs of the resident documents in the order of their embeddings.
+
+        Returns:
+            list(int): A copy of the document IDs.
+        """
+
+        with self.__lock:
+            return list(self.__model().get_indices())
+
+    def search(self, embedding, k=5, metric='dot'):
+        """
+        Finds the resident documents most similar to the given embedding.
+
+        Args:
+            embedding (list(float)): The embedding of the query.
+            k (int): The number of returned documents. (Default = 5)
+            metric (str): The similarity metric, 'dot' or 'cosine'. (Default = 'dot')
+
+        Returns:
+            list(dict): The most similar documents with their similarities.
+        """
+
+        with self.__lock:
+            return self.__model().search(embedding, k=k, metric=metric)
+
+    def compute_similarities(self, document_ids, embeddings):
+        """
+        Computes the similarities of new documents with the resident documents and among themselves. When only the
+        top_k most similar documents are stored, only the similarities exceeding the stored thresholds are returned.
+
+        Args:
+            document_ids (list(int)): The IDs of the new documents.
+            embeddings (list(list(float))): The embeddings of the new documents.
+
+        Returns:
+            list: rows with three columns: id of document number one, id of document number two and similarity
+                between them.
+        """
+
+        with self.__lock:
+            thresholds = self.__thresholds if self.__top_k > 0 else None
+            return self.__model().compute_batch_similarities(document_ids, embeddings, k=self.__top_k,
+                                                             thresholds=thresholds)
+
+    def __listen(self):
+        """Establishes the connection listening to the new embedding notifications."""
+
+        if self.__listener is not None:
+            self.__listener.disconnect()
+        self.__listener = self.__create_listener()
+        self.__listener.listen(EMBEDDINGS_CHANNEL)
+
+    def __append(self, indices):
+        """Assigns the rows and the thresholds to the documents appended to the embedding."""
+
+        for document_id in indices:
+            self.__rows[document_id] = len(self.__rows)
+        self.__thresholds = np.concatenate([self.__thresholds, np.full(len(indices), -np.inf, dtype=np.float32)])
+
+    def load(self, pg):
+        """
+        Loads all document embeddings from the database.
+
+        Args:
+            pg (PostgresQL): The database connection.
+        """
+
+        with self.__write_lock:
+            with self.__lock:
+                # start listening before loading so no new embedding is missed
+                self.__listen()
+                self.__lost = False
+                self.__replaced = False
+            indices, embeddings = pg.retrieve_embeddings()
+            embeddings = np.asarray(embeddings, dtype=np.float32) if len(embeddings) > 0 else []
+            similarity = DocumentSimilarity(embedding=embeddings, indices=indices)
+            with self.__lock:
+                self.__similarity = similarity
+                self.__rows = {}
+                self.__thresholds = np.empty(0, dtype=np.float32)
+                self.__append(indices)
+                # the notifications received during the load which are not loaded stay pending
+                self.__pending.difference_update(self.__rows)
+            self.update_thresholds(pg)
+
+    def __poll(self):
+        """Receives the notifications about the documents inserted by other workers."""
+
+        try:
+            for payload in self.__listener.notifications():
+                if payload == SIMILARITIES_REPLACED:
+                    self.__replaced = True
+                else:
+                    self.__pending.add(int(payload))
+        except Exception:
+            # the listener connection is lost and notifications might be missed
+            self.__lost = True
+        self.__pending.difference_update(self.__rows)
+
+    def has_updates(self):
+        """
+        Checks if there are embeddings inserted by other workers which are not added yet. The check does not use
+        the database connection, so it is cheap enough to be done with every request.
+
+        Returns:
+            bool: True if the embeddings need to be refreshed.
+        """
+
+        with self.__lock:
+            if self.__similarity is None:
+                return True
+            self.__poll()
+            return self.__lost or self.__replaced or len(self.__pending) > 0
+
+    def refresh(self, pg):
+        """
+        Adds the embeddings inserted by other workers since the last refresh. If the notifications could not be
+        received, all embeddings are loaded again.
+
+        Args:
+            pg (PostgresQL): The database connection.
+        """
+
+        with self.__write_lock:
+            with self.__lock:
+                if self.__similarity is not None:
+                    self.__poll()
+                reload = self.__similarity is None or self.__lost
+                replaced = self.__replaced
+                self.__replaced = False
+                new_ids = list(self.__pending)
+            if reload:
+                self.load(pg)
+                return
+            if replaced:
+                # the thresholds of the rebuilt similarities
+                self.update_thresholds(pg)
+
+            if len(new_ids) > 0:
+                indices, embeddings = pg.retrieve_embeddings(document_ids=new_ids)
+                with self.__lock:
+                    self.__similarity.add_documents(indices, embeddings)
+                    self.__append(indices)
+                    self.__pending.difference_update(new_ids)
+                self.update_thresholds(pg, indices)
+
+    def insert(self, pg, document_ids, embeddings, before_commit=None):
+        """
+        Inserts the embeddings of new documents and their similarities into the database and adds the embeddings to
+        the resident embeddings. The insertions are serialized, so concurrent insertions see each other's documents
+        and thresholds, while the searches only wait for the computation of the similarities and the appending of
+        the embeddings.
+
+        Args:
+            pg (PostgresQL): The database connection.
+            document_ids (list(int)): The IDs of the new documents.
+            embeddings (list(list(float))): The embeddings of the new documents.
+            before_commit (function): function called with the database connection before the transaction is
+                committed. (Default = None)
+
+        Returns:
+            list: The inserted similarity rows with three columns: id of document number one, id of document number
+                two and similarity between them.
+        """
+
+        with self.__write_lock:
+            # add the embeddings inserted by the other workers
+            self.refresh(pg)
+            with self.__lock:
+                duplicates = [document_id for document_id in document_ids if document_id in self.__rows]
+                if len(duplicates) > 0:
+                    raise Exception("The documents with IDs {} already have an embedding.".format(duplicates))
+                similarities = self.compute_similarities(document_ids, embeddings)
+
+            try:
+                pg.insert_new_documents(document_ids, embeddings, similarities, top_k=self.__top_k, commit=False)
+                if before_commit is not None:
+                    before_commit(pg)
+                pg.commit()
+            except Exception:
+                pg.rollback()
+                raise
+
+            with self.__lock:
+                self.__model().add_documents(document_ids, embeddings)
+                self.__append(document_ids)
+            try:
+                # the smallest stored similarities of the documents with changed similarities
+                self.update_thresholds(pg, list(set(row[0] for row in similarities)))
+            except Exception:
+                # the outdated thresholds are lower than the stored ones, which only results in more pruned rows
+                pg.rollback()
+            return similarities
+
+    def update_thresholds(self, pg, document_ids=None):
+        """
+        Retrieves the smallest stored similarities of the given documents.
+
+        Args:
+            pg (PostgresQL): The database connection.
+            document_ids (list(int)): The IDs of the documents. (Default = None - all documents)
+        """
+
+        if self.__top_k <= 0:
+            return
+        # the thresholds are retrieved outside the lock so the searches do not wait for the database
+        thresholds = pg.retrieve_similarity_thresholds(self.__top_k, document_ids=document_ids)
+        with self.__lock:
+            for document_id, threshold in thresholds.items():
+                if document_id in self.__rows:
+                    self.__thresholds[self.__rows[document_id]] = threshold
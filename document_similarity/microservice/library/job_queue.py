@@ -0,0 +1,112 @@
+import time
+import logging
+import threading
+
+
+class JobQueue:
+    """
+    Background workers processing the queued similarity updates. The jobs are stored in the 'similarity_jobs' table
+    so that every worker process of the service can queue jobs and report their status. The background workers claim
+    the pending jobs in batches and process each batch at once.
+
+    Args:
+        create_db (function): function returning a new database connection used by a background worker.
+        process (function): function processing a batch of claimed jobs with arguments (pg, jobs).
+        n_workers (int): the number of background worker threads. (Default = 1)
+        batch_size (int): the maximum number of jobs processed at once. (Default = 32)
+        poll_interval (float): the number of seconds between checks for new jobs. (Default = 1)
+        job_timeout (int): the number of seconds after which unfinished jobs are claimed again. (Default = 600)
+        context (function): function returning the context in which the background workers run. (Default = None)
+
+    Methods:
+        start(): Starts the background workers.
+        stop(): Stops the background workers.
+        notify(): Wakes up the background workers after new jobs are queued.
+    """
+
+    def __init__(self, create_db, process, n_workers=1, batch_size=32, poll_interval=1, job_timeout=600, context=None):
+        """
+        Args:
+            create_db (function): function returning a new database connection used by a background worker.
+            process (function): function processing a batch of claimed jobs with arguments (pg, jobs).
+            n_workers (int): the number of background worker threads. (Default = 1)
+            batch_size (int): the maximum number of jobs processed at once. (Default = 32)
+            poll_interval (float): the number of seconds between checks for new jobs. (Default = 1)
+            job_timeout (int): the number of seconds after which unfinished jobs are claimed again. (Default = 600)
+            context (function): function returning the context in which the background workers run.
+                (Default = None)
+        """
+
+        self.__create_db = create_db
+        self.__process = process
+        self.__n_workers = n_workers
+        self.__batch_size = batch_size
+        self.__poll_interval = poll_interval
+        self.__job_timeout = job_timeout
+        self.__context = context
+        self.__logger = logging.getLogger('microservice')
+        self.__wakeup = threading.Event()
+        self.__stopped = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        """Starts the background workers."""
+
+        self.__stopped.clear()
+        for i in range(self.__n_workers):
+            thread = threading.Thread(target=self.__run, name='similarity-worker-{}'.format(i), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self):
+        """Stops the background workers."""
+
+        self.__stopped.set()
+        self.__wakeup.set()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def notify(self):
+        """Wakes up the background workers after new jobs are queued."""
+
+        self.__wakeup.set()
+
+    def __run(self):
+        """Runs the background worker in its context."""
+
+        if self.__context is None:
+            self.__work()
+        else:
+            with self.__context():
+                self.__work()
+
+    def __work(self):
+        """Claims and processes the jobs until the workers are stopped."""
+
+        pg = None
+        while not self.__stopped.is_set():
+            try:
+                if pg is None:
+                    pg = self.__create_db()
+                jobs = pg.claim_jobs(self.__batch_size, self.__job_timeout)
+                if len(jobs) > 0:
+                    self.__process(pg, jobs)
+                    # there might be more pending jobs
+                    continue
+            except Exception as e:
+                self.__logger.warning("Could not process the similarity jobs. " + str(e))
+                # establish a new connection with the next attempt
+                if pg is not None:
+                    try:
+                        pg.disconnect()
+                    except Exception:
+                        pass
+                pg = None
+
+            # wait for new jobs
+            self.__wakeup.wait(self.__poll_interval)
+            self.__wakeup.clear()
+
+        if pg is not None:
+            pg.disconnect()
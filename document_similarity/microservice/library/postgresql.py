@@ -1,4 +1,55 @@
+import io
+import uuid
+import itertools
+from collections import namedtuple
+
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+import numpy as np
+
+# the channel used to notify the workers about new document embeddings
+EMBEDDINGS_CHANNEL = 'document_embeddings'
+# the payload notifying the workers that the 'similarities' table was replaced
+SIMILARITIES_REPLACED = 'similarities_replaced'
+
+# the numpy types of the binary embedding encodings (little-endian)
+EMBEDDING_ENCODINGS = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2')
+}
+
+
+def encode_embedding(embedding, encoding):
+    """Encodes the embedding into the binary format
+
+    Args:
+        embedding (list(float)): The embedding.
+        encoding (str): The binary encoding. Options: 'float32' and 'float16'.
+
+    Returns:
+        psycopg2.Binary: The encoded embedding.
+    """
+
+    return psycopg2.Binary(np.asarray(embedding, dtype=EMBEDDING_ENCODINGS[encoding]).tobytes())
+
+
+def decode_embeddings(buffers, encoding):
+    """Decodes the binary embeddings into a float32 matrix
+
+    Args:
+        buffers (list(memoryview)): The encoded embeddings.
+        encoding (str): The binary encoding. Options: 'float32' and 'float16'.
+
+    Returns:
+        numpy.ndarray: The matrix with one embedding per row.
+    """
+
+    if len(buffers) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    matrix = np.frombuffer(b''.join(buffers), dtype=EMBEDDING_ENCODINGS[encoding]).reshape(len(buffers), -1)
+    return matrix.astype(np.float32, copy=False)
+
 
 class PostgresQL:
     """Connection to the PostgresQL database
@@ -6,12 +57,21 @@ class PostgresQL:
     Args:
         host (str): The host address. (Default "127.0.0.1")
         port (str): The port number. (Default "5432")
+        embedding_encoding (str): The format of the document embeddings. Options: 'array' (the 'vector' column) and
+            the binary 'float32' and 'float16' (the 'vector_binary' column). (Default "array")
 
     """
 
-    def __init__(self, host="127.0.0.1", port="5432"):
+    def __init__(self, host="127.0.0.1", port="5432", embedding_encoding="array"):
+        if embedding_encoding != "array" and embedding_encoding not in EMBEDDING_ENCODINGS:
+            raise Exception("PostgresQL: embedding encoding '{}' not supported (must be 'array', 'float32' or 'float16').".format(embedding_encoding))
         self.host = host
         self.port = port
+        self.embedding_encoding = embedding_encoding
+        # the pool from which the connection is borrowed
+        self.pool = None
+        self.connection = None
+        self.cursor = None
         #self.connection=False
 
 
@@ -46,9 +106,37 @@ class PostgresQL:
             self.cursor = None
 
 
+    def connect_pool(self, connection_pool):
+        """Borrows a connection from the connection pool
+
+        Args:
+            connection_pool (ConnectionPool): The connection pool of the worker process.
+        """
+
+        connection = connection_pool.getconn()
+        try:
+            # store the connection cursor
+            cursor = connection.cursor()
+        except (Exception, psycopg2.Error) as error:
+            # return the broken connection
+            connection_pool.putconn(connection)
+            raise
+        self.connection = connection
+        self.cursor = cursor
+        self.pool = connection_pool
+
+
     def disconnect(self):
         """Disconnect the postgresql connection to the database"""
-        if self.connection:
+        if self.pool is not None:
+            # return the connection to the pool instead of closing it
+            if self.cursor is not None:
+                self.cursor.close()
+            self.pool.putconn(self.connection)
+            self.pool = None
+            self.connection = None
+            self.cursor = None
+        elif self.connection:
             self.cursor.close()
             self.connection.close()
 
@@ -72,12 +160,54 @@ class PostgresQL:
             else:
                 self.cursor.execute(statement, params)
             if self.cursor.description is not None:
-                num_fields = len(self.cursor.description)
                 field_names = [i[0] for i in self.cursor.description]
-                return [{ field_names[i]: row[i] for i in range(num_fields) } for row in self.cursor.fetchall()]
+                return [dict(zip(field_names, row)) for row in self.cursor]
             else:
                 return None
 
+    def iter_execute(self, statement, params=None, itersize=2000, row_type="dict"):
+        """Execute the provided statement with a server-side cursor and stream the records
+
+        The records are transferred from the database in batches of itersize
+        records, so the result set is never held in memory at once.
+
+        Args:
+            statement (str): The postgresql statement to be executed.
+            params (tuple): values to be formatted into the statement. (Default = None)
+            itersize (int): The number of records transferred at once. (Default = 2000)
+            row_type (str): The type of the yielded records. Options: 'dict', 'tuple'
+                and 'namedtuple'. (Default = 'dict')
+
+        Returns:
+            generator: the postgresql records one by one.
+
+        """
+        if self.connection is None:
+            raise Exception("The connection is not established")
+        if row_type not in ("dict", "tuple", "namedtuple"):
+            raise Exception("iter_execute: row type '{}' not supported (must be 'dict', 'tuple' or 'namedtuple').".format(row_type))
+
+        # every stream needs its own server-side cursor
+        with self.connection.cursor(name="iter_execute_{}".format(uuid.uuid4().hex)) as cursor:
+            cursor.itersize = itersize
+            if params is None:
+                cursor.execute(statement)
+            else:
+                cursor.execute(statement, params)
+
+            field_names = None
+            for record in cursor:
+                if field_names is None:
+                    # the description is available after the first batch
+                    field_names = [i[0] for i in cursor.description]
+                    Record = namedtuple("Record", field_names, rename=True)
+                if row_type == "tuple":
+                    yield record
+                elif row_type == "namedtuple":
+                    yield Record._make(record)
+                else:
+                    yield dict(zip(field_names, record))
+
     def retrieve_textual_data(self, doc_id):
         """Given an ID of a document, the method returns its full text, abstract and title from the database.
 
@@ -94,27 +224,63 @@ class PostgresQL:
         """
         return self.execute(statement,(doc_id,))[0]
 
-    def retrieve_embeddings(self):
+    def retrieve_embeddings(self, document_ids=None):
         """Retrieves all document embeddings currently in the database.
 
         Args:
-            The method takes no arguments.
+            document_ids (list(int)): The IDs of the documents whose embeddings we want to retrieve. If None, all
+                embeddings are retrieved. (Default = None)
 
         Returns:
             tuple(list): Two lists: first with IDs of the documents with embeddings in the database and second with
                 their embeddings.
         """
 
-        statement = """
-        SELECT * FROM document_embeddings;
-        """
-        loaded_embeddings = self.execute(statement)
+        column = "vector" if self.embedding_encoding == "array" else "vector_binary"
+        if document_ids is None:
+            statement = sql.SQL("""
+            SELECT document_id, {} AS vector FROM document_embeddings;
+            """).format(sql.Identifier(column))
+            loaded_embeddings = self.iter_execute(statement, row_type="tuple")
+        else:
+            statement = sql.SQL("""
+            SELECT document_id, {} AS vector FROM document_embeddings
+            WHERE document_id IN %s;
+            """).format(sql.Identifier(column))
+            loaded_embeddings = self.iter_execute(statement, (tuple(document_ids), ), row_type="tuple") if len(document_ids) > 0 else []
 
         # Separate the result into a list of indices and a matrix of embeddings
-        indices = [embedding['document_id'] for embedding in loaded_embeddings]
-        embeddings = [embedding['vector'] for embedding in loaded_embeddings]
+        indices, embeddings = [], []
+        for document_id, vector in loaded_embeddings:
+            indices.append(document_id)
+            embeddings.append(vector)
+        if self.embedding_encoding != "array":
+            embeddings = decode_embeddings(embeddings, self.embedding_encoding)
         return indices, embeddings
 
+    def iterate_embeddings(self, batch_size=10000):
+        """Retrieves all document embeddings in batches through a server-side cursor, so that the embeddings are
+        not loaded into memory at once.
+
+        Args:
+            batch_size (int): The number of embeddings retrieved at once. (Default = 10000)
+
+        Returns:
+            generator: Tuples of two lists: first with IDs of the documents and second with their embeddings.
+        """
+
+        column = "vector" if self.embedding_encoding == "array" else "vector_binary"
+        statement = sql.SQL("SELECT document_id, {} FROM document_embeddings ORDER BY document_id;").format(sql.Identifier(column))
+        records = self.iter_execute(statement, itersize=batch_size, row_type="tuple")
+        while True:
+            rows = list(itertools.islice(records, batch_size))
+            if len(rows) == 0:
+                break
+            embeddings = [row[1] for row in rows]
+            if self.embedding_encoding != "array":
+                embeddings = decode_embeddings(embeddings, self.embedding_encoding)
+            yield [row[0] for row in rows], embeddings
+
     def retrieve_similarities(self, doc_id, k=5, offset=0):
         """Given an ID of a document (and optionally parameters 'k' and 'offset') the method returns the IDs of 'k'
         documents that are most similar to the sample document, where we skip the first 'offset' most similar documents.
@@ -145,31 +311,43 @@ class PostgresQL:
         result = [(entry['document2_id'], entry['similarity_score']) for entry in similarity_list]
         return result_indices, result
 
-    def insert_new_embedding(self, doc_id, embedding):
+    def insert_new_embedding(self, doc_id, embedding, commit=True):
         """Inserts a new embedding into the database.
 
         Args:
             doc_id (int): The ID of the document whose embedding we're inserting.
             embedding (np.ndarray): The embedding we're inserting.
+            commit (bool): If the transaction is committed after the insertion. (Default = True)
 
         Returns:
             The method doesn't return anything.
         """
 
-        statement = """
-            INSERT INTO document_embeddings
-            VALUES (%s, %s);
-            """
+        if self.embedding_encoding == "array":
+            statement = """
+                INSERT INTO document_embeddings (document_id, vector)
+                VALUES (%s, %s);
+                """
+        else:
+            statement = """
+                INSERT INTO document_embeddings (document_id, vector_binary)
+                VALUES (%s, %s);
+                """
+            embedding = encode_embedding(embedding, self.embedding_encoding)
         self.execute(statement, (doc_id, embedding, ))
-        self.commit()
+        # notify the other workers about the new embedding when committed
+        self.notify(EMBEDDINGS_CHANNEL, str(doc_id))
+        if commit:
+            self.commit()
 
-    def insert_new_similarity(self, document1_id, document2_id, sim):
+    def insert_new_similarity(self, document1_id, document2_id, sim, commit=True):
         """Inserts a new similarity into the database.
 
         Args:
             document1_id (int): The ID of the first of two documents.
             document2_id (int): The ID of the second of two documents.
             sim (np.single): Similarity score between given documents.
+            commit (bool): If the transaction is committed after the insertion. (Default = True)
 
         Returns:
             The method doesn't return anything.
@@ -180,8 +358,429 @@ class PostgresQL:
             VALUES (%s, %s, %s);
             """
         self.execute(statement, (document1_id, document2_id, sim, ))
+        if commit:
+            self.commit()
+
+    def insert_new_similarities(self, similarities, commit=True, table='similarities'):
+        """Inserts new similarities into the database with a single COPY statement.
+
+        Args:
+            similarities (list(list)): List of [document1_id, document2_id, similarity] rows.
+            commit (bool): If the transaction is committed after the insertion. (Default = True)
+            table (str): The name of the table with the similarities. (Default = 'similarities')
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        if self.cursor is None:
+            raise Exception("The connection is not established")
+
+        # stream the rows in the postgres text format
+        buffer = io.StringIO()
+        for document1_id, document2_id, sim in similarities:
+            buffer.write("{}\t{}\t{}\n".format(int(document1_id), int(document2_id), repr(float(sim))))
+        buffer.seek(0)
+        statement = sql.SQL("COPY {} (document1_id, document2_id, similarity_score) FROM STDIN;").format(sql.Identifier(table))
+        self.cursor.copy_expert(statement.as_string(self.connection), buffer)
+        if commit:
+            self.commit()
+
+    def insert_new_document(self, doc_id, embedding, similarities, top_k=0):
+        """Inserts the embedding of a new document and its similarities in a single transaction.
+
+        Args:
+            doc_id (int): The ID of the document whose embedding we're inserting.
+            embedding (np.ndarray): The embedding we're inserting.
+            similarities (list(list)): List of [document1_id, document2_id, similarity] rows.
+            top_k (int): If positive, only the top_k most similar documents are kept for the documents whose
+                similarities are inserted. (Default = 0)
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        self.insert_new_documents([doc_id], [embedding], similarities, top_k=top_k)
+
+    def insert_new_documents(self, doc_ids, embeddings, similarities, top_k=0, commit=True):
+        """Inserts the embeddings of new documents and their similarities in a single transaction.
+
+        Args:
+            doc_ids (list(int)): The IDs of the documents whose embeddings we're inserting.
+            embeddings (list(np.ndarray)): The embeddings we're inserting.
+            similarities (list(list)): List of [document1_id, document2_id, similarity] rows.
+            top_k (int): If positive, only the top_k most similar documents are kept for the documents whose
+                similarities are inserted. (Default = 0)
+            commit (bool): If the transaction is committed after the insertion. (Default = True)
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        try:
+            for doc_id, embedding in zip(doc_ids, embeddings):
+                self.insert_new_embedding(doc_id, embedding, commit=False)
+            self.insert_new_similarities(similarities, commit=False)
+            if top_k > 0:
+                # remove the similarities displaced by the new documents
+                self.prune_similarities(top_k, document_ids=list(set(row[0] for row in similarities)), commit=False)
+            if commit:
+                self.commit()
+        except Exception:
+            # nothing is stored if any of the insertions fails
+            self.rollback()
+            raise
+
+    def prune_similarities(self, k, document_ids=None, commit=True, table='similarities'):
+        """Removes all but the k most similar documents of the given documents from the similarities table.
+
+        Args:
+            k (int): The number of most similar documents kept for every document.
+            document_ids (list(int)): The IDs of the pruned documents. (Default = None - all documents)
+            commit (bool): If the transaction is committed after the removal. (Default = True)
+            table (str): The name of the table with the similarities. (Default = 'similarities')
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        if document_ids is not None and len(document_ids) == 0:
+            return
+        condition = sql.SQL("WHERE document1_id IN %s" if document_ids is not None else "")
+        statement = sql.SQL("""
+            DELETE FROM {table} s
+            USING (
+                SELECT document1_id, document2_id, ROW_NUMBER() OVER (
+                    PARTITION BY document1_id ORDER BY similarity_score DESC, document2_id
+                ) AS rank
+                FROM {table}
+                {condition}
+            ) ranked
+            WHERE ranked.rank > %s
+            AND s.document1_id = ranked.document1_id
+            AND s.document2_id = ranked.document2_id;
+            """).format(table=sql.Identifier(table), condition=condition)
+        params = (tuple(document_ids), k, ) if document_ids is not None else (k, )
+        self.execute(statement, params)
+        if commit:
+            self.commit()
+
+    def retrieve_similarity_thresholds(self, k, document_ids=None):
+        """Retrieves the smallest stored similarity of the documents which have k similar documents stored.
+
+        Args:
+            k (int): The number of most similar documents kept for every document.
+            document_ids (list(int)): The IDs of the documents. (Default = None - all documents)
+
+        Returns:
+            dict: The smallest stored similarity of every document with k similar documents.
+        """
+
+        if document_ids is not None and len(document_ids) == 0:
+            return {}
+        condition = "WHERE document1_id IN %s" if document_ids is not None else ""
+        statement = """
+            SELECT document1_id, MIN(similarity_score) AS threshold FROM similarities
+            {}
+            GROUP BY document1_id
+            HAVING COUNT(*) >= %s;
+            """.format(condition)
+        params = (tuple(document_ids), k, ) if document_ids is not None else (k, )
+        rows = self.execute(statement, params)
+        return { row['document1_id']: row['threshold'] for row in rows }
+
+    def create_similarities_table(self, table):
+        """Creates an empty table with the structure of the 'similarities' table. An existing table with the same
+        name is dropped.
+
+        Args:
+            table (str): The name of the new table.
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        self.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(table)))
+        self.execute(sql.SQL("CREATE TABLE {} (LIKE similarities INCLUDING ALL);").format(sql.Identifier(table)))
         self.commit()
 
+    def delete_similarities(self, document_ids, commit=True, table='similarities'):
+        """Deletes the similarities of the given documents.
+
+        Args:
+            document_ids (list(int)): The IDs of the documents whose similarities are deleted.
+            commit (bool): If the transaction is committed after the removal. (Default = True)
+            table (str): The name of the table with the similarities. (Default = 'similarities')
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        if len(document_ids) == 0:
+            return
+        statement = sql.SQL("DELETE FROM {} WHERE document1_id IN %s;").format(sql.Identifier(table))
+        self.execute(statement, (tuple(document_ids), ))
+        if commit:
+            self.commit()
+
+    def table_exists(self, table):
+        """Checks if the table exists.
+
+        Args:
+            table (str): The name of the table.
+
+        Returns:
+            bool: True if the table exists.
+        """
+
+        return self.execute("SELECT to_regclass(%s) IS NOT NULL AS exists;", (table, ))[0]['exists']
+
+    def replace_similarities_table(self, table, document_ids=None, k=0):
+        """Replaces the 'similarities' table with the given table in a single transaction. The 'similarities' table
+        is locked against writes during the replacement, so no similarities are inserted into the dropped table.
+
+        Args:
+            table (str): The name of the table replacing the 'similarities' table.
+            document_ids (list(int)): The documents whose similarities are in the given table. The similarities of
+                the other documents, e.g. inserted by the service while the table was built, are copied from the
+                'similarities' table. (Default = None - nothing is copied)
+            k (int): If positive, only the k most similar documents are kept for the documents whose similarities
+                are copied. (Default = 0)
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        try:
+            # the new similarities wait until the table is replaced; the reads continue
+            self.execute("LOCK TABLE similarities IN EXCLUSIVE MODE;")
+            if document_ids is not None:
+                rows = self.execute("SELECT document_id FROM document_embeddings;")
+                new_ids = set(row['document_id'] for row in rows).difference(int(document_id) for document_id in document_ids)
+                if len(new_ids) > 0:
+                    statement = sql.SQL("""
+                        INSERT INTO {} (document1_id, document2_id, similarity_score)
+                        SELECT document1_id, document2_id, similarity_score FROM similarities
+                        WHERE document1_id IN %s OR document2_id IN %s;
+                        """).format(sql.Identifier(table))
+                    self.execute(statement, (tuple(new_ids), tuple(new_ids)))
+                    if k > 0:
+                        # remove the similarities displaced by the copied documents
+                        changed = self.execute(sql.SQL("""
+                            SELECT DISTINCT document1_id FROM {} WHERE document2_id IN %s;
+                            """).format(sql.Identifier(table)), (tuple(new_ids), ))
+                        self.prune_similarities(k, document_ids=[row['document1_id'] for row in changed],
+                                                commit=False, table=table)
+            self.execute("DROP TABLE similarities;")
+            self.execute(sql.SQL("ALTER TABLE {} RENAME TO similarities;").format(sql.Identifier(table)))
+            # the workers retrieve the thresholds of the new similarities
+            self.notify(EMBEDDINGS_CHANNEL, SIMILARITIES_REPLACED)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+
+    def migrate_embeddings(self, encoding, batch_size=1000, drop_array=False):
+        """Stores the embeddings of the 'vector' column in the binary 'vector_binary' column. The embeddings are
+        converted in batches, each committed separately, so an interrupted migration continues where it stopped.
+
+        Args:
+            encoding (str): The binary encoding. Options: 'float32' and 'float16'.
+            batch_size (int): The number of embeddings converted at once. (Default = 1000)
+            drop_array (bool): If True, the 'vector' column is dropped after the migration. (Default = False)
+
+        Returns:
+            int: The number of converted embeddings.
+        """
+
+        if encoding not in EMBEDDING_ENCODINGS:
+            raise Exception("PostgresQL.migrate_embeddings: encoding '{}' not supported (must be 'float32' or 'float16').".format(encoding))
+
+        self.execute("ALTER TABLE document_embeddings ADD COLUMN IF NOT EXISTS vector_binary bytea;")
+        # the new embeddings are stored only in the binary column
+        self.execute("ALTER TABLE document_embeddings ALTER COLUMN vector DROP NOT NULL;")
+        self.commit()
+
+        statement = """
+            SELECT document_id, vector FROM document_embeddings
+            WHERE vector_binary IS NULL AND vector IS NOT NULL
+            LIMIT %s;
+            """
+        update = """
+            UPDATE document_embeddings AS d SET vector_binary = v.vector_binary
+            FROM (VALUES %s) AS v (document_id, vector_binary)
+            WHERE d.document_id = v.document_id;
+            """
+        converted = 0
+        while True:
+            rows = self.execute(statement, (batch_size, ))
+            if len(rows) == 0:
+                break
+            values = [(row['document_id'], encode_embedding(row['vector'], encoding)) for row in rows]
+            execute_values(self.cursor, update, values, page_size=batch_size)
+            self.commit()
+            converted += len(rows)
+
+        if drop_array:
+            self.execute("ALTER TABLE document_embeddings DROP COLUMN vector;")
+            self.commit()
+        return converted
+
+    def create_jobs_table(self):
+        """Creates the 'similarity_jobs' table of the queued similarity updates if it does not exist yet.
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS similarity_jobs (
+                job_id SERIAL PRIMARY KEY,
+                document_id INTEGER NOT NULL,
+                language TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP NOT NULL DEFAULT now(),
+                updated_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+            """)
+        self.execute("CREATE INDEX IF NOT EXISTS similarity_jobs_status ON similarity_jobs (status);")
+        self.commit()
+
+    def insert_jobs(self, document_ids, language):
+        """Queues the similarity updates of the documents.
+
+        Args:
+            document_ids (list(int)): The IDs of the documents.
+            language (str): The language of the documents.
+
+        Returns:
+            list(dict): The queued jobs with their 'job_id' and 'document_id'.
+        """
+
+        statement = """
+            INSERT INTO similarity_jobs (document_id, language)
+            SELECT document_id, %s FROM unnest(%s::integer[]) AS document_id
+            RETURNING job_id, document_id;
+            """
+        jobs = self.execute(statement, (language, list(document_ids), ))
+        self.commit()
+        return sorted(jobs, key=lambda job: job['job_id'])
+
+    def claim_jobs(self, batch_size, timeout):
+        """Claims the oldest pending jobs. The jobs claimed by a worker which did not finish them within the timeout
+        are claimed again. Concurrent workers never claim the same jobs.
+
+        Args:
+            batch_size (int): The maximum number of claimed jobs.
+            timeout (int): The number of seconds after which the running jobs are claimed again.
+
+        Returns:
+            list(dict): The claimed jobs with their 'job_id', 'document_id' and 'language'.
+        """
+
+        statement = """
+            UPDATE similarity_jobs SET status = 'running', attempts = attempts + 1, updated_at = now()
+            WHERE job_id IN (
+                SELECT job_id FROM similarity_jobs
+                WHERE status = 'pending'
+                OR (status = 'running' AND updated_at < now() - %s * interval '1 second')
+                ORDER BY job_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING job_id, document_id, language;
+            """
+        jobs = self.execute(statement, (timeout, batch_size, ))
+        self.commit()
+        return sorted(jobs, key=lambda job: job['job_id'])
+
+    def finish_jobs(self, job_ids, status, error=None, commit=True):
+        """Sets the final status of the jobs.
+
+        Args:
+            job_ids (list(int)): The IDs of the jobs.
+            status (str): The status of the jobs. Options: 'done' and 'failed'.
+            error (str): The error message of the failed jobs. (Default = None)
+            commit (bool): If the transaction is committed after the update. (Default = True)
+
+        Returns:
+            The method doesn't return anything.
+        """
+
+        if len(job_ids) == 0:
+            return
+        statement = """
+            UPDATE similarity_jobs SET status = %s, error = %s, updated_at = now()
+            WHERE job_id IN %s;
+            """
+        self.execute(statement, (status, error, tuple(job_ids), ))
+        if commit:
+            self.commit()
+
+    def retrieve_jobs(self, job_ids):
+        """Retrieves the status of the jobs.
+
+        Args:
+            job_ids (list(int)): The IDs of the jobs.
+
+        Returns:
+            list(dict): The jobs with their 'job_id', 'document_id', 'status', 'error', 'attempts', 'created_at' and
+                'updated_at'.
+        """
+
+        if len(job_ids) == 0:
+            return []
+        statement = """
+            SELECT job_id, document_id, status, error, attempts, created_at, updated_at FROM similarity_jobs
+            WHERE job_id IN %s
+            ORDER BY job_id;
+            """
+        return self.execute(statement, (tuple(job_ids), ))
+
+    def notify(self, channel, payload):
+        """Sends a notification to the listeners of the channel. The notification is delivered when the transaction
+        is committed.
+
+        Args:
+            channel (str): The name of the channel.
+            payload (str): The notification payload.
+        """
+
+        self.execute("SELECT pg_notify(%s, %s);", (channel, payload, ))
+
+    def listen(self, channel):
+        """Starts listening to the notifications sent to the channel.
+
+        Args:
+            channel (str): The name of the channel.
+        """
+
+        if self.connection is None:
+            raise Exception("The connection is not established")
+        # the notifications are received outside of transactions
+        self.connection.autocommit = True
+        self.execute("LISTEN {};".format(channel))
+
+    def notifications(self):
+        """Retrieves the notifications received since the last call.
+
+        Returns:
+            list(str): The payloads of the received notifications.
+        """
+
+        if self.connection is None:
+            raise Exception("The connection is not established")
+        self.connection.poll()
+        payloads = [notify.payload for notify in self.connection.notifies]
+        del self.connection.notifies[:]
+        return payloads
+
     def commit(self):
         if self.connection:
             self.connection.commit()
+
+    def rollback(self):
+        if self.connection:
+            self.connection.rollback()
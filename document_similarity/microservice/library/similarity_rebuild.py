@@ -0,0 +1,267 @@
+# Similarity Rebuild
+# Recomputes the top-K most similar documents of all documents.
+# The embeddings are streamed from the database into a snapshot on
+# disk, the row blocks of the snapshot are scored against chunks of
+# all embeddings by multiple processes and the results are bulk
+# loaded into a new table which replaces the 'similarities' table
+# together with the similarities of the documents added meanwhile.
+# The completed blocks are stored in a checkpoint so an interrupted
+# rebuild can be resumed.
+
+import os
+import json
+import time
+import logging
+import multiprocessing
+
+import numpy as np
+
+# the table into which the similarities are loaded during the rebuild
+REBUILD_TABLE = 'similarities_rebuild'
+
+logger = logging.getLogger(__name__)
+
+# the embedding snapshot shared by the worker processes
+__matrix = None
+
+
+def __init_worker(matrix_path):
+    """Opens the embedding snapshot in the worker process"""
+    global __matrix
+    __matrix = np.load(matrix_path, mmap_mode='r')
+
+
+def block_neighbors(matrix, start, end, k, chunk_size):
+    """Finds the k most similar documents of the documents in the row block
+
+    Args:
+        matrix (numpy.ndarray): The float32 embedding matrix.
+        start (int): The first row of the block.
+        end (int): The row after the last row of the block.
+        k (int): The number of most similar documents.
+        chunk_size (int): The number of embeddings scored at once.
+
+    Returns:
+        tuple(numpy.ndarray): The rows of the most similar documents and their similarities
+            sorted by descending similarity, one row per document in the block.
+
+    """
+
+    queries = np.asarray(matrix[start:end], dtype=np.float32)
+    rows = np.arange(start, end)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+    for chunk_start in range(0, matrix.shape[0], chunk_size):
+        chunk = np.asarray(matrix[chunk_start:chunk_start + chunk_size], dtype=np.float32)
+        scores = queries.dot(chunk.T)
+        # a document is not similar to itself
+        own = (rows >= chunk_start) & (rows < chunk_start + len(chunk))
+        scores[np.nonzero(own)[0], rows[own] - chunk_start] = -np.inf
+
+        # merge the chunk scores with the best scores so far
+        scores = np.concatenate([best_scores, scores], axis=1)
+        candidates = np.concatenate([best_rows, np.broadcast_to(np.arange(chunk_start, chunk_start + len(chunk)), (len(queries), len(chunk)))], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_rows = np.take_along_axis(candidates, top, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def __score_block(task):
+    """Scores the row block in the worker process"""
+    start, end, k, chunk_size = task
+    neighbor_rows, neighbor_scores = block_neighbors(__matrix, start, end, k, chunk_size)
+    return start, end, neighbor_rows, neighbor_scores
+
+
+def __block_sizes(n_documents, dimension, n_workers, memory_budget, k=0):
+    """Computes the block and chunk sizes which fit into the memory budget
+
+    Each worker holds a block of query embeddings, a chunk of embeddings, the
+    block x chunk score matrix (twice, while merging with the best scores) and
+    the k best scores and rows of every document in the block.
+
+    Args:
+        n_documents (int): The number of documents.
+        dimension (int): The embedding dimension.
+        n_workers (int): The number of worker processes.
+        memory_budget (int): The memory budget of all workers in bytes.
+        k (int): The number of most similar documents. (Default = 0)
+
+    Returns:
+        tuple(int): The number of rows in a block and the number of embeddings in a chunk.
+
+    """
+
+    budget = memory_budget / n_workers
+    chunk_size = int(min(n_documents, max(1024, budget / 4 / (4 * dimension))))
+    # the best scores and rows are copied a few times while merging
+    block_size = int(max(1, (budget - 4 * chunk_size * dimension) / (4 * (dimension + 2 * chunk_size) + 48 * k)))
+    # have enough blocks to balance the work between the workers
+    block_size = min(block_size, max(1, -(-n_documents // (4 * n_workers))))
+    return block_size, chunk_size
+
+
+def __save_checkpoint(path, checkpoint):
+    """Saves the checkpoint without leaving a partially written file"""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(checkpoint, output)
+    os.replace(temporary, path)
+
+
+def __snapshot_embeddings(pg, directory, metric, batch_size):
+    """Streams the embeddings from the database into the snapshot files
+
+    Args:
+        pg (PostgresQL): The database connection.
+        directory (str): The directory of the snapshot files.
+        metric (str): The similarity metric. Options: 'dot' and 'cosine'.
+        batch_size (int): The number of embeddings retrieved at once.
+
+    Returns:
+        tuple(str): The paths to the embedding matrix and the document ids.
+
+    """
+
+    matrix_path = os.path.join(directory, 'embeddings.npy')
+    ids_path = os.path.join(directory, 'document_ids.npy')
+
+    # the embeddings are written batch by batch into a temporary file
+    raw_path = os.path.join(directory, 'embeddings.raw')
+    document_ids = []
+    dimension = None
+    with open(raw_path, 'wb') as raw:
+        for indices, embeddings in pg.iterate_embeddings(batch_size=batch_size):
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if metric == 'cosine':
+                norms = np.linalg.norm(embeddings, axis=1)
+                embeddings = embeddings / np.where(norms == 0, 1, norms)[:, np.newaxis]
+            dimension = embeddings.shape[1]
+            raw.write(embeddings.tobytes())
+            document_ids.extend(indices)
+            logger.info("retrieved {} embeddings".format(len(document_ids)))
+
+    # convert the raw file into a memory-mappable matrix
+    shape = (len(document_ids), dimension or 0)
+    matrix = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float32, shape=shape)
+    if len(document_ids) > 0:
+        matrix[:] = np.memmap(raw_path, dtype=np.float32, mode='r', shape=shape)
+    matrix.flush()
+    del matrix
+    os.remove(raw_path)
+    np.save(ids_path, np.asarray(document_ids, dtype=np.int64))
+    return matrix_path, ids_path
+
+
+def rebuild_similarities(pg, k=10, metric='dot', memory_budget=1024, n_workers=None,
+                         checkpoint_dir='./rebuild', resume=False, batch_size=10000):
+    """Recomputes the k most similar documents of all documents
+
+    Args:
+        pg (PostgresQL): The database connection.
+        k (int): The number of most similar documents stored per document, 0 stores the similarities of all
+            pairs of documents. (Default = 10)
+        metric (str): The similarity metric. Options: 'dot' (as used by the service) and 'cosine'. (Default = 'dot')
+        memory_budget (int): The memory used by the worker processes in megabytes. (Default = 1024)
+        n_workers (int): The number of worker processes. (Default = the number of CPUs)
+        checkpoint_dir (str): The directory of the checkpoint and the embedding snapshot. (Default = './rebuild')
+        resume (bool): If True, the rebuild stored in the checkpoint is resumed. (Default = False)
+        batch_size (int): The number of embeddings retrieved from the database at once. (Default = 10000)
+
+    """
+
+    if metric not in ('dot', 'cosine'):
+        raise Exception("rebuild_similarities: metric '{}' not supported (must be 'dot' or 'cosine').".format(metric))
+
+    n_workers = n_workers or multiprocessing.cpu_count()
+    checkpoint_path = os.path.join(checkpoint_dir, 'checkpoint.json')
+
+    if resume:
+        if not os.path.exists(checkpoint_path):
+            raise Exception("rebuild_similarities: no checkpoint to resume in '{}'".format(checkpoint_dir))
+        with open(checkpoint_path) as input_file:
+            checkpoint = json.load(input_file)
+        logger.info("resuming the rebuild with {} of {} blocks completed".format(len(checkpoint['completed']), checkpoint['n_blocks']))
+    else:
+        if not os.path.exists(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        matrix_path, ids_path = __snapshot_embeddings(pg, checkpoint_dir, metric, batch_size)
+        # the similarities are loaded into a new table replacing the current one at the end
+        pg.create_similarities_table(REBUILD_TABLE)
+
+        matrix = np.load(matrix_path, mmap_mode='r')
+        # all other documents are the most similar documents when all similarities are stored
+        n_neighbors = max(0, matrix.shape[0] - 1) if k <= 0 else min(k, max(0, matrix.shape[0] - 1))
+        block_size, chunk_size = __block_sizes(matrix.shape[0], max(1, matrix.shape[1]), n_workers,
+                                               memory_budget * 1024 * 1024, k=n_neighbors)
+        checkpoint = {
+            "matrix_path": matrix_path,
+            "ids_path": ids_path,
+            "k": n_neighbors,
+            "metric": metric,
+            "block_size": block_size,
+            "chunk_size": chunk_size,
+            "n_blocks": -(-matrix.shape[0] // block_size),
+            "completed": []
+        }
+        del matrix
+        __save_checkpoint(checkpoint_path, checkpoint)
+
+    document_ids = np.load(checkpoint['ids_path'])
+    n_documents = len(document_ids)
+    block_size = checkpoint['block_size']
+    completed = set(checkpoint['completed'])
+    tasks = [(start, min(start + block_size, n_documents), checkpoint['k'], checkpoint['chunk_size'])
+             for start in range(0, n_documents, block_size) if start not in completed]
+
+    if checkpoint['k'] > 0 and len(tasks) > 0:
+        start_time = time.time()
+        n_done = 0
+        pool = multiprocessing.Pool(n_workers, initializer=__init_worker, initargs=(checkpoint['matrix_path'], ))
+        try:
+            for start, end, neighbor_rows, neighbor_scores in pool.imap_unordered(__score_block, tasks):
+                block_ids = document_ids[start:end].tolist()
+                similarities = [[document_id, int(document_ids[row]), float(score)]
+                                for document_id, rows, scores in zip(block_ids, neighbor_rows, neighbor_scores)
+                                for row, score in zip(rows, scores) if row >= 0]
+                try:
+                    # replace the similarities of the block if it was loaded before the interruption
+                    pg.delete_similarities(block_ids, commit=False, table=REBUILD_TABLE)
+                    pg.insert_new_similarities(similarities, commit=False, table=REBUILD_TABLE)
+                    pg.commit()
+                except Exception:
+                    pg.rollback()
+                    raise
+
+                checkpoint['completed'].append(start)
+                __save_checkpoint(checkpoint_path, checkpoint)
+
+                # report the progress
+                n_done += 1
+                elapsed = time.time() - start_time
+                remaining = elapsed / n_done * (len(tasks) - n_done)
+                logger.info("completed {} of {} blocks ({:.1f} documents/s, {:.0f} s remaining)".format(
+                    len(checkpoint['completed']), checkpoint['n_blocks'], n_done * block_size / elapsed, remaining))
+        finally:
+            pool.terminate()
+            pool.join()
+
+    # a rebuild interrupted after the swap only needs to be cleaned up
+    swapped = checkpoint.get('swapped', False) or \
+        (resume and len(tasks) == 0 and not pg.table_exists(REBUILD_TABLE))
+    if not swapped:
+        # replace the similarities with the rebuilt ones; the similarities of the documents
+        # inserted since the snapshot are copied from the current table
+        pg.replace_similarities_table(REBUILD_TABLE, document_ids=document_ids.tolist(), k=k)
+        checkpoint['swapped'] = True
+        __save_checkpoint(checkpoint_path, checkpoint)
+        logger.info("replaced the similarities of {} documents".format(n_documents))
+
+    # remove the checkpoint and the snapshot
+    for path in [checkpoint['matrix_path'], checkpoint['ids_path'], checkpoint_path]:
+        if os.path.exists(path):
+            os.remove(path)
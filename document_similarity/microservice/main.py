@@ -1,7 +1,39 @@
 import argparse
+import logging
 from waitress import serve
 from microservice import create_app
 
+
+def connect_database(args):
+    """Connects to the database of the environment given in the command line arguments
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        tuple: The database connection and the configuration of the environment.
+    """
+
+    from microservice.config import config
+    from microservice.library.postgresql import PostgresQL
+
+    # report the progress in the terminal
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    # get the database configuration of the environment
+    configurations = {
+        'production': config.ProductionConfig,
+        'development': config.DevelopmentConfig,
+        'testing': config.TestingConfig
+    }
+    configuration = configurations[args.env]
+    pg = PostgresQL(host=args.db_host, port=args.db_port, embedding_encoding=configuration.EMBEDDING_ENCODING)
+    pg.connect(configuration.DATABASE_NAME, user=configuration.DATABASE_USER, password=configuration.DATABASE_PASSWORD)
+    if pg.connection is None:
+        raise Exception('Could not connect to the database')
+    return pg, configuration
+
+
 if __name__=='__main__':
     # parse command line arguments
     argparser = argparse.ArgumentParser(description="Microservice")
@@ -18,6 +50,27 @@ if __name__=='__main__':
 
     argparser_production.set_defaults(command='start')
 
+    argparser_rebuild = subparsers.add_parser('rebuild', help="Recomputes the most similar documents of all documents")
+    argparser_rebuild.add_argument('-e', '--env', type=str, default='production', help="The environment whose database is rebuilt (default: 'production')")
+    argparser_rebuild.add_argument('--db_host', type=str, default='127.0.0.1', help="The database host (default: '127.0.0.1')")
+    argparser_rebuild.add_argument('--db_port', type=str, default='5432', help="The database port (default: '5432')")
+    argparser_rebuild.add_argument('-k', '--top_k', type=int, default=None, help="The number of most similar documents stored per document, 0 stores all similarities (default: SIMILARITY_TOP_K)")
+    argparser_rebuild.add_argument('-m', '--metric', type=str, default='dot', help="The similarity metric. Options: 'dot' and 'cosine' (default: 'dot')")
+    argparser_rebuild.add_argument('--memory', type=int, default=1024, help="The memory budget of the workers in megabytes (default: 1024)")
+    argparser_rebuild.add_argument('-w', '--workers', type=int, default=None, help="The number of worker processes (default: the number of CPUs)")
+    argparser_rebuild.add_argument('-c', '--checkpoint_dir', type=str, default='./rebuild', help="The directory of the checkpoint (default: './rebuild')")
+    argparser_rebuild.add_argument('-r', '--resume', action='store_true', help="Resumes the interrupted rebuild from the checkpoint")
+    argparser_rebuild.set_defaults(command='rebuild')
+
+    argparser_migrate = subparsers.add_parser('migrate_embeddings', help="Stores the document embeddings in the binary format")
+    argparser_migrate.add_argument('-e', '--env', type=str, default='production', help="The environment whose database is migrated (default: 'production')")
+    argparser_migrate.add_argument('--db_host', type=str, default='127.0.0.1', help="The database host (default: '127.0.0.1')")
+    argparser_migrate.add_argument('--db_port', type=str, default='5432', help="The database port (default: '5432')")
+    argparser_migrate.add_argument('--encoding', type=str, default='float32', help="The binary encoding. Options: 'float32' and 'float16' (default: 'float32')")
+    argparser_migrate.add_argument('-b', '--batch_size', type=int, default=1000, help="The number of embeddings converted at once (default: 1000)")
+    argparser_migrate.add_argument('--drop_array', action='store_true', help="Drops the 'vector' column after the migration")
+    argparser_migrate.set_defaults(command='migrate_embeddings')
+
     # parse the arguments and call whatever function was selected
     args = argparser.parse_args()
 
@@ -37,5 +90,26 @@ if __name__=='__main__':
         elif args.env == 'development':
             app.run(host=arguments["host"], port=arguments["port"])
 
+    elif args.command == 'migrate_embeddings':
+        pg, _ = connect_database(args)
+        try:
+            # convert the embeddings into the binary format
+            converted = pg.migrate_embeddings(args.encoding, batch_size=args.batch_size, drop_array=args.drop_array)
+            logging.info('converted {} embeddings'.format(converted))
+        finally:
+            pg.disconnect()
+
+    elif args.command == 'rebuild':
+        from microservice.library.similarity_rebuild import rebuild_similarities
+
+        pg, configuration = connect_database(args)
+        # the service stores all similarities when SIMILARITY_TOP_K is 0
+        top_k = args.top_k if args.top_k is not None else getattr(configuration, 'SIMILARITY_TOP_K', 10)
+        try:
+            rebuild_similarities(pg, k=top_k, metric=args.metric, memory_budget=args.memory, n_workers=args.workers,
+                                 checkpoint_dir=args.checkpoint_dir, resume=args.resume)
+        finally:
+            pg.disconnect()
+
     else:
         raise Exception('Argument command is unknown: {}'.format(args.command))
\ No newline at end of file
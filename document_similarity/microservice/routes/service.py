@@ -11,7 +11,8 @@ import requests
 # Initialize the models
 #################################################
 
-from ..library.document_similarity import DocumentSimilarity
+from ..library.embedding_store import EmbeddingStore
+from ..library.job_queue import JobQueue
 from ..config import config_db
 
 #################################################
@@ -20,6 +21,182 @@ from ..config import config_db
 
 # url to text embedding service
 text_embedding_url = app.config['TEXT_EMBEDDING_URL']
+# url to the batch route of the text embedding service (optional)
+text_embedding_batch_url = app.config['TEXT_EMBEDDING_BATCH_URL']
+# the number of most similar documents stored per document (0 stores all similarities)
+top_k = app.config['SIMILARITY_TOP_K']
+
+
+#################################################
+# Load the resident document embeddings
+#################################################
+
+store = EmbeddingStore(create_listener=config_db.create_db, top_k=top_k)
+try:
+    store.load(config_db.get_db())
+except Exception as e:
+    # the embeddings are loaded with the first request
+    app.logger.warning("Could not load the document embeddings at startup. " + str(e))
+
+
+#################################################
+# Helper functions
+#################################################
+
+def embed_text(text, language):
+    """Creates the text embedding with the text embedding service
+
+    Args:
+        text (str): The text to be embedded.
+        language (str): The language of the text.
+
+    Returns:
+        list(float): The text embedding.
+    """
+
+    # Call the text-embedding-service and produce the embedding
+    params = {'text': text, 'language': language}
+    service_response = (requests.post(url=text_embedding_url, json=params)).json()
+    if 'embedding' in service_response:
+        return service_response['embedding']
+    elif 'error' in service_response:
+        raise Exception(str(service_response['error']))
+    else:
+        raise Exception("Something went wrong when constructing the embedding.")
+
+
+def embed_texts(texts, languages):
+    """Creates the text embeddings of several texts with the text embedding service
+
+    The texts are embedded with a single request to the batch route. If the batch
+    route is not configured or the batch fails, the texts are embedded one by one.
+
+    Args:
+        texts (list(str)): The texts to be embedded.
+        languages (list(str)): The languages of the texts.
+
+    Returns:
+        list: The text embeddings or the exceptions for the texts which could not be embedded.
+    """
+
+    if text_embedding_batch_url:
+        try:
+            params = {'texts': [{'text': text, 'language': language} for text, language in zip(texts, languages)]}
+            service_response = (requests.post(url=text_embedding_batch_url, json=params)).json()
+            if 'embeddings' in service_response:
+                return service_response['embeddings']
+        except Exception as e:
+            app.logger.warning("Could not embed the texts with the batch route. " + str(e))
+
+    embeddings = []
+    for text, language in zip(texts, languages):
+        try:
+            embeddings.append(embed_text(text, language))
+        except Exception as e:
+            embeddings.append(e)
+    return embeddings
+
+
+def retrieve_document_text(pg, document_id):
+    """Retrieves the text of the document from the database
+
+    Args:
+        pg (PostgresQL): The database connection.
+        document_id (int): The ID of the document.
+
+    Returns:
+        str: The full text, the abstract or the title of the document.
+    """
+
+    # Retrieve a vocabulary containing the full text, the abstract and the title of the document from the database.
+    retrieved = pg.retrieve_textual_data(document_id)
+
+    # Take the first that is not empty or None (priorities: full text > abstract > title).
+    document_text = retrieved['fulltext_cleaned']
+    if document_text == "" or document_text is None:
+        document_text = retrieved['abstract']
+    if document_text == "" or document_text is None:
+        document_text = retrieved['title']
+
+    # If none of those are useful, raise an exception
+    if document_text == "" or document_text is None:
+        raise Exception("Could not retrieve any text for the document with ID {}.".format(document_id))
+    return document_text
+
+
+def process_jobs(pg, jobs):
+    """Processes a batch of queued similarity updates
+
+    The documents are embedded together, their similarities are computed with one
+    matrix product and all embeddings and similarities are inserted in a single
+    transaction together with the status of the jobs.
+
+    Args:
+        pg (PostgresQL): The database connection.
+        jobs (list(dict)): The claimed jobs with their 'job_id', 'document_id' and 'language'.
+    """
+
+    # Add the embeddings inserted by the other workers to the resident embeddings
+    store.refresh(pg)
+
+    # Retrieve the texts of the documents; the jobs fail individually
+    valid_jobs, texts = [], []
+    document_ids = set()
+    for job in jobs:
+        try:
+            if store.has_document(job['document_id']) or job['document_id'] in document_ids:
+                raise Exception("The document with ID {} already has an embedding.".format(job['document_id']))
+            texts.append(retrieve_document_text(pg, job['document_id']))
+            valid_jobs.append(job)
+            document_ids.add(job['document_id'])
+        except Exception as e:
+            pg.rollback()
+            pg.finish_jobs([job['job_id']], 'failed', error=str(e))
+
+    # Construct the embeddings of the documents
+    embeddings = embed_texts(texts, [job['language'] for job in valid_jobs])
+    embedded_jobs, new_embeddings = [], []
+    for job, embedding in zip(valid_jobs, embeddings):
+        if isinstance(embedding, Exception):
+            pg.finish_jobs([job['job_id']], 'failed', error="Could not retrieve the embedding. " + str(embedding))
+        else:
+            embedded_jobs.append(job)
+            new_embeddings.append(embedding)
+    if len(embedded_jobs) == 0:
+        return
+
+    job_ids = [job['job_id'] for job in embedded_jobs]
+    new_ids = [job['document_id'] for job in embedded_jobs]
+    try:
+        # Compute the similarities of all documents at once and insert the embeddings,
+        # the similarities and the status of the jobs in one transaction
+        store.insert(pg, new_ids, new_embeddings,
+                     before_commit=lambda connection: connection.finish_jobs(job_ids, 'done', commit=False))
+    except Exception as e:
+        pg.rollback()
+        pg.finish_jobs(job_ids, 'failed', error="Could not add the embeddings and the similarities. " + str(e))
+
+
+#################################################
+# Start the background workers of the job queue
+#################################################
+
+queue_config = app.config['SIMILARITY_QUEUE']
+queue = JobQueue(
+    create_db=config_db.create_db,
+    process=process_jobs,
+    n_workers=queue_config['workers'],
+    batch_size=queue_config['batch_size'],
+    poll_interval=queue_config['poll_interval'],
+    job_timeout=queue_config['job_timeout'],
+    context=app._get_current_object().app_context
+)
+try:
+    config_db.get_db().create_jobs_table()
+    if queue_config['workers'] > 0:
+        queue.start()
+except Exception as e:
+    app.logger.warning("Could not start the similarity job queue. " + str(e))
 
 
 #################################################
@@ -53,86 +230,192 @@ def update_similarities():
         try:
             document_id = request.args.get('document_id', default=None, type=int)
             language = request.args.get('language', default='en', type=str)
+            queued = request.args.get('async', default='false', type=str).lower() == 'true'
         except Exception as e:
             return abort(401, "Could not retrieve parameter 'document_id'. " + str(e))
     elif request.method == 'POST':
         try:
             document_id = request.json['document_id']
             language = request.json['language']
+            queued = bool(request.json.get('async', False))
         except Exception as e:
             return abort(401, "Could not retrieve parameter 'document_id'. " + str(e))
     else:
         return abort(405)
 
+    if queued:
+        # Queue the update and return immediately
+        try:
+            jobs = pg.insert_jobs([document_id], language)
+            queue.notify()
+        except Exception as e:
+            return abort(502, "Could not queue the similarity update. " + str(e))
+        return jsonify(format_job(dict(jobs[0], status='pending'))), 202
+
     # Retrieve the embeddings from the database
     try:
-        # Retrieve IDs and embeddings of documents in the database
-        indices, embeddings = pg.retrieve_embeddings()
+        # Add the embeddings inserted by the other workers to the resident embeddings
+        store.refresh(pg)
+        indices = store.get_indices()
     except Exception as e:
         return abort(502, "Could not retrieve document embeddings from the database. " + str(e))
 
+    # The similarities of a document are inserted only once
+    if store.has_document(document_id):
+        return abort(400, "The document with ID {} already has an embedding.".format(document_id))
+
     # Retrieve the document's text from the database
     try:
-        # Retrieve a vocabulary containing the full text, the abstract and the title of the document from the database.
-        retrieved = pg.retrieve_textual_data(document_id)
-
-        # Take the first that is not empty or None (priorities: full text > abstract > title).
-        document_text = retrieved['fulltext_cleaned']
-        if document_text == "" or document_text is None:
-            document_text = retrieved['abstract']
-        if document_text == "" or document_text is None:
-            document_text = retrieved['title']
-
-        # If none of those are useful, raise an exception
-        if document_text == "" or document_text is None:
-            raise Exception("Could not retrieve any text for the document with ID {}.".format(document_id))
+        document_text = retrieve_document_text(pg, document_id)
     except Exception as e:
         return abort(502, "Something went wrong when retrieving the text of the document from the database. "+str(e))
 
     # Construct the new document's embedding
     try:
-        # Call the text-embedding-service and produce the embedding
-        params = {'text': document_text, 'language': language}
-        service_response = (requests.post(url=text_embedding_url, json=params)).json()
-        if 'embedding' in service_response:
-            new_embedding = service_response['embedding']
-        elif 'error' in service_response:
-            raise Exception(str(service_response['error']))
-        else:
-            raise Exception("Something went wrong when constructing the embedding.")
+        new_embedding = embed_text(document_text, language)
     except Exception as e:
         return abort(502, "Could not retrieve the embedding from the text embedding service. " + str(e))
 
-    # Compute similarities with other documents
+    # Compute similarities with other documents and insert them into the database
+    try:
+        # Insert the new embedding (indexed by document_id) into 'document_embeddings' table and the similarity
+        # scores between the document and the other documents into 'similarities' table in one transaction; with
+        # top_k > 0 only the similarities which are among the top_k of either document are inserted
+        additional_similarities = store.insert(pg, [document_id], [new_embedding])
+    except Exception as e:
+        return abort(502, "Could not add the new embedding and the additional similarities into the database. " + str(e))
+
+    # Return the result
+    return jsonify({
+        "embedding": new_embedding,
+        "additional similarities": additional_similarities,
+        "indices": indices
+    })
+
+
+#################################################
+# Routes for the queued similarity updates
+#################################################
+
+def format_job(job):
+    """Converts the job into a JSON serializable dictionary"""
+    return {key: value.isoformat() if hasattr(value, 'isoformat') else value for key, value in job.items()}
+
+
+@bp.route('/jobs', methods=['POST'])
+def create_jobs():
+    # Retrieve the documents whose similarities are updated
+    try:
+        document_ids = [int(document_id) for document_id in request.json['document_ids']]
+        language = request.json.get('language', 'en')
+    except Exception as e:
+        return abort(401, "Could not retrieve parameter 'document_ids'. " + str(e))
+
+    # Queue the updates
+    try:
+        jobs = config_db.get_db().insert_jobs(document_ids, language)
+        queue.notify()
+    except Exception as e:
+        return abort(502, "Could not queue the similarity updates. " + str(e))
+
+    return jsonify({
+        "jobs": [format_job(dict(job, status='pending')) for job in jobs]
+    }), 202
+
+
+@bp.route('/jobs', methods=['GET'])
+def get_jobs():
+    # Retrieve the comma separated job IDs
+    try:
+        job_ids = [int(job_id) for job_id in request.args.get('job_ids', default='', type=str).split(',') if job_id]
+    except Exception as e:
+        return abort(400, "Could not retrieve parameter 'job_ids'. " + str(e))
+
+    try:
+        jobs = config_db.get_db().retrieve_jobs(job_ids)
+    except Exception as e:
+        return abort(502, "Could not retrieve the similarity jobs. " + str(e))
+
+    return jsonify({
+        "jobs": [format_job(job) for job in jobs]
+    })
+
+
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
     try:
-        # initialize the model
-        similarity = DocumentSimilarity(embedding=embeddings, indices=indices)
-        # retrieve the new similarities to be added to the table
-        additional_similarities = similarity.new_document(document_id, new_embedding)
+        jobs = config_db.get_db().retrieve_jobs([job_id])
     except Exception as e:
-        return abort(502, "Could not retrieve similarities between documents. " + str(e))
+        return abort(502, "Could not retrieve the similarity job. " + str(e))
 
-    # Insert the new embedding into the database
+    if len(jobs) == 0:
+        return abort(404, "The similarity job with ID {} does not exist.".format(job_id))
+    return jsonify(format_job(jobs[0]))
+
+
+#################################################
+# Route for searching similar documents:
+#################################################
+
+@bp.route('/search', methods=['GET', 'POST'])
+def search():
+    # Retrieve query parameters
     try:
-        # Insert the new embedding (indexed by document_id) into 'document_embeddings' table
-        pg.insert_new_embedding(document_id, new_embedding)
+        if request.method == 'GET':
+            text = request.args.get('text', default=None, type=str)
+            embedding = request.args.get('embedding', default=None, type=str)
+            # the embedding is given as comma separated values
+            embedding = [float(value) for value in embedding.split(',')] if embedding else None
+            language = request.args.get('language', default='en', type=str)
+            k = request.args.get('limit', default=5, type=int)
+            metric = request.args.get('metric', default='dot', type=str)
+        elif request.method == 'POST':
+            text = request.json.get('text', None)
+            embedding = request.json.get('embedding', None)
+            language = request.json.get('language', 'en')
+            k = int(request.json.get('limit', 5))
+            metric = request.json.get('metric', 'dot')
+        else:
+            return abort(405)
+
+        if text is None and embedding is None:
+            raise Exception("Either the parameter 'text' or the parameter 'embedding' must be given.")
+        if metric not in ('dot', 'cosine'):
+            raise Exception("The parameter 'metric' must be 'dot' or 'cosine'.")
     except Exception as e:
-        return abort(502, "Could not add the new embedding into the table 'document_embeddings'. " + str(e))
+        return abort(400, "Could not retrieve the parameters. " + str(e))
+
+    # Add the embeddings inserted by the other workers to the resident embeddings
+    try:
+        if store.has_updates():
+            store.refresh(config_db.get_db())
+    except Exception as e:
+        return abort(502, "Could not retrieve document embeddings from the database. " + str(e))
+
+    # Construct the embedding of the text
+    if embedding is None:
+        try:
+            embedding = embed_text(text, language)
+        except Exception as e:
+            return abort(502, "Could not retrieve the embedding from the text embedding service. " + str(e))
 
-    # Insert similarities into the database
+    # Find the most similar documents
     try:
-        for i, j, sim in additional_similarities:
-            # Insert the similarity score 'sim' between document with id 'i' and document with id 'j' into
-            # 'similarities' table
-            pg.insert_new_similarity(i, j, sim)
+        result = store.search(embedding, k=k, metric=metric)
     except Exception as e:
-        return abort(502, "Could not add the additional similarities into the table 'similarities'. " + str(e))
+        return abort(400, "Could not search the similar documents. " + str(e))
 
     # Return the result
+    params = {
+        "text": text,
+        "language": language,
+        "limit": k,
+        "metric": metric
+    }
     return jsonify({
-        "embedding": new_embedding,
-        "additional similarities": additional_similarities,
-        "indices": indices
+        "query_parameters": params,
+        "similar_documents": [document_id for document_id, _ in result],
+        "similarities": result
     })
 
 
@@ -191,3 +474,10 @@ def get_similarities():
             "similar_documents": result_indices,
             "similarities": result
         })
+
+
+@bp.route('/pool', methods=['GET'])
+def pool_stats():
+    # return the database connection pool statistics of the worker
+    connection_pool = config_db.get_pool()
+    return jsonify(connection_pool.stats() if connection_pool is not None else None)
@@ -0,0 +1,87 @@
+#################################################
+# Embedding Encoding Benchmark
+# Compares the load time and the table size of the
+# document embeddings stored as postgres arrays and
+# as binary float32 and float16 vectors. The rows are
+# written into a temporary table which shadows the
+# 'document_embeddings' table, so the database content
+# is not modified.
+#
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'))
+sys.path.insert(0, _ROOT)
+
+from microservice.library.postgresql import PostgresQL, encode_embedding
+
+
+def create_temporary_table(pg):
+    """Creates the temporary table shadowing the embeddings table"""
+    pg.execute("CREATE TEMPORARY TABLE document_embeddings (LIKE public.document_embeddings INCLUDING DEFAULTS);")
+    pg.execute("ALTER TABLE pg_temp.document_embeddings ADD COLUMN IF NOT EXISTS vector_binary bytea;")
+    pg.execute("ALTER TABLE pg_temp.document_embeddings ALTER COLUMN vector DROP NOT NULL;")
+    pg.commit()
+
+
+def fill_temporary_table(pg, embeddings, encoding):
+    """Stores the embeddings in the given encoding into the temporary table"""
+    pg.execute("TRUNCATE pg_temp.document_embeddings;")
+    if encoding == 'array':
+        statement = "INSERT INTO pg_temp.document_embeddings (document_id, vector) VALUES %s;"
+        values = [(i, embedding) for i, embedding in enumerate(embeddings.tolist())]
+    else:
+        statement = "INSERT INTO pg_temp.document_embeddings (document_id, vector_binary) VALUES %s;"
+        values = [(i, encode_embedding(embedding, encoding)) for i, embedding in enumerate(embeddings)]
+    execute_values(pg.cursor, statement, values, page_size=1000)
+    pg.commit()
+
+
+if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Benchmarks the load time and size of the embedding encodings")
+    argparser.add_argument('-db', '--database', type=str, help="The database name")
+    argparser.add_argument('-u', '--user', type=str, default='postgres', help="The database user (default: 'postgres')")
+    argparser.add_argument('-p', '--password', type=str, help="The database password")
+    argparser.add_argument('--host', type=str, default='127.0.0.1', help="The database host (default: '127.0.0.1')")
+    argparser.add_argument('--port', type=str, default='5432', help="The database port (default: '5432')")
+    argparser.add_argument('-s', '--sizes', type=str, default='10000,100000', help="Comma separated numbers of documents (default: 10000,100000)")
+    argparser.add_argument('-d', '--dimension', type=int, default=300, help="The dimension of the document embeddings (default: 300)")
+    argparser.add_argument('-r', '--repeat', type=int, default=3, help="The number of repetitions of each measurement (default: 3)")
+    args = argparser.parse_args()
+
+    pg = PostgresQL(host=args.host, port=args.port)
+    pg.connect(args.database, user=args.user, password=args.password)
+    if pg.connection is None:
+        raise Exception("Could not connect to the database")
+    create_temporary_table(pg)
+
+    random = np.random.RandomState(0)
+    print("{:>10} {:>10} {:>12} {:>12} {:>10}".format("documents", "encoding", "load [ms]", "size [MB]", "speedup"))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        embeddings = random.randn(size, args.dimension).astype(np.float32)
+        array_time = None
+        for encoding in ['array', 'float32', 'float16']:
+            fill_temporary_table(pg, embeddings, encoding)
+            table_size = pg.execute("SELECT pg_total_relation_size('pg_temp.document_embeddings') AS size;")[0]['size']
+
+            pg.embedding_encoding = encoding
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                indices, loaded = pg.retrieve_embeddings()
+                np.asarray(loaded, dtype=np.float32)
+                times.append(time.perf_counter() - start)
+            load_time = min(times)
+            array_time = array_time or load_time
+
+            print("{:>10} {:>10} {:>12.1f} {:>12.1f} {:>9.1f}x".format(size, encoding, load_time * 1000, table_size / 2 ** 20, array_time / load_time))
+
+    pg.disconnect()
@@ -0,0 +1,66 @@
+#################################################
+# Nearest Neighbors Benchmark
+# Compares the vectorized DocumentSimilarity.k_nearest_neighbors
+# with the per-document similarity loop on corpora
+# of different sizes
+#
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'))
+sys.path.insert(0, _ROOT)
+
+from microservice.library.document_similarity import DocumentSimilarity
+
+
+def measure(function, repeat):
+    """Measures the best execution time of the function in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Benchmarks the k nearest neighbors search on corpora of different sizes")
+    argparser.add_argument('-s', '--sizes', type=str, default='10000,100000,1000000', help="Comma separated numbers of documents (default: 10000,100000,1000000)")
+    argparser.add_argument('-d', '--dimension', type=int, default=300, help="The dimension of the document embeddings (default: 300)")
+    argparser.add_argument('-k', type=int, default=10, help="The number of neighbors (default: 10)")
+    argparser.add_argument('-q', '--queries', type=int, default=100, help="The number of queries in the batched search (default: 100)")
+    argparser.add_argument('-r', '--repeat', type=int, default=3, help="The number of repetitions of each measurement (default: 3)")
+    argparser.add_argument('--loop_limit', type=int, default=100000, help="The largest corpus on which the loop is measured (default: 100000)")
+    args = argparser.parse_args()
+
+    random = np.random.RandomState(0)
+    print("{:>10} {:>10} {:>12} {:>12} {:>18}".format("documents", "metric", "loop [ms]", "vector [ms]", "batched [ms/query]"))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        embeddings = random.randn(size, args.dimension).astype(np.float32)
+        queries = random.randn(args.queries, args.dimension).astype(np.float32)
+        model = DocumentSimilarity(embedding=embeddings, indices=list(range(size)))
+
+        for metric, similarity in [('euclidean', model.euclid_similarity), ('cosine', model.cosine_similarity)]:
+            # the first call also prepares the normalized matrix
+            model.k_nearest_neighbors(queries[0], k=args.k, metric=metric)
+            vector_time, result = measure(lambda: model.k_nearest_neighbors(queries[0], k=args.k, metric=metric), args.repeat)
+            batch_time, _ = measure(lambda: model.k_nearest_neighbors(queries, k=args.k, metric=metric), args.repeat)
+
+            loop_time = float('nan')
+            if size <= args.loop_limit:
+                # the loop implementation used before the vectorization
+                sims = lambda: [similarity(queries[0], d) for d in embeddings]
+                loop_time, sims = measure(sims, 1)
+                order = np.argsort(sims)
+                expected = (order[::-1] if metric == 'cosine' else order)[:args.k].tolist()
+                if not expected == result:
+                    raise Exception("The nearest neighbors do not match for {} documents ({})".format(size, metric))
+
+            print("{:>10} {:>10} {:>12.2f} {:>12.2f} {:>18.3f}".format(size, metric, loop_time * 1000, vector_time * 1000, batch_time * 1000 / args.queries))
@@ -0,0 +1,46 @@
+#################################################
+# Similarity Search Benchmark
+# Measures the latency of the search of the documents
+# most similar to a query embedding on corpora of
+# different sizes
+#
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'))
+sys.path.insert(0, _ROOT)
+
+from microservice.library.document_similarity import DocumentSimilarity
+
+
+if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Benchmarks the similarity search on corpora of different sizes")
+    argparser.add_argument('-s', '--sizes', type=str, default='10000,100000', help="Comma separated numbers of documents (default: 10000,100000)")
+    argparser.add_argument('-d', '--dimension', type=int, default=300, help="The dimension of the document embeddings (default: 300)")
+    argparser.add_argument('-k', type=int, default=10, help="The number of similar documents (default: 10)")
+    argparser.add_argument('-q', '--queries', type=int, default=200, help="The number of queries (default: 200)")
+    args = argparser.parse_args()
+
+    random = np.random.RandomState(0)
+    print("{:>10} {:>8} {:>10} {:>10} {:>10}".format("documents", "metric", "p50 [ms]", "p95 [ms]", "max [ms]"))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        embeddings = random.randn(size, args.dimension).astype(np.float32)
+        model = DocumentSimilarity(embedding=embeddings, indices=list(range(size)))
+        # the queries are received as JSON lists
+        queries = random.randn(args.queries, args.dimension).tolist()
+
+        for metric in ['dot', 'cosine']:
+            times = []
+            for query in queries:
+                start = time.perf_counter()
+                model.search(query, k=args.k, metric=metric)
+                times.append(time.perf_counter() - start)
+            times = np.array(times) * 1000
+            print("{:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}".format(size, metric, np.percentile(times, 50), np.percentile(times, 95), times.max()))
@@ -0,0 +1,88 @@
+#################################################
+# Similarity Insertion Benchmark
+# Compares the bulk insertion of the similarities
+# with the per-row insertion on corpora of different
+# sizes. The rows are written into temporary tables
+# which shadow the service tables, so the database
+# content is not modified.
+#
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'))
+sys.path.insert(0, _ROOT)
+
+from microservice.library.postgresql import PostgresQL
+
+
+def create_temporary_tables(pg):
+    """Creates the temporary tables shadowing the service tables"""
+    pg.execute("CREATE TEMPORARY TABLE document_embeddings (LIKE public.document_embeddings INCLUDING DEFAULTS);")
+    pg.execute("CREATE TEMPORARY TABLE similarities (LIKE public.similarities INCLUDING DEFAULTS);")
+    pg.commit()
+
+
+def clear_temporary_tables(pg):
+    """Removes the rows of the temporary tables"""
+    pg.execute("TRUNCATE pg_temp.document_embeddings, pg_temp.similarities;")
+    pg.commit()
+
+
+def create_rows(document_id, size, random):
+    """Creates the similarity rows of a new document"""
+    rows = []
+    for i, sim in enumerate(random.rand(size).tolist()):
+        rows.append([document_id, i, sim])
+        rows.append([i, document_id, sim])
+    return rows
+
+
+if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Benchmarks the insertion of the similarities of a new document")
+    argparser.add_argument('-db', '--database', type=str, help="The database name")
+    argparser.add_argument('-u', '--user', type=str, default='postgres', help="The database user (default: 'postgres')")
+    argparser.add_argument('-p', '--password', type=str, help="The database password")
+    argparser.add_argument('--host', type=str, default='127.0.0.1', help="The database host (default: '127.0.0.1')")
+    argparser.add_argument('--port', type=str, default='5432', help="The database port (default: '5432')")
+    argparser.add_argument('-s', '--sizes', type=str, default='1000,10000,100000', help="Comma separated numbers of documents (default: 1000,10000,100000)")
+    argparser.add_argument('-d', '--dimension', type=int, default=300, help="The dimension of the document embeddings (default: 300)")
+    argparser.add_argument('--loop_limit', type=int, default=10000, help="The largest corpus on which the per-row insertion is measured (default: 10000)")
+    args = argparser.parse_args()
+
+    pg = PostgresQL(host=args.host, port=args.port)
+    pg.connect(args.database, user=args.user, password=args.password)
+    if pg.connection is None:
+        raise Exception("Could not connect to the database")
+    create_temporary_tables(pg)
+
+    random = np.random.RandomState(0)
+    embedding = random.randn(args.dimension).astype(np.float32).tolist()
+    print("{:>10} {:>10} {:>14} {:>14} {:>10}".format("documents", "rows", "row [rows/s]", "bulk [rows/s]", "speedup"))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        rows = create_rows(size, size, random)
+
+        row_rate = float('nan')
+        if size <= args.loop_limit:
+            # the per-row insertion with a commit after every row used before the bulk insertion
+            start = time.perf_counter()
+            pg.insert_new_embedding(size, embedding)
+            for i, j, sim in rows:
+                pg.insert_new_similarity(i, j, sim)
+            row_rate = len(rows) / (time.perf_counter() - start)
+            clear_temporary_tables(pg)
+
+        start = time.perf_counter()
+        pg.insert_new_document(size, embedding, rows)
+        bulk_rate = len(rows) / (time.perf_counter() - start)
+        clear_temporary_tables(pg)
+
+        print("{:>10} {:>10} {:>14.0f} {:>14.0f} {:>9.1f}x".format(size, len(rows), row_rate, bulk_rate, bulk_rate / row_rate))
+
+    pg.disconnect()
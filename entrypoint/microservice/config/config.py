@@ -13,6 +13,14 @@ class Config(object):
     CORS = {
         'origins': os.getenv('CORS_ORIGINS').split(',') if os.getenv('CORS_ORIGINS') else None
     }
+    # the pool of the database connections of each worker process (0 disables the pool)
+    DATABASE_POOL = {
+        'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 30)),
+        'statement_timeout': int(os.getenv('DATABASE_STATEMENT_TIMEOUT', 0)),
+        'health_check_interval': float(os.getenv('DATABASE_POOL_HEALTH_CHECK_INTERVAL', 30))
+    }
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -2,11 +2,44 @@
 # Contains methods for establishing and
 # closing connection with the database
 
+import os
+import threading
+
 from flask import current_app, g
 
 # ! modify for different database
 # import postgresql library
 from ..library.postgresql import PostgresQL
+from ..library.connection_pool import ConnectionPool
+
+# the connection pool of the worker process
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Gets or creates the connection pool of the worker process
+    Returns:
+        obj: The connection pool or None if the pool is disabled.
+    """
+
+    global pool
+    settings = current_app.config['DATABASE_POOL']
+    if settings['max_size'] <= 0:
+        return None
+
+    with pool_lock:
+        # the connections are not shared with the forked worker processes
+        if pool is None or pool.pid() != os.getpid():
+            pool = ConnectionPool(
+                database=current_app.config['DB_NAME'],
+                user=current_app.config['DB_USER'],
+                password=current_app.config['DB_PASSWORD'],
+                host=current_app.config.get('DB_HOST'),
+                port=current_app.config.get('DB_PORT'),
+                **settings
+            )
+    return pool
 
 
 def get_db():
@@ -23,13 +56,23 @@ def get_db():
         # initialize db object
         g.db = PostgresQL(host=host, port=port)
 
-        # get database and password for establishing the connection
-        database = current_app.config['DB_NAME']
-        user = current_app.config['DB_USER']
-        password = current_app.config['DB_PASSWORD']
+        try:
+            connection_pool = get_pool()
+        except Exception as e:
+            current_app.logger.warning("Could not create the connection pool. " + str(e))
+            connection_pool = None
+
+        if connection_pool is not None:
+            # borrow the connection from the pool
+            g.db.connect_pool(connection_pool)
+        else:
+            # get database and password for establishing the connection
+            database = current_app.config['DB_NAME']
+            user = current_app.config['DB_USER']
+            password = current_app.config['DB_PASSWORD']
 
-        # connect to the database
-        g.db.connect(database, user=user, password=password)
+            # connect to the database
+            g.db.connect(database, user=user, password=password)
 
     # return the database connection
     return g.db
@@ -4,7 +4,9 @@
 #   /documents/id
 #   /documents/id/similar
 #   /documents/id/similarity_update
+#   /documents/similarity_jobs/id
 #   /documents/retrieve
+#   /documents/pool
 
 import sys
 import requests
@@ -133,17 +135,39 @@ def update_document_similarities(doc_id):
     """
     Make a request with POST method to this endpoint.
 
+    The update is queued in the document similarity service and the response
+    contains the `job_id` whose status is available at the
+    /similarity_jobs/<job_id> endpoint. With the query parameter sync=true
+    the response is returned after the similarities are updated.
+
     Example request:
     {BASE_URL}/api/v1/documents/id/similarity_update
     """
 
     HOST = app.config.get('SIMILARITY_HOST')
     PORT = app.config.get('SIMILARITY_PORT')
+    sync = request.args.get('sync', 'false').lower() == 'true'
     query_params = {
         'document_id': doc_id,
+        'async': 'false' if sync else 'true'
     }
     r = requests.get(f"http://{HOST}:{PORT}/api/v1/similarity/new_document_embedding", params=query_params)
-    return jsonify(r.json())
+    return jsonify(r.json()), r.status_code
+
+@bp.route('/similarity_jobs/<int:job_id>', methods=['GET'])
+def get_similarity_job(job_id):
+    """
+    Make a request with GET method to this endpoint to retrieve the status
+    ('pending', 'running', 'done' or 'failed') of a queued similarity update.
+
+    Example request:
+    {BASE_URL}/api/v1/documents/similarity_jobs/42
+    """
+
+    HOST = app.config.get('SIMILARITY_HOST')
+    PORT = app.config.get('SIMILARITY_PORT')
+    r = requests.get(f"http://{HOST}:{PORT}/api/v1/similarity/jobs/{job_id}")
+    return jsonify(r.json()), r.status_code
 
 @bp.route('/search', methods=['GET'])
 def search_documents():
@@ -179,7 +203,16 @@ def search_documents():
         'languages': request.args.get('languages', default=None),
         'informea': request.args.get('informea', default=None),
         'limit': request.args.get('limit', default=None),
-        'page': request.args.get('page', default=None)
+        'page': request.args.get('page', default=None),
+        'cursor': request.args.get('cursor', default=None),
+        'exact_total': request.args.get('exact_total', default=None)
     }
     r = requests.get(f"http://{HOST}:{PORT}/api/v1/search", params=query_params)
     return jsonify(r.json())
+
+
+@bp.route('/pool', methods=['GET'])
+def pool_stats():
+    # return the database connection pool statistics of the worker
+    connection_pool = config_db.get_pool()
+    return jsonify(connection_pool.stats() if connection_pool is not None else None)
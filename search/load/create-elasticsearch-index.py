@@ -1,6 +1,12 @@
+import copy
+import time
+import queue
 import string
+import argparse
+import threading
 
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
+from psycopg2 import sql
 import pycountry
 from ..search.library.postgresql import PostgresQL
 from ..search.config import config
@@ -20,8 +26,454 @@ month_conversion = {
     "Dec": "12"
 }
 
+# the settings and the mappings of the index
+INDEX_BODY = {
+    "settings": {
+        "index": {
+            "max_result_window": 500000,
+            "max_inner_result_window": 500000
+        },
+        "analysis": {
+            "normalizer": {
+                "lowercase_normalizer": {
+                    "type": "custom",
+                    "char_filter": [],
+                    "filter": ["lowercase", "asciifolding"]
+                }
+            }
+        }
+    },
+    "mappings": {
+        "properties": {
+            "document_id": { "type": "keyword" },
+            "title": { "type": "text" },
+            "abstract": { "type": "text" },
+            "fulltext": { "type": "text" },
+            "name": { "type": "text" },
+            "link": { "type": "keyword" },
+
+            "category": { "type": "keyword" },
+            "date": { "type": "date" },
+
+            "basin": { "type": "keyword" },
+            "source": { "type": "keyword" },
+            "status": { "type": "text" },
+            "celex": { "type": "keyword" },
+
+            "ref_number": { "type": "keyword" },
+
+            "named_entities": {
+                "type": "nested",
+                "properties": {
+                    "name": {
+                        "type": "keyword",
+                        "normalizer": "lowercase_normalizer"
+                    },
+                    "type": { "type": "keyword" }
+                }
+            },
+
+            "wikipedia": {
+                "type": "nested",
+                "properties": {
+                    "name": { "type": "text" },
+                    "cosine": { "type": "float" },
+                    "pagerank": { "type": "float" },
+                    "lang": { "type": "keyword" },
+                    "url": { "type": "keyword" }
+                }
+            },
+            # "informea" is an array of strings
+            # "keywords" is an array of strings
+            # "languages" is an array of strings
+            # "areas" is an array of strings
+            # "subjects" is an array of strings
+        }
+    }
+}
+
+# the statement retrieving the documents satisfying the condition
+DOCUMENTS_STATEMENT = """
+    WITH KEYWORDS AS (
+        SELECT
+            document_id,
+            array_agg(DISTINCT keyword ORDER BY keyword) AS keywords
+        FROM document_keywords
+        GROUP BY document_id
+    ),
+    LANGUAGES AS (
+        SELECT
+            document_id,
+            array_agg(DISTINCT language ORDER BY language) AS languages
+        FROM document_languages
+        GROUP BY document_id
+    ),
+    WIKIPEDIA AS (
+        SELECT
+            document_id,
+            json_agg(json_build_object('name', wikipedia_term, 'cosine', cosine, 'pagerank', pagerank, 'lang', w.language, 'url', w.url)) AS wikipedia
+        FROM wikipedia_annotations
+        LEFT JOIN wikipedia_concepts w ON w.concept_name = wikipedia_annotations.wikipedia_term
+        GROUP BY document_id
+    ),
+    INFORMEA AS (
+        SELECT
+            document_id,
+            array_agg(DISTINCT o.term ORDER BY o.term) AS informea
+        FROM ontology_annotations
+        LEFT JOIN ontology_terms o ON o.term = ontology_annotations.term
+        GROUP BY document_id
+    ),
+    NAMED_ENTITIES AS (
+        SELECT
+            document_id,
+            json_agg(json_build_object('name', ne.entity_name, 'type', ne.type)) AS named_entities
+        FROM ne_annotations
+        LEFT JOIN named_entities ne ON ne.entity_name = ne_annotations.named_entity
+        WHERE ne.type IN ('PERSON', 'LOCATION', 'ORGANIZATION', 'MISC')
+        GROUP BY document_id
+    ),
+    AREAS AS (
+        SELECT
+            document_id,
+            array_agg(DISTINCT area ORDER BY area) AS areas
+        FROM document_areas
+        GROUP BY document_id
+    ),
+    SUBJECTS AS (
+        SELECT
+            document_id,
+            array_agg(DISTINCT subject ORDER BY subject) AS subjects
+        FROM document_subjects
+        GROUP BY document_id
+    )
+
+    SELECT
+        d.document_id,
+        d.title,
+        d.abstract,
+        d.fulltext_cleaned AS fulltext,
+        d.fulltextlink AS link,
+        d.name,
+        d.date,
+
+        d.basin,
+        d.document_source AS source,
+        d.status,
+        d.celex_num AS celex,
+
+        d.publisher,
+        d.referencenumber AS reference_number,
+
+        ne.named_entities AS named_entities,
+        w.wikipedia AS wikipedia,
+        i.informea AS informea,
+        k.keywords AS keywords,
+        l.languages AS languages,
+        a.areas AS areas,
+        s.subjects AS subjects
+    FROM documents d
+    LEFT JOIN KEYWORDS k ON k.document_id = d.document_id
+    LEFT JOIN LANGUAGES l ON l.document_id = d.document_id
+    LEFT JOIN WIKIPEDIA w ON w.document_id = d.document_id
+    LEFT JOIN INFORMEA i ON i.document_id = d.document_id
+    LEFT JOIN NAMED_ENTITIES ne ON ne.document_id = d.document_id
+    LEFT JOIN AREAS a ON a.document_id = d.document_id
+    LEFT JOIN SUBJECTS s ON s.document_id = d.document_id
+    WHERE {condition}
+    ORDER BY d.document_id;
+"""
+
+
+def format_document(document):
+    """Formats the document retrieved from the database for the index
+
+    Args:
+        document (dict): The document record.
+
+    Returns:
+        dict: The formatted document.
+
+    """
+
+    if "date" in document and document["date"]:
+        # format the date value
+
+        if "/" in document["date"]:
+            date = document["date"].split("/")
+            document["date"] = "{}-{}-{}".format(date[2], date[1], date[0])
+
+        elif " " in document["date"]:
+            date = document["date"].split(" ")
+            day = '0{}'.format(date[1][:-1])[-2:]
+            month = month_conversion[date[0]]
+            document["date"] = "{}-{}-{}".format(date[2], month, day)
+
+        elif len(document["date"]) == 4:
+            document["date"] = "{}-01-01".format(document["date"])
+
+    elif "date" in document and document["date"] == '':
+        document["date"] = None
+
+    # limit the number of entities
+    document["named_entities"] = document["named_entities"][:5000] if document["named_entities"] else None
+    document["wikipedia"] = document["wikipedia"][:5000] if document["wikipedia"] else None
+
+    if "informea" in document and document["informea"]:
+        document["informea"] = [informea.strip() for informea in document["informea"][:5000]]
+
+    if "keywords" in document and document["keywords"]:
+        keywords = []
+        for keyword in document["keywords"][:5000]:
+            keyword_split = keyword.split(", ")
+            keywords = keywords + [k.strip() for k in keyword_split]
+        document["keywords"] = keywords
+
+    if "areas" in document and document["areas"]:
+        areas = []
+        for area in document["areas"][:5000]:
+            area_split = area.split(", ")
+            areas = areas + [a.strip() for a in area_split]
+        document["areas"] = areas
+
+    if "subjects" in document and document["subjects"]:
+        subjects = []
+        for subject in document["subjects"][:5000]:
+            subject_split = subject.split(", ")
+            subjects = subjects + [s.strip() for s in subject_split]
+        document["subjects"] = subjects
+
+    if "languages" in document and document["languages"]:
+        langs = []
+        for lang in document["languages"][:5000]:
+            if len(lang) == 2:
+                language = pycountry.languages.get(alpha_2=lang)
+                if language is not None:
+                    langs.append(language.capitalize())
+            else:
+                langs.append(lang.capitalize())
+
+        document["languages"] = langs
+
+    return document
+
+
+def prefetch(records, size=1000):
+    """Iterates the records in a background thread
+
+    The records are retrieved while the previous ones are processed. At most
+    size records are held in memory at once.
+
+    Args:
+        records (generator): The records.
+        size (int): The maximum number of prefetched records. (Default = 1000)
+
+    Returns:
+        generator: The records.
+
+    """
+
+    # marks the end of the records
+    end = object()
+    buffer = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for record in records:
+                # stop retrieving if the consumer is gone
+                while not stopped.is_set():
+                    try:
+                        buffer.put(record, timeout=1)
+                        break
+                    except queue.Full:
+                        pass
+                if stopped.is_set():
+                    return
+            buffer.put(end)
+        except Exception as e:
+            buffer.put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            record = buffer.get()
+            if record is end:
+                break
+            if isinstance(record, Exception):
+                raise record
+            yield record
+    finally:
+        stopped.set()
+
+
+def generate_actions(documents, index):
+    """Generates the bulk index actions of the documents
+
+    Args:
+        documents (generator): The document records.
+        index (str): The name of the index.
+
+    Returns:
+        generator: The bulk index actions.
+
+    """
+
+    for document in documents:
+        yield {
+            "_index": index,
+            "_id": document["document_id"],
+            "_source": format_document(document)
+        }
+
+
+def index_documents(es, actions, chunk_size=500, threads=4, max_chunk_bytes=50):
+    """Sends the documents to the index with the bulk API
+
+    Args:
+        es (Elasticsearch): The elasticsearch client.
+        actions (generator): The bulk index actions.
+        chunk_size (int): The number of documents sent in one bulk request. (Default = 500)
+        threads (int): The number of threads sending the bulk requests. (Default = 4)
+        max_chunk_bytes (int): The maximum size of a bulk request in megabytes. (Default = 50)
+
+    Returns:
+        tuple(int): The number of indexed and failed documents.
+
+    """
+
+    options = {
+        "chunk_size": chunk_size,
+        "max_chunk_bytes": max_chunk_bytes * 1024 * 1024,
+        "raise_on_error": False,
+        "raise_on_exception": False
+    }
+    if threads > 1:
+        results = helpers.parallel_bulk(es, actions, thread_count=threads, queue_size=threads, **options)
+    else:
+        results = helpers.streaming_bulk(es, actions, **options)
+
+    start = time.time()
+    indexed, failed = 0, 0
+    for ok, result in results:
+        if ok:
+            indexed += 1
+        else:
+            failed += 1
+            print("Failed to index document:", result)
+        if (indexed + failed) % 10000 == 0:
+            print("Number of indexed documents: {} ({:.0f} documents/s)".format(indexed, indexed / (time.time() - start)))
+    return indexed, failed
+
+
+def create_index(es, alias):
+    """Creates a new version of the index
+
+    The index is neither refreshed nor replicated until it is populated.
+
+    Args:
+        es (Elasticsearch): The elasticsearch client.
+        alias (str): The alias under which the index is searched.
+
+    Returns:
+        str: The name of the new index.
+
+    """
+
+    index = "{}_{}".format(alias, time.strftime("%Y%m%d%H%M%S"))
+    body = copy.deepcopy(INDEX_BODY)
+    body["settings"]["index"].update({
+        "refresh_interval": "-1",
+        "number_of_replicas": 0
+    })
+    es.indices.create(index=index, body=body)
+    return index
+
+
+def swap_alias(es, alias, index, delete_old=True):
+    """Points the alias to the new index in one atomic step
+
+    Args:
+        es (Elasticsearch): The elasticsearch client.
+        alias (str): The alias under which the index is searched.
+        index (str): The name of the new index.
+        delete_old (bool): If True, the indices previously under the alias are deleted. (Default = True)
+
+    """
+
+    actions = [{ "add": { "index": index, "alias": alias } }]
+    old_indices = []
+    if es.indices.exists_alias(name=alias):
+        old_indices = [name for name in es.indices.get_alias(name=alias) if name != index]
+        actions = [{ "remove": { "index": name, "alias": alias } } for name in old_indices] + actions
+    elif es.indices.exists(index=alias):
+        # the index created before the versioned indices is replaced by the alias
+        actions = [{ "remove_index": { "index": alias } }] + actions
+
+    es.indices.update_aliases(body={ "actions": actions })
+    if delete_old:
+        for name in old_indices:
+            es.indices.delete(index=name, ignore=[404])
+
+
+def get_high_water_mark(es, alias, column):
+    """Retrieves the high-water mark of the documents in the index
+
+    Args:
+        es (Elasticsearch): The elasticsearch client.
+        alias (str): The alias under which the index is searched.
+        column (str): The documents column of the high-water mark.
+
+    Returns:
+        obj: The largest column value of the indexed documents or None if it is not known.
+
+    """
+
+    if not es.indices.exists_alias(name=alias):
+        return None
+    for mapping in es.indices.get_mapping(index=alias).values():
+        meta = mapping.get("mappings", {}).get("_meta", {})
+        if meta.get("high_water_column") == column:
+            return meta.get("high_water_mark")
+    return None
+
+
+def set_high_water_mark(es, index, column, mark):
+    """Stores the high-water mark of the documents in the index metadata
+
+    Args:
+        es (Elasticsearch): The elasticsearch client.
+        index (str): The name of the index.
+        column (str): The documents column of the high-water mark.
+        mark (obj): The largest column value of the indexed documents.
+
+    """
+
+    es.indices.put_mapping(index=index, body={
+        "_meta": {
+            "high_water_column": column,
+            "high_water_mark": mark if mark is None or isinstance(mark, (int, float)) else str(mark)
+        }
+    })
+
 
 if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Creates and populates the elasticsearch index")
+    argparser.add_argument('-i', '--index', type=str, default='envirolens', help="The alias under which the index is searched (default: envirolens)")
+    argparser.add_argument('-c', '--chunk_size', type=int, default=500, help="The number of documents sent in one bulk request (default: 500)")
+    argparser.add_argument('-t', '--threads', type=int, default=4, help="The number of threads sending the bulk requests (default: 4)")
+    argparser.add_argument('--max_chunk_bytes', type=int, default=50, help="The maximum size of a bulk request in megabytes (default: 50)")
+    argparser.add_argument('-f', '--fetch_size', type=int, default=1000, help="The number of documents retrieved from the database at once (default: 1000)")
+    argparser.add_argument('--replicas', type=int, default=1, help="The number of replicas after the load (default: 1)")
+    argparser.add_argument('--refresh_interval', type=str, default='1s', help="The refresh interval after the load (default: 1s)")
+    argparser.add_argument('--incremental', action='store_true', help="Only adds the documents above the high-water mark to the current index")
+    argparser.add_argument('--high_water_column', type=str, default='document_id', help="The documents column tracking the new documents, e.g. a modification time (default: document_id)")
+    argparser.add_argument('--keep_old', action='store_true', help="Keeps the previous versions of the index after the alias is swapped")
+    argparser.add_argument('--max_failures', type=int, default=0, help="The number of documents which may fail to be indexed before the load is aborted (default: 0)")
+    args = argparser.parse_args()
+
     database = config.ProductionConfig.DATABASE["database"]
     password = config.ProductionConfig.DATABASE["password"]
 
@@ -30,244 +482,74 @@ if __name__=='__main__':
     pg = PostgresQL()
     pg.connect(database, password)
     # prepare elasticsearch connection
-    print("Prepare elasticsearch index")
     es = Elasticsearch()
-    # delete the envirolens index, if existing
-    es.indices.delete(index='envirolens', ignore=[400, 404])
-    # create a new, fresh index
-    es.indices.create(index='envirolens', ignore=400, body={
-        "settings": {
-            "index": {
-                "max_result_window": 500000,
-                "max_inner_result_window": 500000
-            },
-            "analysis": {
-                "normalizer": {
-                    "lowercase_normalizer": {
-                        "type": "custom",
-                        "char_filter": [],
-                        "filter": ["lowercase", "asciifolding"]
-                    }
-                }
-            }
-        },
-        "mappings": {
-            "properties": {
-                "document_id": { "type": "keyword" },
-                "title": { "type": "text" },
-                "abstract": { "type": "text" },
-                "fulltext": { "type": "text" },
-                "name": { "type": "text" },
-                "link": { "type": "keyword" },
-
-                "category": { "type": "keyword" },
-                "date": { "type": "date" },
-
-                "basin": { "type": "keyword" },
-                "source": { "type": "keyword" },
-                "status": { "type": "text" },
-                "celex": { "type": "keyword" },
-
-                "ref_number": { "type": "keyword" },
-
-                "named_entities": {
-                    "type": "nested",
-                    "properties": {
-                        "name": {
-                            "type": "keyword",
-                            "normalizer": "lowercase_normalizer"
-                        },
-                        "type": { "type": "keyword" }
-                    }
-                },
-
-                "wikipedia": {
-                    "type": "nested",
-                    "properties": {
-                        "name": { "type": "text" },
-                        "cosine": { "type": "float" },
-                        "pagerank": { "type": "float" },
-                        "lang": { "type": "keyword" },
-                        "url": { "type": "keyword" }
-                    }
-                },
-                # "informea" is an array of strings
-                # "keywords" is an array of strings
-                # "languages" is an array of strings
-                # "areas" is an array of strings
-                # "subjects" is an array of strings
-            }
-        }
-    })
-
-    print("Get documents from postgres")
-    # get the documents from the database
-    statement = """
-        WITH KEYWORDS AS (
-            SELECT
-                document_id,
-                array_agg(DISTINCT keyword ORDER BY keyword) AS keywords
-            FROM document_keywords
-            GROUP BY document_id
-        ),
-        LANGUAGES AS (
-            SELECT
-                document_id,
-                array_agg(DISTINCT language ORDER BY language) AS languages
-            FROM document_languages
-            GROUP BY document_id
-        ),
-        WIKIPEDIA AS (
-            SELECT
-                document_id,
-                json_agg(json_build_object('name', wikipedia_term, 'cosine', cosine, 'pagerank', pagerank, 'lang', w.language, 'url', w.url)) AS wikipedia
-            FROM wikipedia_annotations
-            LEFT JOIN wikipedia_concepts w ON w.concept_name = wikipedia_annotations.wikipedia_term
-            GROUP BY document_id
-        ),
-        INFORMEA AS (
-            SELECT
-                document_id,
-                array_agg(DISTINCT o.term ORDER BY o.term) AS informea
-            FROM ontology_annotations
-            LEFT JOIN ontology_terms o ON o.term = ontology_annotations.term
-            GROUP BY document_id
-        ),
-        NAMED_ENTITIES AS (
-            SELECT
-                document_id,
-                json_agg(json_build_object('name', ne.entity_name, 'type', ne.type)) AS named_entities
-            FROM ne_annotations
-            LEFT JOIN named_entities ne ON ne.entity_name = ne_annotations.named_entity
-            WHERE ne.type IN ('PERSON', 'LOCATION', 'ORGANIZATION', 'MISC')
-            GROUP BY document_id
-        ),
-        AREAS AS (
-            SELECT
-                document_id,
-                array_agg(DISTINCT area ORDER BY area) AS areas
-            FROM document_areas
-            GROUP BY document_id
-        ),
-        SUBJECTS AS (
-            SELECT
-                document_id,
-                array_agg(DISTINCT subject ORDER BY subject) AS subjects
-            FROM document_subjects
-            GROUP BY document_id
-        )
 
-        SELECT
-            d.document_id,
-            d.title,
-            d.abstract,
-            d.fulltext_cleaned AS fulltext,
-            d.fulltextlink AS link,
-            d.name,
-            d.date,
-
-            d.basin,
-            d.document_source AS source,
-            d.status,
-            d.celex_num AS celex,
-
-            d.publisher,
-            d.referencenumber AS reference_number,
-
-            ne.named_entities AS named_entities,
-            w.wikipedia AS wikipedia,
-            i.informea AS informea,
-            k.keywords AS keywords,
-            l.languages AS languages,
-            a.areas AS areas,
-            s.subjects AS subjects
-        FROM documents d
-        LEFT JOIN KEYWORDS k ON k.document_id = d.document_id
-        LEFT JOIN LANGUAGES l ON l.document_id = d.document_id
-        LEFT JOIN WIKIPEDIA w ON w.document_id = d.document_id
-        LEFT JOIN INFORMEA i ON i.document_id = d.document_id
-        LEFT JOIN NAMED_ENTITIES ne ON ne.document_id = d.document_id
-        LEFT JOIN AREAS a ON a.document_id = d.document_id
-        LEFT JOIN SUBJECTS s ON s.document_id = d.document_id
-        ORDER BY d.document_id;
-    """
+    column = sql.SQL("d.{}").format(sql.Identifier(args.high_water_column))
+    # the documents added while the index is populated are left for the next run
+    high_water_mark = pg.execute(sql.SQL("SELECT MAX({}) AS mark FROM documents d;").format(column))[0]["mark"]
+
+    if args.incremental:
+        previous_mark = get_high_water_mark(es, args.index, args.high_water_column)
+        if previous_mark is None:
+            raise Exception("No high-water mark for the column '{}' in the index '{}', run a full load first.".format(args.high_water_column, args.index))
+        # the documents are upserted into the index currently under the alias
+        index = args.index
+        condition = sql.SQL("{} > %(previous)s AND {} <= %(mark)s").format(column, column)
+        print("Update elasticsearch index", index, "from", previous_mark, "to", high_water_mark)
+    else:
+        previous_mark = None
+        print("Prepare elasticsearch index")
+        index = create_index(es, args.index)
+        condition = sql.SQL("({} <= %(mark)s OR {} IS NULL)").format(column, column)
+        print("Created index", index)
 
-    documents = pg.execute(statement)
-    print("Number of documents", len(documents))
+    print("Get documents from postgres")
+    statement = sql.SQL(DOCUMENTS_STATEMENT).format(condition=condition)
+    params = { "previous": previous_mark, "mark": high_water_mark }
+    # the documents are streamed from a server-side cursor and retrieved while
+    # the previous ones are formatted and sent to the index
+    documents = prefetch(pg.iter_execute(statement, params, itersize=args.fetch_size), size=args.fetch_size)
 
     print("Populate elasticsearch index")
-    count = 1
-    # send the documents to the index
-    for document in documents:
-        if "date" in document and document["date"]:
-            # format the date value
-
-            if "/" in document["date"]:
-                date = document["date"].split("/")
-                document["date"] = "{}-{}-{}".format(date[2], date[1], date[0])
-
-            elif " " in document["date"]:
-                date = document["date"].split(" ")
-                day = '0{}'.format(date[1][:-1])[-2:]
-                month = month_conversion[date[0]]
-                document["date"] = "{}-{}-{}".format(date[2], month, day)
-
-            elif len(document["date"]) == 4:
-                document["date"] = "{}-01-01".format(document["date"])
-
-        elif "date" in document and document["date"] == '':
-            document["date"] = None
-
-        # limit the number of entities
-        document["named_entities"] = document["named_entities"][:5000] if document["named_entities"] else None
-        document["wikipedia"] = document["wikipedia"][:5000] if document["wikipedia"] else None
-
-        if "informea" in document and document["informea"]:
-            document["informea"] = [informea.strip() for informea in document["informea"][:5000]]
-
-        if "keywords" in document and document["keywords"]:
-            keywords = []
-            for keyword in document["keywords"][:5000]:
-                keyword_split = keyword.split(", ")
-                keywords = keywords + [k.strip() for k in keyword_split]
-            document["keywords"] = keywords
-
-        if "areas" in document and document["areas"]:
-            areas = []
-            for area in document["areas"][:5000]:
-                area_split = area.split(", ")
-                areas = areas + [a.strip() for a in area_split]
-            document["areas"] = areas
-
-        if "subjects" in document and document["subjects"]:
-            subjects = []
-            for subject in document["subjects"][:5000]:
-                subject_split = subject.split(", ")
-                subjects = subjects + [s.strip() for s in subject_split]
-            document["subjects"] = subjects
-
-        if "languages" in document and document["languages"]:
-            langs = []
-            for lang in document["languages"][:5000]:
-                if len(lang) == 2:
-                    language = pycountry.languages.get(alpha_2=lang)
-                    if language is not None:
-                        langs.append(language.capitalize())
-                else:
-                    langs.append(lang.capitalize())
-
-            document["languages"] = langs
-        es.index(index="envirolens", id=document["document_id"], body=document)
-        if count % 1000 == 0:
-            print("Number of indexed documents:", count)
-        count = count + 1
+    start = time.time()
+    try:
+        # send the documents to the index in bulk requests
+        indexed, failed = index_documents(es, generate_actions(documents, index),
+            chunk_size=args.chunk_size, threads=args.threads, max_chunk_bytes=args.max_chunk_bytes)
+    except Exception:
+        if not args.incremental:
+            # the incomplete index is never put under the alias
+            print("Delete the incomplete index", index)
+            es.indices.delete(index=index, ignore=[404])
+        raise
+
+    elapsed = time.time() - start
+    print("Indexed {} documents ({} failed) in {:.0f} s ({:.0f} documents/s)".format(indexed, failed, elapsed, indexed / max(elapsed, 1e-9)))
+
+    if failed > args.max_failures:
+        # the alias and the high-water mark are left unchanged, so the next run loads the documents again
+        if not args.incremental:
+            print("Delete the incomplete index", index)
+            es.indices.delete(index=index, ignore=[404])
+        raise Exception("{} documents failed to be indexed (at most {} allowed), the load is aborted.".format(failed, args.max_failures))
+
+    if not args.incremental:
+        print("Restore the index settings")
+        es.indices.put_settings(index=index, body={
+            "index": {
+                "refresh_interval": args.refresh_interval,
+                "number_of_replicas": args.replicas
+            }
+        })
 
     print("Refresh elasticsearch index")
     # refresh the index
-    es.indices.refresh(index="envirolens")
+    es.indices.refresh(index=index)
+    set_high_water_mark(es, index, args.high_water_column, high_water_mark)
 
+    if not args.incremental:
+        # the searches use the new index from now on
+        print("Point the alias", args.index, "to", index)
+        swap_alias(es, args.index, index, delete_old=not args.keep_old)
 
     print("Done!")
-
-
-
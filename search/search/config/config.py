@@ -13,6 +13,18 @@ class Config(object):
     CORS = {
         'origins': os.getenv('CORS_ORIGINS').split(',') if os.getenv('CORS_ORIGINS') else None
     }
+    # the cache of the search responses
+    RESPONSE_CACHE = {
+        'size': int(os.getenv('RESPONSE_CACHE_SIZE', 1000)),
+        'ttl': int(os.getenv('RESPONSE_CACHE_TTL', 60))
+    }
+    # the elasticsearch client shared by the requests of each worker process
+    ELASTICSEARCH = {
+        'hosts': os.getenv('ELASTICSEARCH_HOSTS').split(',') if os.getenv('ELASTICSEARCH_HOSTS') else None,
+        'timeout': float(os.getenv('ELASTICSEARCH_TIMEOUT', 10)),
+        'max_retries': int(os.getenv('ELASTICSEARCH_MAX_RETRIES', 3)),
+        'pool_size': int(os.getenv('ELASTICSEARCH_POOL_SIZE', 10))
+    }
 
 class ProductionConfig(Config):
     """Production configuration"""
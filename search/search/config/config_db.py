@@ -22,12 +22,12 @@ def get_db():
         # get database and password for establishing the conncetion
         database = current_app.config['DATABASE']['database']
         password = current_app.config['DATABASE']['password']
-        username = current_app.config['DATABASE']['username']
+        username = current_app.config['DATABASE'].get('username', 'postgres')
         # connect to the database
         g.db.connect(
             database=database,
             password=password,
-            username=username
+            user=username
         )
 
     # return the database connection
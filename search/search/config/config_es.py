@@ -1,33 +1,47 @@
-# Database config script
-# Contains methods for establishing and
-# closing connection with the database
+# Elasticsearch config script
+# Contains the method for retrieving the elasticsearch
+# client shared by all requests of the worker process
 
-from flask import current_app, g
+import os
+import threading
+
+from flask import current_app
 # import elasticsearch module
 from elasticsearch import Elasticsearch
 
+# the elasticsearch client of the worker process
+es = None
+es_pid = None
+es_lock = threading.Lock()
+
 
 def get_es():
-    """Gets or esablishes the connection to the database
+    """Gets or creates the elasticsearch client of the worker process
+
+    The client keeps a pool of HTTP connections which is reused by all requests.
+
     Returns:
         obj: The elasticsearch object.
     """
 
-    if 'es' not in g:
-        # ! modify for different database
-        # initialize db object
-        g.es = Elasticsearch()
-    # return the database connection
-    return g.es
-
-
-def close_es(e=None):
-    """Closes the connection to the database"""
-
-    # removes the database object from the global variable
-    es = g.pop('es', None)
-
-
-def init_app(app):
-    """Initializes the application and adds methods for handling the db"""
-    app.teardown_appcontext(close_es)
\ No newline at end of file
+    global es, es_pid
+    with es_lock:
+        # the connections are not shared with the forked worker processes
+        if es is None or es_pid != os.getpid():
+            settings = current_app.config['ELASTICSEARCH']
+            es = Elasticsearch(
+                hosts=settings['hosts'],
+                # the timeout of the requests in seconds
+                timeout=settings['timeout'],
+                max_retries=settings['max_retries'],
+                retry_on_timeout=True,
+                # the cluster nodes are not discovered
+                sniff_on_start=False,
+                sniff_on_connection_fail=False,
+                sniffer_timeout=None,
+                # the number of connections per node
+                maxsize=settings['pool_size']
+            )
+            es_pid = os.getpid()
+    # return the elasticsearch client
+    return es
@@ -0,0 +1,116 @@
+# Latency Statistics
+# Records the duration of the phases of the requests
+# (e.g. building the query, the elasticsearch round-trip and
+# formatting the response) in the worker process.
+
+import os
+import time
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """
+    Thread safe statistics of the request phase durations
+
+    Args:
+        window (int): The number of the most recent durations per phase
+            used for the percentiles. (Default = 1000)
+
+    """
+
+    def __init__(self, window=1000):
+        self.__window = window
+        self.__lock = threading.Lock()
+        # the number, the sum and the maximum of the durations per phase
+        self.__count = {}
+        self.__total = {}
+        self.__max = {}
+        # the most recent durations per phase
+        self.__recent = {}
+
+
+    def record(self, timings):
+        """Records the durations of the request phases
+
+        Args:
+            timings (dict): The durations of the phases in seconds.
+
+        """
+
+        with self.__lock:
+            for phase, duration in timings.items():
+                if phase not in self.__count:
+                    self.__count[phase] = 0
+                    self.__total[phase] = 0.0
+                    self.__max[phase] = 0.0
+                    self.__recent[phase] = deque(maxlen=self.__window)
+                self.__count[phase] += 1
+                self.__total[phase] += duration
+                self.__max[phase] = max(self.__max[phase], duration)
+                self.__recent[phase].append(duration)
+
+
+    @staticmethod
+    def server_timing(timings):
+        """Formats the durations as the value of the Server-Timing header
+
+        Args:
+            timings (dict): The durations of the phases in seconds.
+
+        Returns:
+            str: The header value.
+
+        """
+
+        return ", ".join("{};dur={:.2f}".format(phase, 1000 * duration) for phase, duration in timings.items())
+
+
+    def stats(self):
+        """Retrieves the latency statistics of the process
+
+        Returns:
+            dict: The number of requests and the average, median, 95th percentile
+                and maximum duration in milliseconds per phase.
+
+        """
+
+        with self.__lock:
+            stats = {}
+            for phase in self.__count:
+                recent = sorted(self.__recent[phase])
+                stats[phase] = {
+                    "count": self.__count[phase],
+                    "avg_ms": 1000 * self.__total[phase] / self.__count[phase],
+                    "p50_ms": 1000 * recent[len(recent) // 2],
+                    "p95_ms": 1000 * recent[min(len(recent) - 1, int(0.95 * len(recent)))],
+                    "max_ms": 1000 * self.__max[phase]
+                }
+            return dict(stats, pid=os.getpid())
+
+
+class Timer:
+    """Measures the durations of the consecutive phases of a request"""
+
+    def __init__(self):
+        self.__start = time.perf_counter()
+        self.__last = self.__start
+        self.timings = {}
+
+
+    def lap(self, phase):
+        """Records the duration of the phase which just ended
+
+        Args:
+            phase (str): The name of the phase.
+
+        """
+
+        now = time.perf_counter()
+        self.timings[phase] = now - self.__last
+        self.__last = now
+
+
+    def total(self):
+        """Records the duration of the whole request"""
+        self.timings["total"] = time.perf_counter() - self.__start
@@ -1,3 +1,6 @@
+import uuid
+from collections import namedtuple
+
 import psycopg2
 
 
@@ -13,6 +16,8 @@ class PostgresQL:
     def __init__(self, host="127.0.0.1", port="5432"):
         self.host = host
         self.port = port
+        self.connection = None
+        self.cursor = None
 
 
     def connect(self, database, password, user="postgres"):
@@ -67,9 +72,52 @@ class PostgresQL:
         else:
             self.cursor.execute(statement)
 
-        num_fields = len(self.cursor.description)
         field_names = [i[0] for i in self.cursor.description]
-        return [{ field_names[i]: row[i] for i in range(num_fields) } for row in self.cursor.fetchall()]
+        return [dict(zip(field_names, row)) for row in self.cursor]
+
+
+    def iter_execute(self, statement, params=None, itersize=2000, row_type="dict"):
+        """Execute the provided statement with a server-side cursor and stream the records
+
+        The records are transferred from the database in batches of itersize
+        records, so the result set is never held in memory at once.
+
+        Args:
+            statement (str): The postgresql statement to be executed.
+            params (tuple): values to be formatted into the statement. (Default = None)
+            itersize (int): The number of records transferred at once. (Default = 2000)
+            row_type (str): The type of the yielded records. Options: 'dict', 'tuple'
+                and 'namedtuple'. (Default = 'dict')
+
+        Returns:
+            generator: the postgresql records one by one.
+
+        """
+        if self.connection is None:
+            raise Exception("The connection is not established")
+        if row_type not in ("dict", "tuple", "namedtuple"):
+            raise Exception("iter_execute: row type '{}' not supported (must be 'dict', 'tuple' or 'namedtuple').".format(row_type))
+
+        # every stream needs its own server-side cursor
+        with self.connection.cursor(name="iter_execute_{}".format(uuid.uuid4().hex)) as cursor:
+            cursor.itersize = itersize
+            if params is None:
+                cursor.execute(statement)
+            else:
+                cursor.execute(statement, params)
+
+            field_names = None
+            for record in cursor:
+                if field_names is None:
+                    # the description is available after the first batch
+                    field_names = [i[0] for i in cursor.description]
+                    Record = namedtuple("Record", field_names, rename=True)
+                if row_type == "tuple":
+                    yield record
+                elif row_type == "namedtuple":
+                    yield Record._make(record)
+                else:
+                    yield dict(zip(field_names, record))
 
 
     def db_query(self, query_words):
@@ -0,0 +1,113 @@
+# Response Cache
+# A bounded LRU cache with time-to-live for the search responses
+# held in the memory of the worker process. The search responses
+# are only valid for a short time, so they are not shared between
+# the workers.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of the search responses of the worker process
+
+    Args:
+        max_size (int): The maximum number of cached responses.
+            If 0 the cache is disabled. (Default = 1000)
+        ttl (int): The number of seconds a response is valid. (Default = 60)
+
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+        # the cache statistics
+        self.__hits = 0
+        self.__misses = 0
+
+
+    @staticmethod
+    def create_key(*parts):
+        """Creates the cache key from the normalized request parts
+
+        Args:
+            parts (list): The JSON serializable parts identifying the response.
+
+        Returns:
+            str: The cache key.
+
+        """
+
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+    def get(self, key):
+        """Retrieves the cached response
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            obj: The cached response or None if it is not cached or expired.
+
+        """
+
+        if self.__max_size <= 0:
+            return None
+
+        with self.__lock:
+            if key in self.__cache:
+                expires, value = self.__cache[key]
+                if expires > time.time():
+                    # mark the response as recently used
+                    self.__cache.move_to_end(key)
+                    self.__hits += 1
+                    return value
+                del self.__cache[key]
+            self.__misses += 1
+            return None
+
+
+    def set(self, key, value):
+        """Stores the response in the cache and evicts the least recently used response
+
+        Args:
+            key (str): The cache key.
+            value (obj): The response.
+
+        """
+
+        if self.__max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__cache[key] = (time.time() + self.__ttl, value)
+            self.__cache.move_to_end(key)
+            if len(self.__cache) > self.__max_size:
+                self.__cache.popitem(last=False)
+
+
+    def stats(self):
+        """Retrieves the cache statistics of the process
+
+        Returns:
+            dict: The number of hits, misses and cached responses.
+
+        """
+
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "size": len(self.__cache),
+                "max_size": self.__max_size,
+                "ttl": self.__ttl,
+                "pid": os.getpid()
+            }
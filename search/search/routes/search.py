@@ -3,6 +3,7 @@
 
 import sys
 import json
+import base64
 import requests
 import math
 from urllib.parse import urlparse, parse_qsl, urlunparse, urlencode
@@ -28,6 +29,17 @@ MIN_PAGE = 1
 
 # get the database configuration object
 from ..config import config_es
+from ..library.latency import LatencyStats, Timer
+from ..library.response_cache import ResponseCache
+
+# the durations of the search phases in the worker process
+latency = LatencyStats()
+
+# the cache of the search responses
+cache = ResponseCache(
+    max_size=app.config['RESPONSE_CACHE']['size'],
+    ttl=app.config['RESPONSE_CACHE']['ttl']
+)
 
 # add helper functions
 def format_document(document):
@@ -48,13 +60,69 @@ def format_document(document):
     }
 
 
+def normalize_list(values):
+    """Normalizes the comma separated values used in the cache keys
+
+    The terms filters do not depend on the order of the values so
+    the normalized values produce the same responses.
+
+    Args:
+        values (str): The comma separated values.
+
+    Returns:
+        str: The sorted comma separated values.
+
+    """
+
+    return ",".join(sorted(set(value.strip() for value in values.split(",")))) if values else values
+
+
+def encode_cursor(search_after, page, query_key):
+    """Encodes the position after the last returned document into an opaque cursor
+
+    Args:
+        search_after (list): The sort values of the last returned document.
+        page (int): The number of the page starting after the document.
+        query_key (str): The key of the query to which the cursor belongs.
+
+    Returns:
+        str: The cursor token.
+
+    """
+
+    cursor = json.dumps({ "after": search_after, "page": page, "query": query_key })
+    return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token, query_key):
+    """Decodes the cursor token
+
+    Args:
+        token (str): The cursor token.
+        query_key (str): The key of the query to which the cursor must belong.
+
+    Returns:
+        tuple: The sort values of the last returned document and the number of the page.
+
+    """
+
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        search_after, page, cursor_query = cursor["after"], int(cursor["page"]), cursor["query"]
+    except Exception:
+        raise Exception("The cursor is not valid.")
+    if cursor_query != query_key:
+        raise Exception("The cursor belongs to a different query.")
+    return search_after, page
+
+
 def format_url(url, params):
     # part the url
     url_parts = list(urlparse(url))
     # get the query parameters of the url
     query = dict(parse_qsl(url_parts[4]))
-    # add the query parameters
-    query.update(params)
+    # add the query parameters (the missing parameters are left out)
+    query.update({ key: value for key, value in params.items() if value is not None })
     # encode the query parameters
     url_parts[4] = urlencode(query)
     # create the url
@@ -69,6 +137,7 @@ bp = Blueprint('search', __name__, url_prefix='/api/v1/search')
 
 @bp.route('/', methods=['GET'])
 def search():
+    timer = Timer()
     try:
         text = None
         sources = None
@@ -85,10 +154,48 @@ def search():
             informea = request.args.get('informea', default=None, type=str)
             limit = request.args.get('limit', default=20, type=int)
             page = request.args.get('page', default=1, type=int)
+            cursor = request.args.get('cursor', default=None, type=str)
+            exact_total = request.args.get('exact_total', default='true', type=str).lower() != 'false'
         else:
             # TODO: log exception
             return abort(405)
 
+        #########################################
+        # Prepare the pagination params
+        #########################################
+
+        if page < MIN_PAGE:
+            page = MIN_PAGE
+
+        if limit < MIN_LIMIT:
+            limit = MIN_LIMIT
+        elif limit > MAX_LIMIT:
+            limit = MAX_LIMIT
+
+        #########################################
+        # Check the response cache
+        #########################################
+
+        # the normalized query parameters identify the query
+        text = " ".join(text.split()) if text else None
+        sources, locations, languages, informea = [normalize_list(values) for values in (sources, locations, languages, informea)]
+        query_key = ResponseCache.create_key(text, sources, locations, languages, informea, exact_total)
+
+        search_after = None
+        if cursor:
+            # the cursor determines the page
+            search_after, page = decode_cursor(cursor, query_key)
+
+        key = ResponseCache.create_key(query_key, limit, page, cursor)
+        response = cache.get(key)
+        if response is not None:
+            timer.lap("cache")
+            timer.total()
+            latency.record(timer.timings)
+            response = jsonify(response)
+            response.headers["Server-Timing"] = LatencyStats.server_timing(timer.timings)
+            return response
+
         #HOST = app.config.get('TEXT_EMBEDDING_HOST', 'localhost')
         #PORT = app.config.get('TEXT_EMBEDDING_PORT', '4222')
 
@@ -166,20 +273,8 @@ def search():
             "terms": { "source": sources.split(",") }
         })
 
-        #########################################
-        # Prepare the pagination params
-        #########################################
-
-        if page < MIN_PAGE:
-            page = MIN_PAGE
-
-        if limit < MIN_LIMIT:
-            limit = MIN_LIMIT
-        elif limit > MAX_LIMIT:
-            limit = MAX_LIMIT
-
-
-        offset = (page - 1) * limit
+        # the cursor continues after the last document of the previous page
+        offset = (page - 1) * limit if search_after is None else 0
         size = limit
 
         #########################################
@@ -190,7 +285,9 @@ def search():
             "from": offset,
             "size": size,
             "sort" : [
-                "_score"
+                "_score",
+                # the document id breaks the ties for the cursors
+                { "document_id": "asc" }
             ],
             "query": {
                 "bool": {
@@ -198,26 +295,39 @@ def search():
                 }
             },
             "min_score": 4,
-            "track_total_hits": True
+            # without the exact total the hits are only counted up to 10000
+            "track_total_hits": True if exact_total else 10000
         }
 
+        if search_after is not None:
+            es_query["search_after"] = search_after
+
         if len(must_query) != 0:
             es_query["query"]["bool"]["must"] = must_query
 
         if len(should_query) != 0:
             es_query["query"]["bool"]["should"] = should_query;
 
-        print(es_query)
+        app.logger.debug(es_query)
+        timer.lap("query_build")
+
         # run the query on elasticsearch
         results = es.search(index="envirolens", body=es_query)
+        timer.lap("elasticsearch")
 
         # prepare output of the elasticsearch response
         documents = [format_document(document) for document in results["hits"]["hits"]]
 
         # prepare metadata information for easier navigation
         TOTAL_HITS = results["hits"]["total"]["value"]
+        TOTAL_HITS_RELATION = results["hits"]["total"]["relation"]
         TOTAL_PAGES = math.ceil(TOTAL_HITS / size)
 
+        # the cursor of the next page if there are more documents
+        hits = results["hits"]["hits"]
+        has_next = len(hits) == size and (page + 1 <= TOTAL_PAGES or TOTAL_HITS_RELATION == "gte")
+        next_cursor = encode_cursor(hits[-1]["sort"], page + 1, query_key) if has_next else None
+
         prev_page = format_url(BASE_URL, {
             "text": text,
             "sources": sources,
@@ -225,6 +335,7 @@ def search():
             "languages": languages,
             "informea": informea,
             "limit": limit,
+            "exact_total": str(exact_total).lower(),
             "page": page - 1
         }) if page - 1 > 0 else None
 
@@ -235,10 +346,10 @@ def search():
             "languages": languages,
             "informea": informea,
             "limit": limit,
-            "page": page + 1
-        }) if page + 1 <= TOTAL_PAGES else None
-
-
+            "exact_total": str(exact_total).lower(),
+            "cursor": next_cursor
+        }) if has_next else None
+        timer.lap("format")
 
     except Exception as e:
         # TODO: log exception
@@ -246,7 +357,7 @@ def search():
         return abort(400, str(e))
     else:
         # TODO: return the documents
-        return jsonify({
+        response = {
             "query": {
                 "text": text,
                 "sources": sources,
@@ -254,13 +365,37 @@ def search():
                 "languages": languages,
                 "informea": informea,
                 "limit": limit,
-                "page": page
+                "page": page,
+                "exact_total": exact_total
             },
             "documents": documents,
             "metadata": {
                 "total_hits": TOTAL_HITS,
+                "total_hits_relation": TOTAL_HITS_RELATION,
                 "total_pages": TOTAL_PAGES,
                 "prev_page": prev_page,
-                "next_page": next_page
+                "next_page": next_page,
+                "next_cursor": next_cursor
             }
-        })
+        }
+        # store the response for the repeated queries
+        cache.set(key, response)
+        response = jsonify(response)
+        timer.total()
+        # record the durations of the search phases
+        latency.record(timer.timings)
+        response.headers["Server-Timing"] = LatencyStats.server_timing(timer.timings)
+        return response
+
+
+@bp.route('/cache', methods=['GET'])
+def cache_stats():
+    # return the response cache statistics of the worker
+    return jsonify(cache.stats())
+
+
+@bp.route('/latency', methods=['GET'])
+def latency_stats():
+    # return the search latency statistics of the worker
+    return jsonify(latency.stats())
+
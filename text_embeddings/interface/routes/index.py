@@ -11,7 +11,8 @@ from flask import (
 )
 from werkzeug.exceptions import abort
 
-from langdetect import detect
+# the language detector is shared with the text embedding service
+from text_embedding.library.language_detection import detect_language
 
 #################################################
 # Setup the proxy configuration
@@ -78,8 +79,8 @@ def embedding_create():
         return abort(405)
 
     try:
-        # extract the text embedding
-        text_language = language if language != None else detect(text)
+        # detect the text language once, the embedding service receives it
+        text_language = language if language != None else detect_language(text)
         # check if we have a service that is able to handle the language
         if text_language not in proxy_config.keys():
             # return the error message
@@ -0,0 +1,66 @@
+#################################################
+# Approximate Nearest Neighbour Index Benchmark
+# Compares the recall and latency of the index
+# with the exact gensim similarity search
+#
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'))
+sys.path.insert(0, _ROOT)
+
+from text_embedding.library.text_embedding import load_keyed_vectors
+from text_embedding.library.ann_index import ANNIndex
+
+
+if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Benchmarks the approximate nearest neighbour index against the exact search")
+    argparser.add_argument('-mp', '--model_path', type=str, help="The path to the word embedding model file")
+    argparser.add_argument('-mf', '--model_format', type=str, default='word2vec', help="The format of the word embedding model (default: 'word2vec')")
+    argparser.add_argument('-ip', '--index_path', type=str, default=None, help="The path to the index file. If not given the index is built (default: None)")
+    argparser.add_argument('--lists', type=int, default=1024, help="The number of index clusters when building the index (default: 1024)")
+    argparser.add_argument('--probes', type=str, default='4,8,16,32', help="Comma separated numbers of scored clusters (default: 4,8,16,32)")
+    argparser.add_argument('-k', type=int, default=10, help="The number of nearest neighbours (default: 10)")
+    argparser.add_argument('-q', '--queries', type=int, default=200, help="The number of query words (default: 200)")
+    args = argparser.parse_args()
+
+    wv = load_keyed_vectors(args.model_path, args.model_format)
+    wv.init_sims()
+
+    if args.index_path:
+        index = ANNIndex.load(args.index_path)
+    else:
+        start = time.perf_counter()
+        index = ANNIndex.build(wv.vectors_norm, n_lists=args.lists)
+        print("index built in {:.1f} s".format(time.perf_counter() - start))
+    index.attach(wv.vectors_norm, wv.index2word)
+
+    # sample the query words among the frequent words
+    random = np.random.RandomState(0)
+    rows = random.choice(min(50000, len(wv.index2word)), args.queries, replace=False)
+
+    # the exact search results
+    exact = []
+    start = time.perf_counter()
+    for row in rows:
+        exact.append(set(word for word, _ in wv.similar_by_word(wv.index2word[row], topn=args.k)))
+    exact_time = (time.perf_counter() - start) / len(rows)
+
+    print("{:>8} {:>12} {:>12} {:>10}".format("n_probe", "recall@{}".format(args.k), "latency [ms]", "speedup"))
+    print("{:>8} {:>12.3f} {:>12.3f} {:>9.1f}x".format("exact", 1.0, exact_time * 1000, 1.0))
+    for n_probe in [int(p) for p in args.probes.split(',')]:
+        found = 0
+        start = time.perf_counter()
+        for row, expected in zip(rows, exact):
+            mean = wv.vectors_norm[row]
+            result = index.search(mean, k=args.k, exclude={int(row)}, n_probe=n_probe)
+            found += len(expected & set(wv.index2word[i] for i, _ in result))
+        approx_time = (time.perf_counter() - start) / len(rows)
+        print("{:>8} {:>12.3f} {:>12.3f} {:>9.1f}x".format(n_probe, found / (len(rows) * args.k), approx_time * 1000, exact_time / approx_time))
@@ -0,0 +1,111 @@
+#################################################
+# Text Embedding Benchmark
+# Compares the vectorized TextEmbedding.text_embedding
+# with the per-token loop implementation on
+# documents of different lengths
+#
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+import numpy as np
+
+_ROOT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..'))
+sys.path.insert(0, _ROOT)
+
+from text_embedding.library.text_embedding import TextEmbedding
+
+
+def create_model(path, vocabulary_size, dimension, seed=0):
+    """Creates a random word embedding model in the word2vec format
+
+    Args:
+        path (str): The path where the model is stored.
+        vocabulary_size (int): The number of words in the model.
+        dimension (int): The dimension of the word vectors.
+        seed (int): The random seed. (Default = 0)
+
+    Returns:
+        tuple(dict, numpy.ndarray): The vocabulary (word -> row index) and the word vectors matrix.
+
+    """
+
+    random = np.random.RandomState(seed)
+    vectors = random.rand(vocabulary_size, dimension).astype(np.float32)
+    vocabulary = { "w{}".format(i): i for i in range(vocabulary_size) }
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("{} {}\n".format(vocabulary_size, dimension))
+        for word, i in vocabulary.items():
+            f.write("{} {}\n".format(word, " ".join(repr(float(v)) for v in vectors[i])))
+
+    return vocabulary, vectors
+
+
+def loop_text_embedding(model, vocabulary, vectors, text):
+    """The per-token loop text embedding used as the reference
+
+    Args:
+        model (TextEmbedding): The text embedding model used for tokenization.
+        vocabulary (dict): The vocabulary (word -> row index).
+        vectors (numpy.ndarray): The word vectors matrix.
+        text (str): The text to be embedded.
+
+    Returns:
+        numpy.ndarray: The text embedding.
+
+    """
+
+    embedding = np.zeros(vectors.shape[1], dtype=np.float32)
+    count = 0
+    for token, number_of_appearances in model.tokenize(text):
+        if token in vocabulary.keys():
+            embedding += vectors[vocabulary[token]] * number_of_appearances
+            count += number_of_appearances
+    return embedding / count if count > 0 else embedding
+
+
+def measure(function, repeat):
+    """Measures the best execution time of the function in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__=='__main__':
+    # parse command line arguments
+    argparser = argparse.ArgumentParser(description="Benchmarks the text embedding on documents of different lengths")
+    argparser.add_argument('-v', '--vocabulary_size', type=int, default=50000, help="The number of words in the random model (default: 50000)")
+    argparser.add_argument('-d', '--dimension', type=int, default=300, help="The dimension of the word vectors (default: 300)")
+    argparser.add_argument('-l', '--lengths', type=str, default='1000,10000,100000', help="Comma separated document lengths in tokens (default: 1000,10000,100000)")
+    argparser.add_argument('-r', '--repeat', type=int, default=5, help="The number of repetitions of each measurement (default: 5)")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        model_path = os.path.join(folder, 'benchmark.vec')
+        vocabulary, vectors = create_model(model_path, args.vocabulary_size, args.dimension)
+        model = TextEmbedding(language='en', model_path=model_path, model_format='word2vec')
+
+    random = np.random.RandomState(1)
+    print("{:>10} {:>12} {:>12} {:>10}".format("tokens", "loop [ms]", "vector [ms]", "speedup"))
+    for length in [int(l) for l in args.lengths.split(',')]:
+        # sample the document words with a zipfian distribution
+        # and add some out-of-vocabulary words
+        ranks = random.zipf(1.3, size=length) % (args.vocabulary_size * 2)
+        text = " ".join("w{}".format(rank) for rank in ranks)
+
+        loop_time, expected = measure(lambda: loop_text_embedding(model, vocabulary, vectors, text), args.repeat)
+        vector_time, result = measure(lambda: model.text_embedding(text, language='en'), args.repeat)
+
+        # the default projection matrix is zero so the results are directly comparable
+        if not np.allclose(expected, result, rtol=1e-4, atol=1e-6):
+            raise Exception("The text embeddings do not match for the document with {} tokens".format(length))
+
+        print("{:>10} {:>12.2f} {:>12.2f} {:>9.1f}x".format(length, loop_time * 1000, vector_time * 1000, loop_time / vector_time))
@@ -40,13 +40,16 @@ def create_supervisor_file(user, interface_flag):
             model_format = config["text_embedding"][language]["model_format"]
             port = config["text_embedding"][language]["port"]
             workers = config["text_embedding"][language]["workers"]
+            # the optional query expansion index
+            index_path = config["text_embedding"][language].get("index_path", None)
+            index_arg = ', "index_path": "{}"'.format(index_path) if index_path else ''
 
             # create the service configuration file
             language_config = """
                 [program:{}]
                 user = {}
                 directory = {}
-                command = sh ./scripts/environment.sh gunicorn -w {} -b 127.0.0.1:{} -c ./scripts/gunicorn.conf.py 'text_embedding:create_app(args={{ "host":"127.0.0.1", "port":{}, "env":"production", "model_path": "{}", "model_language": "{}", "model_format":"{}" }})'
+                command = sh ./scripts/environment.sh gunicorn -w {} -b 127.0.0.1:{} -c ./scripts/gunicorn.conf.py 'text_embedding:create_app(args={{ "host":"127.0.0.1", "port":{}, "env":"production", "model_path": "{}", "model_language": "{}", "model_format":"{}"{} }})'
 
                 priority = 900
                 autostart = true
@@ -56,7 +59,7 @@ def create_supervisor_file(user, interface_flag):
                 redirect_stderr = true
                 stdout_logfile = {}/log/%(program_name)s.log
                 stderr_logfile = {}/log/%(program_name)s.log
-            """.format(program, user, _ROOT, workers, port, port, model_path, language, model_format, _ROOT, _ROOT)
+            """.format(program, user, _ROOT, workers, port, port, model_path, language, model_format, index_arg, _ROOT, _ROOT)
 
             # format the configuration string
             language_config = re.sub(' +', ' ', language_config)
@@ -78,7 +81,7 @@ def create_supervisor_file(user, interface_flag):
             [program:{}]
             user = {}
             directory = {}
-            command = sh ./scripts/environment.sh gunicorn -w {} -b 127.0.0.1:{} -c ./scripts/gunicorn.conf.py 'interface:create_app(args={{ "host":"127.0.0.1", "port":{}, "env":"production", "supervisord": {} }})'
+            command = sh ./scripts/environment.sh gunicorn -w {} -b 127.0.0.1:{} -c ./scripts/gunicorn.conf.py --pythonpath {} 'interface:create_app(args={{ "host":"127.0.0.1", "port":{}, "env":"production", "supervisord": {} }})'
 
             priority = 900
             autostart = true
@@ -88,7 +91,7 @@ def create_supervisor_file(user, interface_flag):
             redirect_stderr = true
             stdout_logfile = {}/log/%(program_name)s.log
             stderr_logfile = {}/log/%(program_name)s.log
-        """.format(program, user, _ROOT, workers, port, port, supervisord, _ROOT, _ROOT)
+        """.format(program, user, _ROOT, workers, port, _ROOT, port, supervisord, _ROOT, _ROOT)
 
         # format the configuration string
         interface_config = re.sub(' +', ' ', interface_config)
@@ -19,6 +19,8 @@ def create_app(args=None):
             MODEL_PATH=args["model_path"],
             MODEL_FORMAT=args["model_format"] if 'model_format' in args else 'word2vec',
             MODEL_LANGUAGE=args["model_language"],
+            INDEX_PATH=args["index_path"] if 'index_path' in args else None,
+            PRECOMPUTE_LEMMAS=args["precompute_lemmas"] if 'precompute_lemmas' in args else 0,
             HOST=args["host"],
             PORT=args["port"],
         )
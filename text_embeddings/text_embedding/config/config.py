@@ -13,6 +13,12 @@ class Config(object):
     CORS = {
         'origins': os.getenv('CORS_ORIGINS').split(',') if os.getenv('CORS_ORIGINS') else None
     }
+    # the /create and /expand response cache
+    RESPONSE_CACHE = {
+        'size': int(os.getenv('RESPONSE_CACHE_SIZE', 1000)),
+        'ttl': int(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+        'path': os.getenv('RESPONSE_CACHE_PATH')
+    }
 
 
 class ProductionConfig(Config):
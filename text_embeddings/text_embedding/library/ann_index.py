@@ -0,0 +1,184 @@
+###########################################################
+# Approximate Nearest Neighbour Index
+# Inverted file (IVF) index over the normalized word vectors.
+# The vectors are clustered with spherical k-means and each
+# query only scores the vectors in the clusters whose
+# centroids are the most similar to the query vector.
+
+import numpy as np
+
+
+class ANNIndex:
+    """
+    Inverted file index for approximate k-nearest neighbour search
+    with the cosine similarity.
+
+    Args:
+        centroids (numpy.ndarray): The normalized cluster centroids.
+        order (numpy.ndarray): The vector row indices sorted by their cluster.
+        offsets (numpy.ndarray): The positions in `order` where the clusters start.
+        n_probe (int): The number of clusters scored per query. (Default = 16)
+
+    """
+
+    def __init__(self, centroids, order, offsets, n_probe=16):
+        self.__centroids = centroids
+        self.__order = order
+        self.__offsets = offsets
+        self.__n_probe = n_probe
+        # the normalized word vectors and words, assigned with `attach`
+        self.__vectors = None
+        self.__words = None
+
+
+    @classmethod
+    def build(cls, vectors, n_lists=1024, n_iter=10, sample_size=100000, n_probe=16, seed=0, chunk_size=65536):
+        """Builds the index over the normalized vectors
+
+        Args:
+            vectors (numpy.ndarray): The normalized word vectors.
+            n_lists (int): The number of clusters. (Default = 1024)
+            n_iter (int): The number of k-means iterations. (Default = 10)
+            sample_size (int): The number of vectors used to train the centroids. (Default = 100000)
+            n_probe (int): The number of clusters scored per query. (Default = 16)
+            seed (int): The random seed. (Default = 0)
+            chunk_size (int): The number of vectors assigned at once. (Default = 65536)
+
+        Returns:
+            ANNIndex: The index over the vectors.
+
+        """
+
+        random = np.random.RandomState(seed)
+        n_lists = min(n_lists, vectors.shape[0])
+
+        # train the centroids with spherical k-means on a sample of the vectors
+        sample = vectors[np.sort(random.choice(vectors.shape[0], min(sample_size, vectors.shape[0]), replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        centroids = sample[random.choice(sample.shape[0], n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(sample.dot(centroids.T), axis=1)
+            for c in range(n_lists):
+                members = sample[assignment == c]
+                if len(members) > 0:
+                    centroids[c] = members.sum(axis=0)
+            centroids = cls.__normalize(centroids)
+
+        # assign all vectors to their nearest centroid
+        assignment = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk_size):
+            chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            assignment[start:start + chunk_size] = np.argmax(chunk.dot(centroids.T), axis=1)
+
+        # sort the vector rows by their cluster
+        order = np.argsort(assignment, kind='stable').astype(np.int32)
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1)).astype(np.int64)
+        return cls(centroids, order, offsets, n_probe=n_probe)
+
+
+    @staticmethod
+    def __normalize(matrix):
+        """Normalizes the rows of the matrix to unit length"""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (matrix / norms).astype(np.float32)
+
+
+    def save(self, path):
+        """Saves the index
+
+        Args:
+            path (str): The path where the index will be stored.
+
+        """
+
+        with open(path, 'wb') as output:
+            np.savez(output, centroids=self.__centroids, order=self.__order,
+                     offsets=self.__offsets, n_probe=self.__n_probe)
+
+
+    @classmethod
+    def load(cls, path):
+        """Loads the index
+
+        Args:
+            path (str): The path where the index is located.
+
+        Returns:
+            ANNIndex: The loaded index.
+
+        """
+
+        with np.load(path) as data:
+            return cls(data['centroids'], data['order'], data['offsets'], n_probe=int(data['n_probe']))
+
+
+    def attach(self, vectors, words):
+        """Attaches the normalized word vectors the index was built on
+
+        Args:
+            vectors (numpy.ndarray): The normalized word vectors.
+            words (list(str)): The words in the order of the vectors.
+
+        """
+
+        if not vectors.shape[0] == self.__order.shape[0]:
+            raise Exception("ANNIndex.attach: the index was built on {} vectors, got {}".format(self.__order.shape[0], vectors.shape[0]))
+        self.__vectors = vectors
+        self.__words = words
+
+
+    def search(self, vector, k=10, exclude=None, n_probe=None):
+        """Finds the approximate k nearest neighbours of the vector
+
+        Args:
+            vector (numpy.ndarray): The normalized query vector.
+            k (int): The number of neighbours. (Default = 10)
+            exclude (set(int)): The row indices excluded from the result. (Default = None)
+            n_probe (int): The number of clusters scored. (Default = the index n_probe)
+
+        Returns:
+            list(tuple(int, float)): The (row index, similarity) pairs sorted by descending similarity.
+
+        """
+
+        n_probe = min(n_probe or self.__n_probe, self.__centroids.shape[0])
+
+        # select the clusters most similar to the query
+        centroid_scores = self.__centroids.dot(vector)
+        lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+
+        # score the vectors of the selected clusters
+        candidates = np.concatenate([self.__order[self.__offsets[c]:self.__offsets[c + 1]] for c in lists])
+        candidates.sort()
+        scores = np.asarray(self.__vectors[candidates], dtype=np.float32).dot(vector)
+
+        if exclude:
+            scores[np.isin(candidates, list(exclude))] = -np.inf
+
+        # get the top k candidates
+        top = min(k, len(candidates))
+        best = np.argpartition(-scores, top - 1)[:top] if top > 0 else np.array([], dtype=np.int64)
+        best = best[np.argsort(-scores[best])]
+        return [(int(candidates[i]), float(scores[i])) for i in best if np.isfinite(scores[i])]
+
+
+    def most_similar(self, positive, topn=10):
+        """Finds the words most similar to the given words
+
+        Mirrors gensim's `most_similar`: the normalized vectors of the
+        given words are averaged and the given words are excluded.
+
+        Args:
+            positive (list(int)): The row indices of the words.
+            topn (int): The number of similar words. (Default = 10)
+
+        Returns:
+            list(tuple(str, float)): The (word, similarity) pairs sorted by descending similarity.
+
+        """
+
+        mean = np.asarray(self.__vectors[list(positive)], dtype=np.float32).mean(axis=0)
+        mean = mean / np.linalg.norm(mean)
+        result = self.search(mean, k=topn, exclude=set(positive))
+        return [(self.__words[i], score) for i, score in result]
@@ -0,0 +1,58 @@
+# Language Detection
+# Detects the language of the text from its bounded prefix
+# and caches the detections by the text hash
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from langdetect import DetectorFactory, detect
+
+# make the language detection deterministic
+DetectorFactory.seed = 0
+
+# the number of characters used to detect the language
+DETECTION_PREFIX_LENGTH = 2000
+# the maximum number of cached detections
+DETECTION_CACHE_SIZE = 10000
+
+__cache = OrderedDict()
+__cache_lock = threading.Lock()
+
+
+def detect_language(text, prefix_length=DETECTION_PREFIX_LENGTH):
+    """Detects the language of the text
+
+    Only the first `prefix_length` characters of the text are used
+    for the detection. The detections are cached by the hash of the
+    used prefix so each text is detected at most once per process.
+
+    Args:
+        text (str): The text whose language is detected.
+        prefix_length (int): The number of characters used to detect
+            the language. (Default = DETECTION_PREFIX_LENGTH)
+
+    Returns:
+        str: The ISO 693-1 code of the text language.
+
+    """
+
+    prefix = text[:prefix_length]
+    key = hashlib.sha1(prefix.encode('utf-8')).hexdigest()
+
+    with __cache_lock:
+        if key in __cache:
+            # mark the detection as recently used
+            __cache.move_to_end(key)
+            return __cache[key]
+
+    # detect the language outside of the lock
+    language = detect(prefix)
+
+    with __cache_lock:
+        __cache[key] = language
+        if len(__cache) > DETECTION_CACHE_SIZE:
+            # remove the least recently used detection
+            __cache.popitem(last=False)
+
+    return language
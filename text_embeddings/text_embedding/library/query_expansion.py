@@ -1,4 +1,6 @@
 import string
+import threading
+from collections import OrderedDict
 from gensim.models import KeyedVectors, FastText
 import numpy as np
 import nltk
@@ -8,47 +10,123 @@ from nltk.corpus import wordnet
 from nltk.stem import WordNetLemmatizer
 lemmatizer = WordNetLemmatizer()
 
+# the translation table used to remove punctuations
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
 
-def get_wordnet_pos(word):
+# the mapping of the POS tags to the wordnet tags
+TAG_DICT = {"J": wordnet.ADJ,
+            "N": wordnet.NOUN,
+            "V": wordnet.VERB,
+            "R": wordnet.ADV}
+
+# the maximum number of cached (pos, lemma) pairs
+LEMMA_CACHE_SIZE = 100000
+
+# the bounded cache of recently lemmatized words and
+# the table of the precomputed vocabulary lemmas
+__lemma_cache = OrderedDict()
+__lemma_table = {}
+__lemma_lock = threading.Lock()
+
+
+def tag_and_lemmatize(words):
     # code from https://www.machinelearningplus.com/nlp/lemmatization-examples-python/
+    """Get the wordnet POS tags and lemmas of the words.
+    Each word is tagged on its own, but all words not yet
+    cached are tagged with a single call of the tagger.
+    Args:
+        words (list): List of words we wish to tag and lemmatize.
+    Returns:
+        pos_lemmas (list): List of (wordnet tag, lemma) pairs of the words."""
+    results = {}
+    with __lemma_lock:
+        for word in words:
+            if word in __lemma_table:
+                results[word] = __lemma_table[word]
+            elif word in __lemma_cache:
+                # mark the word as recently used
+                __lemma_cache.move_to_end(word)
+                results[word] = __lemma_cache[word]
+    missing = list(dict.fromkeys(word for word in words if word not in results))
+    if len(missing) > 0:
+        # tag each missing word on its own in a single call
+        tagged = nltk.pos_tag_sents([[word] for word in missing])
+        with __lemma_lock:
+            for word, sentence in zip(missing, tagged):
+                pos = TAG_DICT.get(sentence[0][1][0].upper(), wordnet.NOUN)
+                results[word] = (pos, lemmatizer.lemmatize(word, pos))
+                __lemma_cache[word] = results[word]
+                if len(__lemma_cache) > LEMMA_CACHE_SIZE:
+                    # remove the least recently used word
+                    __lemma_cache.popitem(last=False)
+    return [results[word] for word in words]
+
+
+def precompute_lemmas(words, batch_size=10000):
+    """Precomputes the POS tags and lemmas of the words, e.g. of the
+    embedding vocabulary, and keeps them for the lifetime of the process.
+    Args:
+        words (list): List of words we wish to tag and lemmatize.
+        batch_size (int): Number of words tagged at once.
+    """
+    for i in range(0, len(words), batch_size):
+        batch = words[i:i+batch_size]
+        tagged = nltk.pos_tag_sents([[word] for word in batch])
+        table = {}
+        for word, sentence in zip(batch, tagged):
+            pos = TAG_DICT.get(sentence[0][1][0].upper(), wordnet.NOUN)
+            table[word] = (pos, lemmatizer.lemmatize(word, pos))
+        with __lemma_lock:
+            __lemma_table.update(table)
+
+
+def get_wordnet_pos(word):
     """Map POS tag to first character lemmatize() accepts.
     Args:
         word(str): Word we wish to tag.
     Returns:
         wnl_tag(str): Tag acceptable by wordnet lemmatizer."""
-    tag = nltk.pos_tag([word])[0][1][0].upper()
-    tag_dict = {"J": wordnet.ADJ,
-                "N": wordnet.NOUN,
-                "V": wordnet.VERB,
-                "R": wordnet.ADV}
-    wnl_tag = tag_dict.get(tag, wordnet.NOUN)
-    return wnl_tag
+    return tag_and_lemmatize([word])[0][0]
 
 
 def tokenized_query(text, stopwords):
     """Tokenizes, lowers words and removes stopwords from the document.
         Args:
             text (str): Text we want to tokenize.
-            stopwords (list): List of words we want to remove from the tokenized text.
+            stopwords (frozenset): Set of words we want to remove from the tokenized text.
         Returns:
             filtered_tokens (list): List of low case tokens wich does not contain stop words.
         """
-    without_punctuations = text.translate(str.maketrans('', '', string.punctuation))
+    without_punctuations = text.translate(PUNCTUATION_TABLE)
     tokens = word_tokenize(without_punctuations)
-    filtered = [lemmatizer.lemmatize(w.lower(), get_wordnet_pos(w.lower())) for w in tokens if not w in stopwords]
+    lowered = [w.lower() for w in tokens if not w in stopwords]
+    filtered = [lemma for _, lemma in tag_and_lemmatize(lowered)]
     return filtered
 
 
-def extend_tokens(token_list, model, model_format):
+def vocabulary(model, model_format):
+    """Gets the vocabulary of the word embeddings.
+        Args:
+            model (Word2VecKeyedVectors): Word embeddings.
+            model_format (str): The word embedding model format.
+        Returns:
+            vocab (dict): Dictionary mapping words to their vocabulary entries.
+        """
+    return model.wv.vocab if model_format == 'fasttext' else model.vocab
+
+
+def extend_tokens(token_list, model, model_format, index=None):
     """Extends token list by summing consecutive vector pairs.
         Args:
             token_list (list): List of tokens we want to extend.
+            index (ANNIndex): Approximate nearest neighbour index. If None the
+                exact (brute-force) search is used. (Default = None)
         Returns:
             extension (list): List of extensions.
             wv (Word2VecKeyedVectors): Word embeddings.
         """
     tokens = []
-    if model_format == 'word2vec':
+    if model_format in ('word2vec', 'native'):
         for token in token_list:
             # check if the token is in the vocabulary
             if token in model.vocab.keys():
@@ -59,24 +137,44 @@ def extend_tokens(token_list, model, model_format):
             if token in model.wv.vocab:
                 tokens.append(token)
     extention = set()
+    vocab = vocabulary(model, model_format)
     for i in range(len(tokens)-1):
-        new_token = model.most_similar(positive=[tokens[i], tokens[i+1]])[0][0]
-        extention.add(new_token)
+        if index is not None:
+            positive = [vocab[tokens[i]].index, vocab[tokens[i+1]].index]
+            result = index.most_similar(positive, topn=1)
+        else:
+            result = model.most_similar(positive=[tokens[i], tokens[i+1]])
+        # the probed clusters might not contain any other word
+        if len(result) == 0:
+            continue
+        extention.add(result[0][0])
     extention = list(extention)
     return extention
 
 
-def candidate_expansion_terms(tokens, k, model, model_format):
+def candidate_expansion_terms(tokens, k, model, model_format, index=None):
     """Gets the candidates for expansion based on kNN.
         Args:
             tokens (list): List of tokens we want to expand.
             k (int): Number of nearest neighbours.
             wv (Word2VecKeyedVectors): Word embeddings.
+            index (ANNIndex): Approximate nearest neighbour index. If None the
+                exact (brute-force) search is used. (Default = None)
         Returns:
             candidates (list): List of candidates.
     """
     candidates = set()
-    if model_format == 'word2vec':
+    if index is not None and model_format in ('word2vec', 'native', 'fasttext'):
+        vocab = vocabulary(model, model_format)
+        for token in tokens:
+            # check if the token is in the vocabulary
+            if token in vocab:
+                # search only the clusters nearest to the token
+                for word, _ in index.most_similar([vocab[token].index], topn=k):
+                    candidates.add(word)
+        # the candidates are sorted so the ranking does not depend on the set order
+        return sorted(candidates)
+    if model_format in ('word2vec', 'native'):
         for token in tokens:
             # check if the token is in the vocabulary
             if token in model.vocab.keys():
@@ -96,42 +194,15 @@ def candidate_expansion_terms(tokens, k, model, model_format):
                     candidates.add(result[i][0])
     else:
         raise Exception('Model type incorrect')
-    # return list of candidates
-    candidates = list(candidates)
+    # return list of candidates; sorted so the ranking does not depend on the set order
+    candidates = sorted(candidates)
     return candidates
 
 
-def similarity(token, token_list, model, model_format ):
-    """Calculates the similarity between token and list of tokens.
-        Args:
-            token (str): String for wich we are calculating similarity.
-            token_list (list): List of tokens to wich we are calculating similarity of token.
-            wv (Word2VecKeyedVectors): Word embeddings.
-        Returns:
-            avreage_similarity (float): Number that signifes the similarity of token to token list words.
-        """
-    # calculate the similarity of the token to all tokens
-    similarity = 0
-    num_of_tokens = 0
-    if model_format == 'word2vec':
-        for tokens in token_list:
-            # check if the token is in the vocabulary
-            if tokens in model.vocab.keys():
-                num_of_tokens += 1
-                similarity += model.similarity(tokens, token)
-    elif model_format == 'fasttext':
-        for tokens in token_list:
-            # check if the token is in the vocabulary
-            if tokens in model.wv.vocab:
-                num_of_tokens += 1
-                similarity += model.similarity(tokens, token)
-    else:
-        raise Exception('Model type incorrect')
-    return similarity/num_of_tokens
-
-
 def get_similarity_pairs(tokens, candidates, wv, model_format):
     """Calculates similarity to tokens for list of candidates.
+        The similarities of all candidates to all tokens are calculated
+        with a single product of the normalized word vectors matrices.
         Args:
             tokens (list): List of tokens to wich similarity is calculated
             candidates (list): List of tokens for wich similarity is calculated.
@@ -139,15 +210,29 @@ def get_similarity_pairs(tokens, candidates, wv, model_format):
         Returns:
             similarity_pairs (list): List of tuples. Tuples are pairs of candidates and their similarity to tokens.
         """
-    similarity_pairs = []
-    for candidate in candidates:
-        sim = similarity(candidate, tokens, wv, model_format)
-        similarity_pairs.append((candidate, sim))
+    if model_format not in ('word2vec', 'native', 'fasttext'):
+        raise Exception('Model type incorrect')
+    if len(candidates) == 0:
+        return []
+    vocab = vocabulary(wv, model_format)
+    keyed_vectors = wv.wv if model_format == 'fasttext' else wv
+    # the normalized vectors are computed once per model
+    keyed_vectors.init_sims()
+    vectors_norm = keyed_vectors.vectors_norm
+    # get the normalized vectors of the candidates and the tokens in the vocabulary
+    candidate_matrix = vectors_norm[[vocab[candidate].index for candidate in candidates]]
+    token_matrix = vectors_norm[[vocab[token].index for token in tokens if token in vocab]]
+    if token_matrix.shape[0] == 0:
+        # no token is in the vocabulary, so no candidate can be scored
+        return []
+    # average the similarities of each candidate to the tokens
+    similarities = candidate_matrix.dot(token_matrix.T).mean(axis=1)
+    similarity_pairs = list(zip(candidates, similarities.tolist()))
     # return the list of expansion terms with their similarities
     return similarity_pairs
 
 
-def pre_retrieval_KNN(query, k, wv, n, stop_words, model_format, extension=False):
+def pre_retrieval_KNN(query, k, wv, n, stop_words, model_format, extension=False, index=None):
     """Find n most similar tokens(candidates) to the given query, optional:
         query can be extended, then the candidates are found for extended query.
         Args:
@@ -155,26 +240,26 @@ def pre_retrieval_KNN(query, k, wv, n, stop_words, model_format, extension=False
             k (int): Number of nearest neighbours.
             wv (Word2VecKeyedVectors): Word embeddings.
             n (int): Number of candidates (with the highest simiarity) that is returned.
-            stopwords (list): List of words we want to remove from the tokenized text.
+            stopwords (frozenset): Set of words we want to remove from the tokenized text.
+            index (ANNIndex): Approximate nearest neighbour index. If None the
+                exact (brute-force) search is used. (Default = None)
         Returns:
             candidate_list (list): List of n candidates with the highest similarity to query tokens.
         """
     tokens = tokenized_query(query, stop_words)
     if extension:
-        extended = extend_tokens(tokens, wv, model_format)
-        candidates = candidate_expansion_terms(tokens+extended, k, wv, model_format)
+        extended = extend_tokens(tokens, wv, model_format, index=index)
+        candidates = candidate_expansion_terms(tokens+extended, k, wv, model_format, index=index)
         candidates_sim = get_similarity_pairs(tokens+extended, candidates, wv, model_format)
     else:
-        candidates = candidate_expansion_terms(tokens, k, wv, model_format)
+        candidates = candidate_expansion_terms(tokens, k, wv, model_format, index=index)
         candidates_sim = get_similarity_pairs(tokens, candidates, wv, model_format)
-    def takeSecond(elem):
-        return elem[1]
-    sort = sorted(candidates_sim, key=takeSecond)[::-1]
-    candidate_list = []
-    for tupl in sort:
-        candidate_list.append(tupl[0])
+    # rank the candidates by similarity; the ties keep the candidate order
+    scores = np.array([sim for _, sim in candidates_sim], dtype=np.float64)
+    order = np.argsort(-scores, kind='stable')
+    candidate_list = [candidates_sim[i][0] for i in order.tolist()]
     cleaned = [word for word in candidate_list if word.isalpha()]
-    lemmatized = [lemmatizer.lemmatize(word, get_wordnet_pos(word)) for word in cleaned]
+    lemmatized = [lemma for _, lemma in tag_and_lemmatize(cleaned)]
     candidate_list = [w for w in lemmatized if w not in tokens]
     candidate_list = candidate_list[:n]
     return candidate_list
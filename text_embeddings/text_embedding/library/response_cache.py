@@ -0,0 +1,175 @@
+# Response Cache
+# A bounded LRU cache with time-to-live for the route responses.
+# The cache can be backed by an on-disk SQLite store which is
+# shared by all workers running the service.
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of JSON serializable responses
+
+    Args:
+        max_size (int): The maximum number of responses held in memory.
+            If 0 the cache is disabled. (Default = 1000)
+        ttl (int): The number of seconds a response is valid. (Default = 3600)
+        path (str): The path to the shared on-disk store. If None only
+            the in-memory cache is used. (Default = None)
+        purge_interval (int): The number of seconds between the removals of
+            the expired responses from the on-disk store. (Default = 60)
+
+    """
+
+    def __init__(self, max_size=1000, ttl=3600, path=None, purge_interval=60):
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__purge_interval = purge_interval
+        self.__purged = time.time()
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+        # the cache statistics
+        self.__hits = 0
+        self.__misses = 0
+        # the shared on-disk store
+        self.__store = None
+        if path and max_size > 0:
+            self.__open_store(path)
+
+
+    def __open_store(self, path):
+        """Opens the on-disk store
+
+        Args:
+            path (str): The path to the store file.
+
+        """
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.__store = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        # allow concurrent readers while one worker writes
+        self.__store.execute("PRAGMA journal_mode=WAL;")
+        self.__store.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+        self.__store.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires);")
+
+
+    @staticmethod
+    def create_key(*parts):
+        """Creates the cache key from the normalized request parts
+
+        Args:
+            parts (list): The JSON serializable parts identifying the response.
+
+        Returns:
+            str: The cache key.
+
+        """
+
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+    def get(self, key):
+        """Retrieves the cached response
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            obj: The cached response or None if it is not cached or expired.
+
+        """
+
+        if self.__max_size <= 0:
+            return None
+
+        now = time.time()
+        with self.__lock:
+            if key in self.__cache:
+                expires, value = self.__cache[key]
+                if expires > now:
+                    # mark the response as recently used
+                    self.__cache.move_to_end(key)
+                    self.__hits += 1
+                    return value
+                del self.__cache[key]
+
+            if self.__store is not None:
+                row = self.__store.execute("SELECT value, expires FROM responses WHERE key = ?;", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self.__remember(key, value, row[1])
+                    self.__hits += 1
+                    return value
+
+            self.__misses += 1
+            return None
+
+
+    def set(self, key, value):
+        """Stores the response in the cache
+
+        Args:
+            key (str): The cache key.
+            value (obj): The JSON serializable response.
+
+        """
+
+        if self.__max_size <= 0:
+            return
+
+        expires = time.time() + self.__ttl
+        with self.__lock:
+            self.__remember(key, value, expires)
+            if self.__store is not None:
+                self.__store.execute("INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?);",
+                    (key, json.dumps(value), expires))
+                # remove the expired responses from time to time
+                now = time.time()
+                if now - self.__purged >= self.__purge_interval:
+                    self.__store.execute("DELETE FROM responses WHERE expires <= ?;", (now,))
+                    self.__purged = now
+
+
+    def __remember(self, key, value, expires):
+        """Stores the response in memory and evicts the least recently used response"""
+        self.__cache[key] = (expires, value)
+        self.__cache.move_to_end(key)
+        if len(self.__cache) > self.__max_size:
+            self.__cache.popitem(last=False)
+
+
+    def stats(self):
+        """Retrieves the cache statistics of the process
+
+        Returns:
+            dict: The number of hits, misses and cached responses.
+
+        """
+
+        with self.__lock:
+            stats = {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "size": len(self.__cache),
+                "max_size": self.__max_size,
+                "ttl": self.__ttl,
+                "pid": os.getpid()
+            }
+            if self.__store is not None:
+                stats["store_size"] = self.__store.execute("SELECT COUNT(*) FROM responses;").fetchone()[0]
+        return stats
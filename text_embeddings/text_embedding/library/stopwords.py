@@ -0,0 +1,33 @@
+# Stopwords
+# Loads the language stopwords once per process
+# and shares them between all components
+
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def load_stopwords(language):
+    """Retrieve the stopwords corresponding to the language
+
+    The stopwords file of each language is read only once per process.
+
+    Args:
+        language (str): The ISO 693-1 code of the language.
+
+    Returns:
+        frozenset(str): The set of stopwords.
+
+    """
+
+    # create stopword file path
+    fname = "./data/stopwords/{}.stopwords.txt".format(language)
+
+    # check if the file exists
+    if not os.path.isfile(fname):
+        return frozenset()
+
+    # retrieve stopwords based on the language
+    with open(fname, 'r', encoding='utf-8') as f:
+        # strip the stopwords of any access whitespaces
+        return frozenset(x.strip() for x in f)
@@ -8,18 +8,98 @@
 
 import os
 import pickle
-import operator
+from collections import Counter
 from gensim.models import KeyedVectors, FastText
 from gensim.parsing.preprocessing import preprocess_string, strip_punctuation
 from sklearn.decomposition import PCA
 import numpy as np
-from langdetect import detect
+from scipy import sparse
 
 from ..library import query_expansion
+from ..library.stopwords import load_stopwords
+from ..library.language_detection import detect_language
+from ..library.ann_index import ANNIndex
+
+# the tokenization pipeline: make everything lowercase and strip punctuation
+TOKEN_FILTERS = [str.lower, strip_punctuation]
+
+
+def load_keyed_vectors(model_path, model_format):
+    """Loads the word vectors of the word embedding model
+
+    Args:
+        model_path (str): The word embedding model path.
+        model_format (str): The word embedding model format.
+            Possible options are 'word2vec', 'fasttext' and 'native'.
+
+    Returns:
+        Word2VecKeyedVectors: The word vectors.
+
+    """
+
+    if model_format == 'word2vec':
+        # load the model with the word2vec format
+        return KeyedVectors.load_word2vec_format(model_path)
+    elif model_format == 'fasttext':
+        # load the model with the fasttext format
+        return FastText.load_fasttext_format(model_path).wv
+    elif model_format == 'native':
+        # memory-map the converted model
+        return KeyedVectors.load(model_path, mmap='r')
+    else:
+        raise Exception("load_keyed_vectors: Model '{}' not supported (must be 'word2vec', 'fasttext' or 'native').".format(model_format) +
+                        " Cannot load word embedding model.")
+
+
+def convert_model(model_path, model_format, output_path):
+    """Converts the word embedding model into the native format
+
+    The native format consists of the vocabulary index stored in the
+    `output_path` file and the raw word vectors (together with their
+    normalized counterparts used for similarity queries) stored as
+    `.npy` matrices next to it. The model in the native format can be
+    memory-mapped and shared between processes.
+
+    Args:
+        model_path (str): The word embedding model path.
+        model_format (str): The word embedding model format.
+            Possible options are 'word2vec' and 'fasttext'.
+        output_path (str): The path of the converted model file.
+
+    """
+
+    wv = load_keyed_vectors(model_path, model_format)
+
+    # precompute the normalized vectors and store them with the model
+    # so that the workers do not create their own private copies
+    wv.init_sims()
+    wv.save(output_path, ignore=[])
+
+
+def build_index(model_path, model_format, output_path, n_lists=1024, n_probe=16):
+    """Builds the approximate nearest neighbour index of the word embedding model
+
+    Args:
+        model_path (str): The word embedding model path.
+        model_format (str): The word embedding model format.
+            Possible options are 'word2vec', 'fasttext' and 'native'.
+        output_path (str): The path of the index file.
+        n_lists (int): The number of index clusters. (Default = 1024)
+        n_probe (int): The number of clusters scored per query. (Default = 16)
+
+    """
+
+    wv = load_keyed_vectors(model_path, model_format)
+
+    # the index is built over the normalized vectors
+    wv.init_sims()
+    index = ANNIndex.build(wv.vectors_norm, n_lists=n_lists, n_probe=n_probe)
+    index.save(output_path)
+
 
 class TextEmbedding:
 
-    def __init__(self, language, model_path, model_format='word2vec'):
+    def __init__(self, language, model_path, model_format='word2vec', index_path=None, precompute_lemmas=0):
         """Initializes the text embedding module
 
         Args:
@@ -27,12 +107,21 @@ class TextEmbedding:
                 It must be in the ISO 693-1 code format.
             model_path (str): The path to the embedding model file.
             model_format (str): The format in which the model file is stored.
-                Possible options are 'word2vec' and 'fasttext'. (Default = 'word2vec')
+                Possible options are 'word2vec', 'fasttext' and 'native'. (Default = 'word2vec')
+            index_path (str): The path to the approximate nearest neighbour index file
+                used for query expansion. If None the exact search is used. (Default = None)
+            precompute_lemmas (int): The number of the most frequent vocabulary words
+                whose POS tags and lemmas used for query expansion are precomputed. (Default = 0)
 
         """
         self.__language = language
         self.__embedding = None
         self.__model = None
+        # the word vectors matrix and vocabulary of the embedding
+        self.__vectors = None
+        self.__vocab = None
+        # the approximate nearest neighbour index
+        self.__index = None
         # projection matrix used for
         self.__projection_matrix = None
 
@@ -44,6 +133,17 @@ class TextEmbedding:
         else:
             raise Exception("TextEmbedding.__init__: model_path does not exist {}".format(model_path))
 
+        if not index_path == None:
+            if os.path.isfile(index_path):
+                self.__load_index(index_path)
+            else:
+                raise Exception("TextEmbedding.__init__: index_path does not exist {}".format(index_path))
+
+        if precompute_lemmas:
+            # precompute the lemmas of the most frequent words
+            wv = getattr(self.__embedding, 'wv', self.__embedding)
+            query_expansion.precompute_lemmas(wv.index2word[:precompute_lemmas])
+
 
     def __load_model(self, model_path, model_format):
         """Loads the word embedding model
@@ -64,16 +164,42 @@ class TextEmbedding:
             self.__model = FastText
             self.__embedding = self.__model.load_fasttext_format(model_path)
             self.__stopwords = self.stopwords()
+        elif model_format == 'native':
+            # memory-map the model created with `convert_model` so that
+            # all workers share the same page-cached vectors
+            self.__model = KeyedVectors
+            self.__embedding = self.__model.load(model_path, mmap='r')
+            self.__stopwords = self.stopwords()
         else:
-            raise Exception("TextEmbedding.__load_model: Model '{}' not supported (must be 'word2vec' or 'fasttext').".format(model_format) +
+            raise Exception("TextEmbedding.__load_model: Model '{}' not supported (must be 'word2vec', 'fasttext' or 'native').".format(model_format) +
                             " Cannot load word embedding model.")
 
+        # store the word vectors matrix and the vocabulary (word -> row index)
+        wv = getattr(self.__embedding, 'wv', self.__embedding)
+        self.__vectors = wv.vectors
+        self.__vocab = wv.vocab
+
 
         # calculate the default projection matrix
         v = np.zeros(self.__embedding.vector_size, dtype=np.float32)
         self.__projection_matrix = np.outer(v, v)
 
 
+    def __load_index(self, index_path):
+        """Loads the approximate nearest neighbour index
+
+        Args:
+            index_path (str): The index file path.
+
+        """
+
+        wv = getattr(self.__embedding, 'wv', self.__embedding)
+        # the index is searched with the normalized vectors
+        wv.init_sims()
+        self.__index = ANNIndex.load(index_path)
+        self.__index.attach(wv.vectors_norm, wv.index2word)
+
+
     def get_language(self):
         """Returns the language of the text embedding model
 
@@ -89,26 +215,12 @@ class TextEmbedding:
         """Retrieve the stopwords corresponding to the model language
 
         Returns:
-            list(str): A list of stopwords.
+            frozenset(str): The set of stopwords.
 
         """
 
-        # create stopword file path
-        fname = "./data/stopwords/{}.stopwords.txt".format(self.__language)
-
-        # check if the file exists
-        if not os.path.isfile(fname):
-            return []
-
-        # retrieve stopwords based on the language
-        with open(fname, 'r', encoding='utf-8') as f:
-            stopwords = f.readlines()
-
-        # strip the stopwords of any access whitespaces
-        stopwords = [x.strip() for x in stopwords]
-
-        # return the stopwords for the corresponding language
-        return stopwords
+        # the stopwords are loaded once per process
+        return load_stopwords(self.__language)
 
 
     def tokenize(self, text):
@@ -123,29 +235,41 @@ class TextEmbedding:
         """
 
         # make everything lowercase and strip punctuation
-        CUSTOM_FILTERS = [lambda x: x.lower(), strip_punctuation]
-        tokens = preprocess_string(text, CUSTOM_FILTERS)
-
-        # filter out all stopwords
-        filtered_tokens = [w for w in tokens if not w in self.__stopwords]
+        tokens = preprocess_string(text, TOKEN_FILTERS)
 
-        # count the term frequency in the text
-        count = { }
-        for word in filtered_tokens:
-            if word not in count:
-                count[word] = 0
-            count[word] += 1
+        # filter out all stopwords and count the term frequency in the text
+        count = Counter(w for w in tokens if not w in self.__stopwords)
 
         # sort the terms in descending order
-        terms_sorted = sorted(count.items(), key=operator.itemgetter(1), reverse=True)
-        return terms_sorted
+        return count.most_common()
+
+
+    def __term_indices(self, terms):
+        """Maps the text terms to the rows of the word vectors matrix
+
+        Args:
+            terms (list(tuple(str, int))): The (token, count) pairs of the text.
+
+        Returns:
+            tuple(numpy.ndarray, numpy.ndarray): The row indices of the terms found
+                in the vocabulary and their counts.
+
+        """
 
+        known = [(self.__vocab[token].index, count) for token, count in terms if token in self.__vocab]
+        indices = np.array([index for index, _ in known], dtype=np.int64)
+        counts = np.array([count for _, count in known], dtype=np.float32)
+        return indices, counts
 
-    def text_embedding(self, text, language=None):
+
+    def text_embedding(self, text, language=None, tokens=None):
         """Create the text embedding
 
         Args:
             text (str): The text to be embedded
+            language (str): The language of the text. If None it is detected. (Default = None)
+            tokens (list(tuple(str, int))): The already tokenized text, as returned
+                by `tokenize`. If None the text is tokenized. (Default = None)
 
         Returns:
             list(float): The array of values representing the text embedding
@@ -153,7 +277,7 @@ class TextEmbedding:
         """
 
         # check if the provided text is the one the embedding can perform
-        text_language = language if language != None else detect(text)
+        text_language = language if language != None else detect_language(text)
         if not text_language == self.__language:
             # raise an exeption of not matching languages
             raise Exception("The provided text is not valid: {}. Supported language: {}".format(text_language, self.__language))
@@ -165,20 +289,20 @@ class TextEmbedding:
             # return the default embedding in a vanilla python object
             return embedding.tolist()
 
-        # get the text terms with frequencies
-        term_sorted = self.tokenize(text)
-        # iterate through the terms and count the number of terms
-        count = 0
-        for token, number_of_appearances in term_sorted:
-            # sum all token embeddings of the vector
-            if token in self.__embedding.vocab.keys():
-                embedding += self.__embedding[token] * number_of_appearances
-                count += number_of_appearances
+        # get the vocabulary row indices of the text terms with frequencies
+        if tokens is None:
+            tokens = self.tokenize(text)
+        indices, counts = self.__term_indices(tokens)
+        # count the number of known terms
+        count = counts.sum()
 
         if count == 0:
             # return the empty embedding list
             return embedding.tolist()
 
+        # gather the token embeddings and sum them weighted by their frequencies
+        embedding = counts.dot(self.__vectors[indices])
+
         # average the embedding
         __text_embedding = embedding / count
 
@@ -188,6 +312,68 @@ class TextEmbedding:
         # return the embedding in vanilla python object
         return __text_embedding.tolist()
 
+
+    def text_embeddings(self, texts, languages=None):
+        """Create the text embeddings of multiple texts at once
+
+        Builds a sparse document-term count matrix against the model
+        vocabulary and multiplies it with the word vectors matrix.
+
+        Args:
+            texts (list(str)): The texts to be embedded.
+            languages (list(str)): The languages of the texts. If the language
+                of a text is None it is detected. (Default = None)
+
+        Returns:
+            list(list(float)): The text embeddings in the order of the provided texts.
+
+        """
+
+        if languages is None:
+            languages = [None] * len(texts)
+        elif not len(languages) == len(texts):
+            raise ValueError("The number of languages ({}) does not match the number of texts ({})".format(len(languages), len(texts)))
+
+        # prepare the document-term count matrix values
+        rows, columns, counts = [], [], []
+        for i, (text, language) in enumerate(zip(texts, languages)):
+            if text is None:
+                # the text gets the default embedding
+                continue
+
+            # check if the provided text is the one the embedding can perform
+            try:
+                text_language = language if language != None else detect_language(text)
+            except Exception as e:
+                raise ValueError("The language of the provided text at position {} could not be detected. {}".format(i, str(e)))
+            if not text_language == self.__language:
+                # raise an exeption of not matching languages
+                raise ValueError("The provided text at position {} is not valid: {}. Supported language: {}".format(i, text_language, self.__language))
+
+            # get the vocabulary row indices of the text terms
+            indices, frequencies = self.__term_indices(self.tokenize(text))
+            rows.extend([i] * len(indices))
+            columns.extend(indices)
+            counts.extend(frequencies)
+
+        # create the document-term count matrix
+        term_counts = sparse.csr_matrix((counts, (rows, columns)),
+            shape=(len(texts), self.__vectors.shape[0]), dtype=np.float32)
+
+        # sum the token embeddings of all texts in one operation
+        embeddings = np.asarray(term_counts.dot(self.__vectors), dtype=np.float32)
+        count = np.asarray(term_counts.sum(axis=1)).ravel()
+
+        # average the embeddings of texts with at least one known token
+        known = count > 0
+        embeddings[known] = embeddings[known] / count[known, np.newaxis]
+
+        # (2) remove the projection on the first singular vector
+        embeddings[known] = embeddings[known] - embeddings[known].dot(self.__projection_matrix.T)
+
+        # return the embeddings in vanilla python object
+        return embeddings.tolist()
+
     def expand_query(self, query, model_format):
         """
         Uses the embedding model to expand users query.
@@ -205,7 +391,8 @@ class TextEmbedding:
             wv=self.__embedding,
             n=5,
             stop_words=self.__stopwords,
-            model_format=model_format)
+            model_format=model_format,
+            index=self.__index)
 
 
     def __train_projection_matrix(self, matrix):
@@ -1,6 +1,7 @@
 import argparse
 from waitress import serve
 from text_embedding import create_app
+from text_embedding.library.text_embedding import convert_model, build_index
 
 if __name__=='__main__':
     # parse command line arguments
@@ -15,10 +16,30 @@ if __name__=='__main__':
     argparser_production.add_argument('-e', '--env', type=str, default='production', help="The microservice environment")
     # the model parameters
     argparser_production.add_argument('-mp', '--model_path', type=str, help="The path to the word embedding model file")
-    argparser_production.add_argument('-mf', '--model_format', type=str, default='word2vec', help="The format in which the language embedding model is saved. Possible options: 'word2vec' and 'fasttext' (default: 'word2vec')")
+    argparser_production.add_argument('-mf', '--model_format', type=str, default='word2vec', help="The format in which the language embedding model is saved. Possible options: 'word2vec', 'fasttext' and 'native' (default: 'word2vec')")
     argparser_production.add_argument('-ml', '--model_language', type=str, help="The ISO 693-1 code of the language embedding model")
+    argparser_production.add_argument('-ip', '--index_path', type=str, default=None, help="The path to the approximate nearest neighbour index used for query expansion (default: None)")
+    argparser_production.add_argument('-pl', '--precompute_lemmas', type=int, default=0, help="The number of the most frequent words whose lemmas are precomputed at startup (default: 0)")
     argparser_production.set_defaults(command='start')
 
+    argparser_convert = subparsers.add_parser('convert', help="Converts the word embedding model into the native memory-mappable format")
+
+    # the model parameters
+    argparser_convert.add_argument('-mp', '--model_path', type=str, help="The path to the word embedding model file")
+    argparser_convert.add_argument('-mf', '--model_format', type=str, default='word2vec', help="The format in which the language embedding model is saved. Possible options: 'word2vec' and 'fasttext' (default: 'word2vec')")
+    argparser_convert.add_argument('-o', '--output_path', type=str, help="The path to the converted word embedding model file")
+    argparser_convert.set_defaults(command='convert')
+
+    argparser_index = subparsers.add_parser('build_index', help="Builds the approximate nearest neighbour index used for query expansion")
+
+    # the model and index parameters
+    argparser_index.add_argument('-mp', '--model_path', type=str, help="The path to the word embedding model file")
+    argparser_index.add_argument('-mf', '--model_format', type=str, default='word2vec', help="The format in which the language embedding model is saved. Possible options: 'word2vec', 'fasttext' and 'native' (default: 'word2vec')")
+    argparser_index.add_argument('-o', '--output_path', type=str, help="The path to the index file")
+    argparser_index.add_argument('--lists', type=int, default=1024, help="The number of index clusters (default: 1024)")
+    argparser_index.add_argument('--probe', type=int, default=16, help="The number of clusters scored per query (default: 16)")
+    argparser_index.set_defaults(command='build_index')
+
     # parse the arguments and call whatever function was selected
     args = argparser.parse_args()
 
@@ -30,7 +51,9 @@ if __name__=='__main__':
             "env": args.env,
             "model_path": args.model_path,
             "model_format": args.model_format,
-            "model_language": args.model_language
+            "model_language": args.model_language,
+            "index_path": args.index_path,
+            "precompute_lemmas": args.precompute_lemmas
         }
         # create the application
         app = create_app(args=arguments)
@@ -40,5 +63,13 @@ if __name__=='__main__':
         elif args.env == 'development':
             app.run(host=arguments["host"], port=arguments["port"], debug=True)
 
+    elif args.command == 'convert':
+        # convert the model into the native format
+        convert_model(args.model_path, args.model_format, args.output_path)
+
+    elif args.command == 'build_index':
+        # build the approximate nearest neighbour index
+        build_index(args.model_path, args.model_format, args.output_path, n_lists=args.lists, n_probe=args.probe)
+
     else:
         raise Exception('Argument command is unknown: {}'.format(args.command))
\ No newline at end of file
@@ -14,14 +14,45 @@ from werkzeug.exceptions import abort
 #################################################
 
 from ..library.text_embedding import TextEmbedding
+from ..library.response_cache import ResponseCache
 
 # get model parameters
 model_path = app.config['MODEL_PATH']
 model_format = app.config['MODEL_FORMAT']
 language = app.config['MODEL_LANGUAGE']
+index_path = app.config.get('INDEX_PATH')
+precompute_lemmas = app.config.get('PRECOMPUTE_LEMMAS', 0)
 
 # initialize text embedding model
-model = TextEmbedding(language=language, model_path=model_path, model_format=model_format)
+model = TextEmbedding(language=language, model_path=model_path, model_format=model_format,
+    index_path=index_path, precompute_lemmas=precompute_lemmas)
+
+# the model identity used in the response cache keys
+model_identity = [model_path, model_format, language, index_path]
+
+# initialize the response cache
+cache = ResponseCache(
+    max_size=app.config['RESPONSE_CACHE']['size'],
+    ttl=app.config['RESPONSE_CACHE']['ttl'],
+    path=app.config['RESPONSE_CACHE']['path']
+)
+
+
+def normalize_text(text):
+    """Normalizes the text used in the cache keys
+
+    The routes ignore the whitespaces between the words so
+    the normalized texts produce the same responses.
+
+    Args:
+        text (str): The text to be normalized.
+
+    Returns:
+        str: The normalized text.
+
+    """
+
+    return " ".join(text.split()) if text is not None else None
 
 
 #################################################
@@ -53,21 +84,62 @@ def create():
         # TODO: log exception
         return abort(405)
 
+    # check if the response is already cached
+    key = ResponseCache.create_key('create', normalize_text(text), language, model_identity)
+    response = cache.get(key)
+    if response is not None:
+        return jsonify(dict(response, text=text))
+
     try:
-        # extract the text embedding
-        text_embedding = model.text_embedding(text, language)
+        # tokenize the text once and extract the text embedding
+        tokens = model.tokenize(text) if text is not None else []
+        text_embedding = model.text_embedding(text, language, tokens=tokens)
     except Exception as e:
         # get exception
         # TODO: log exception
         # something went wrong with the request
         return abort(400, str(e))
     else:
+        response = {
+            "language_model": model.get_language(),
+            "tokens": [{ "token": t[0], "count": t[1] } for t in tokens],
+            "embedding": text_embedding
+        }
+        cache.set(key, response)
         # return the embedding with the text
+        return jsonify(dict(response, text=text))
+
+@bp.route('/batch', methods=['POST'])
+def batch():
+    # retrieve the texts posted to the route
+    try:
+        # the texts are either strings or objects with the text and its language
+        texts = request.json['texts']
+        if not isinstance(texts, list):
+            raise Exception("The parameter 'texts' must be a list.")
+        default_language = request.json.get('language', None)
+        languages = [t.get('language', default_language) if isinstance(t, dict) else default_language for t in texts]
+        texts = [t.get('text', None) if isinstance(t, dict) else t for t in texts]
+        if not all(text is None or isinstance(text, str) for text in texts):
+            raise Exception("The texts must be strings.")
+    except Exception as e:
+        return abort(400, "Could not retrieve parameter 'texts'. " + str(e))
+
+    try:
+        # extract the text embeddings
+        text_embeddings = model.text_embeddings(texts, languages)
+    except ValueError as e:
+        # the texts are not supported by the model
+        return abort(400, str(e))
+    except Exception as e:
+        # the model failed to embed valid texts
+        app.logger.exception("Could not create the text embeddings.")
+        return abort(500, "Could not create the text embeddings. " + str(e))
+    else:
+        # return the embeddings in the order of the texts
         return jsonify({
             "language_model": model.get_language(),
-            "tokens": [{ "token": t[0], "count": t[1] } for t in model.tokenize(text)],
-            "embedding": text_embedding,
-            "text": text
+            "embeddings": text_embeddings
         })
 
 @bp.route('/expand', methods=['POST', 'GET'])
@@ -82,14 +154,21 @@ def expand_query():
     if query == '':
         raise Exception("Query empty or not given")
 
+    # check if the response is already cached
+    key = ResponseCache.create_key('expand', normalize_text(query), model_identity)
+    response = cache.get(key)
+    if response is not None:
+        return jsonify(dict(response, initial_query=query))
+
     try:
         tokenized_query = [w[0] for w in model.tokenize(query)]
         expanded_query = model.expand_query(query, model_format)
-        return jsonify({
-            "initial_query" : query,
+        response = {
             "tokenized_query" : tokenized_query,
             "expanded_query" : expanded_query
-        })
+        }
+        cache.set(key, response)
+        return jsonify(dict(response, initial_query=query))
 
     except Exception as e:
         # get exception
@@ -99,3 +178,8 @@ def expand_query():
 
     else:
         return jsonify(["Method {} is not allowed!".format(request.method)])
+
+@bp.route('/cache', methods=['GET'])
+def cache_stats():
+    # return the response cache statistics of the worker
+    return jsonify(cache.stats())
@@ -43,6 +43,18 @@ def register(app):
             }
         })
 
+    @app.errorhandler(500)
+    def internal_server_error(e):
+        # TODO: possible webpage for error
+        return jsonify({
+            "error": {
+                "message": "500: Internal server error",
+                "route": request.path,
+                "method": request.method,
+                "error": e.description,
+            }
+        })
+
     @app.errorhandler(501)
     def method_not_implemented(e):
         # TODO: possible webpage for error